@@ -1,41 +1,396 @@
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from flask import Flask, render_template, jsonify, request, send_from_directory, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from datetime import datetime, timedelta
 from flask_socketio import SocketIO, emit
 from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
 import os
+import sys
+import re
 import json
 import time
 import threading
+import socket
+import heapq
+import itertools
+import bisect
+import math
+from collections import deque
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.util import datetime_to_utc_timestamp, localize
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED, EVENT_JOB_ERROR
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
 import ffmpeg
 import subprocess
 import shutil
+import errno
+import sqlite3
+import click
 from datetime import datetime
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, safe_join
+from werkzeug.exceptions import ClientDisconnected
 import uuid
+import base64
+import hashlib
+import mimetypes
+from urllib.parse import quote, urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Los trabajos del almacén compartido apuntan a 'app:enqueue_broadcast'; con `python app.py` el módulo
+# se llama __main__ y sin este alias APScheduler importaría una segunda copia de la aplicación
+if __name__ == '__main__':
+    sys.modules.setdefault('app', sys.modules[__name__])
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///streams.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///streams.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
-# Inicializar SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# Inicializar SocketIO. En producción se usa un servidor de eventos (gevent/eventlet, ver wsgi.py) y
+# una cola de mensajes (p. ej. redis://) para que varios procesos web compartan los eventos emitidos.
+app.config['SOCKETIO_ASYNC_MODE'] = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+    message_queue=app.config['SOCKETIO_MESSAGE_QUEUE']
+)
 
 # Scheduler for managing video broadcasts
-scheduler = BackgroundScheduler()
-scheduler.start()
+# Los trabajos se guardan en la misma base SQLite para sobrevivir a reinicios;
+# el scheduler se inicia en startup(), cuando las funciones de los trabajos ya existen.
+with app.app_context():
+    job_store = SQLAlchemyJobStore(engine=db.engine, tablename='apscheduler_jobs')
+    scheduler = BackgroundScheduler(
+        jobstores={'default': job_store},
+        job_defaults={'coalesce': True, 'max_instances': 1}
+    )
+
+# Rol del proceso: 'all' (web y runner en un solo proceso, desarrollo), 'web' (solo API y panel) o
+# 'runner' (demonio runner.py dueño del scheduler y de ffmpeg). Entre varios runners, el que tiene el
+# lease de la tabla runner_lease es el líder; si deja de renovarlo, otro lo toma tras RUNNER_LEASE_TTL.
+app.config['RTMP_ROLE'] = os.environ.get('RTMP_ROLE', 'all')
+app.config['RUNNER_LEASE_TTL'] = float(os.environ.get('RUNNER_LEASE_TTL', 10))
+app.config['RUNNER_LEASE_RENEW'] = float(os.environ.get('RUNNER_LEASE_RENEW', 2))
+# Pool de runners: con RUNNER_POOL=true el líder solo marca los streams vencidos como 'queued' y
+# cada runner los reclama con un lease por fila (owner + lease_expires_at) según su capacidad libre.
+app.config['RUNNER_POOL'] = os.environ.get('RUNNER_POOL', 'false').lower() in ('1', 'true', 'yes')
+app.config['STREAM_LEASE_TTL'] = float(os.environ.get('STREAM_LEASE_TTL', 30))
+app.config['RUNNER_HEARTBEAT_INTERVAL'] = float(os.environ.get('RUNNER_HEARTBEAT_INTERVAL', 5))
+app.config['RUNNER_CLAIM_INTERVAL'] = float(os.environ.get('RUNNER_CLAIM_INTERVAL', 1))
+# Carga máxima (promedio de 1 minuto por núcleo) con la que un runner sigue reclamando streams
+app.config['RUNNER_MAX_LOAD'] = float(os.environ.get('RUNNER_MAX_LOAD', 0.9))
+# Canal local de comandos web -> runner (socket Unix de datagramas)
+app.config['RUNNER_COMMAND_SOCKET'] = os.environ.get(
+    'RUNNER_COMMAND_SOCKET', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'runner.sock')
+)
+# Intervalo de sondeo de watchdog cuando corre sobre gevent/eventlet (inotify bloquearía el bucle)
+app.config['WATCHDOG_POLL_INTERVAL'] = float(os.environ.get('WATCHDOG_POLL_INTERVAL', 1))
+# Cada cuántos segundos el runner relee el almacén de trabajos (respaldo si se pierde un comando)
+app.config['SCHEDULER_POLL_INTERVAL'] = float(os.environ.get('SCHEDULER_POLL_INTERVAL', 5))
+
+# Backups de la base: se hacen en un hilo con la API de backup en línea de SQLite, copiando
+# BACKUP_PAGES_PER_STEP páginas por paso y durmiendo BACKUP_STEP_SLEEP segundos entre pasos para no
+# competir con el scheduler. Los pedidos que llegan durante un backup se juntan en uno solo al terminar.
+app.config['BACKUP_FOLDER'] = os.environ.get(
+    'BACKUP_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backups')
+)
+app.config['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', 5))
+app.config['BACKUP_PAGES_PER_STEP'] = int(os.environ.get('BACKUP_PAGES_PER_STEP', 256))
+app.config['BACKUP_STEP_SLEEP'] = float(os.environ.get('BACKUP_STEP_SLEEP', 0.05))
 
 # Configuración para subida de archivos
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mkv', 'mov', 'wmv'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Límites de procesos ffmpeg simultáneos: copia de video (-c:v copy) vs. transcodificación
+app.config['MAX_COPY_BROADCASTS'] = int(os.environ.get('MAX_COPY_BROADCASTS', 16))
+app.config['MAX_TRANSCODE_BROADCASTS'] = int(os.environ.get('MAX_TRANSCODE_BROADCASTS', max(1, (os.cpu_count() or 2) // 2)))
+# Esperas en cola de transmisiones ya terminadas que se conservan para /broadcast_queue
+app.config['BROADCAST_QUEUE_HISTORY'] = int(os.environ.get('BROADCAST_QUEUE_HISTORY', 200))
+
+# Perfiles de codificación: núcleos para transcodificar (p. ej. "2-7,10"; vacío = los disponibles para el
+# proceso), fijar cada ffmpeg a los núcleos que se le asignan (CPU_PINNING), costo en núcleos de unos
+# parámetros sin calibrar, y duración y fuente sintética (lavfi) de la calibración.
+app.config['ENCODING_CORES'] = os.environ.get('ENCODING_CORES', '')
+app.config['CPU_PINNING'] = os.environ.get('CPU_PINNING', 'true').lower() in ('1', 'true', 'yes')
+app.config['ENCODING_DEFAULT_COST'] = float(os.environ.get('ENCODING_DEFAULT_COST', 1.0))
+app.config['CALIBRATION_SECONDS'] = float(os.environ.get('CALIBRATION_SECONDS', 10))
+app.config['CALIBRATION_SOURCE'] = os.environ.get('CALIBRATION_SOURCE', 'testsrc2=size=1280x720:rate=30')
+
+# Archivo pid de nginx usado por /health (evita lanzar `pidof` en cada consulta)
+app.config['NGINX_PID_FILE'] = os.environ.get('NGINX_PID_FILE', '/run/nginx.pid')
+
+# Margen (segundos) para iniciar una transmisión atrasada (p. ej. tras un reinicio) según su repetición.
+# Pasado el margen, los streams recurrentes saltan a la siguiente ocurrencia y los de una vez expiran.
+app.config['MISFIRE_GRACE_TIME'] = {
+    repeat_type: int(os.environ.get(f'MISFIRE_GRACE_{repeat_type.upper()}', default))
+    for repeat_type, default in {
+        'once': 3600, 'daily': 900, 'weekly': 1800, 'monthly': 3600, 'hourly': 300, 'weekdays': 900, 'cron': 300
+    }.items()
+}
+
+# Tamaño de los buffers circulares por transmisión (muestras de -progress y líneas de stderr)
+app.config['FFMPEG_PROGRESS_SAMPLES'] = int(os.environ.get('FFMPEG_PROGRESS_SAMPLES', 120))
+app.config['FFMPEG_STDERR_LINES'] = int(os.environ.get('FFMPEG_STDERR_LINES', 50))
+
+# Subidas por partes reanudables: tamaño de parte sugerido al cliente, bloque de lectura del cuerpo,
+# tamaño máximo por archivo, horas tras las que se descarta una subida abandonada y segundos que dura
+# la reserva de una parte en curso (entre procesos web; se renueva mientras llegan datos)
+app.config['UPLOAD_CHUNK_SIZE'] = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+app.config['UPLOAD_READ_SIZE'] = 1024 * 1024
+app.config['UPLOAD_MAX_SIZE'] = int(os.environ.get('UPLOAD_MAX_SIZE', 50 * 1024 ** 3))
+app.config['UPLOAD_SESSION_TTL'] = int(os.environ.get('UPLOAD_SESSION_TTL', 24))
+app.config['UPLOAD_WRITER_TTL'] = int(os.environ.get('UPLOAD_WRITER_TTL', 120))
+
+# Vista previa: con X_ACCEL_REDIRECT=true /play delega el envío del archivo a nginx (location interna /upload/);
+# PREVIEW_HEIGHT es la altura de la versión liviana que se genera una vez por archivo
+app.config['X_ACCEL_REDIRECT'] = os.environ.get('X_ACCEL_REDIRECT', 'false').lower() in ('1', 'true', 'yes')
+app.config['X_ACCEL_PREFIX'] = os.environ.get('X_ACCEL_PREFIX', '/upload/')
+app.config['PREVIEW_HEIGHT'] = int(os.environ.get('PREVIEW_HEIGHT', 360))
+app.config['PREVIEW_WORKERS'] = int(os.environ.get('PREVIEW_WORKERS', 1))
+
+# Procesos ffprobe simultáneos para analizar los archivos subidos
+app.config['PROBE_WORKERS'] = int(os.environ.get('PROBE_WORKERS', 2))
+# Segundos sin reintentar un análisis cuando ffprobe no se pudo ejecutar (no instalado, sin permisos...)
+app.config['PROBE_RETRY_SECONDS'] = float(os.environ.get('PROBE_RETRY_SECONDS', 60))
+
+# Validación de la agenda: solapes por destino RTMP y egreso agregado (kbit/s, 0 = sin límite).
+# SCHEDULE_CONFLICT_POLICY: 'reject' (409), 'warn' (se guarda y se informa) u 'off'.
+app.config['SCHEDULE_CONFLICT_POLICY'] = os.environ.get('SCHEDULE_CONFLICT_POLICY', 'warn')
+app.config['EGRESS_CAP_KBPS'] = int(os.environ.get('EGRESS_CAP_KBPS', 0))
+app.config['SCHEDULE_HORIZON_DAYS'] = int(os.environ.get('SCHEDULE_HORIZON_DAYS', 14))
+app.config['SCHEDULE_MAX_OCCURRENCES'] = int(os.environ.get('SCHEDULE_MAX_OCCURRENCES', 1000))
+app.config['PROBE_TIMEOUT'] = float(os.environ.get('PROBE_TIMEOUT', 10))
+
+# Intervalo (segundos) con el que se agrupan y emiten las estadísticas de transmisión por Socket.IO
+app.config['TELEMETRY_INTERVAL'] = float(os.environ.get('TELEMETRY_INTERVAL', 2))
+
+# Grabaciones entrantes: cada cuántos segundos se muestrean los tamaños (un evento streams_update por
+# muestreo) y tras cuántos segundos sin crecer una grabación se marca como detenida
+app.config['INGEST_SAMPLE_INTERVAL'] = float(os.environ.get('INGEST_SAMPLE_INTERVAL', 1))
+app.config['INGEST_STALL_SECONDS'] = float(os.environ.get('INGEST_STALL_SECONDS', 5))
+
+# Post-grabación: una grabación terminada (cerrada por nginx, o sin crecer en RECORD_FINISH_SECONDS) se
+# remuxea a MP4 con +faststart en uploads con RECORD_WORKERS procesos a la vez, se analiza y se registra
+# en el catálogo. RECORD_KEEP_SOURCE conserva el .flv. Con RECORD_AUTO_SCHEDULE se programa una
+# retransmisión a RECORD_RERUN_RTMP, RECORD_RERUN_DELAY segundos después de terminada la grabación.
+app.config['RECORD_WORKERS'] = int(os.environ.get('RECORD_WORKERS', 2))
+app.config['RECORD_FINISH_SECONDS'] = float(os.environ.get('RECORD_FINISH_SECONDS', 60))
+app.config['RECORD_KEEP_SOURCE'] = os.environ.get('RECORD_KEEP_SOURCE', 'false').lower() in ('1', 'true', 'yes')
+app.config['RECORD_AUTO_SCHEDULE'] = os.environ.get('RECORD_AUTO_SCHEDULE', 'false').lower() in ('1', 'true', 'yes')
+app.config['RECORD_RERUN_RTMP'] = os.environ.get('RECORD_RERUN_RTMP', '')
+app.config['RECORD_RERUN_DELAY'] = float(os.environ.get('RECORD_RERUN_DELAY', 3600))
+
+# Almacenamiento por niveles: uploads es el disco caliente y COLD_STORAGE_FOLDER (vacío = desactivado) el frío.
+# Cada STORAGE_CHECK_INTERVAL segundos el líder trae de vuelta lo que los streams usan en las próximas
+# STORAGE_PREFETCH_HOURS y, si uploads supera STORAGE_HOT_QUOTA_GB, mueve al frío lo menos usado hasta
+# bajar a STORAGE_HOT_TARGET de la cuota. STORAGE_COLD_AFTER_DAYS mueve además lo que no se usa hace N días.
+app.config['COLD_STORAGE_FOLDER'] = os.environ.get('COLD_STORAGE_FOLDER', '')
+app.config['STORAGE_HOT_QUOTA_GB'] = float(os.environ.get('STORAGE_HOT_QUOTA_GB', 0))
+app.config['STORAGE_HOT_TARGET'] = float(os.environ.get('STORAGE_HOT_TARGET', 0.9))
+app.config['STORAGE_COLD_AFTER_DAYS'] = float(os.environ.get('STORAGE_COLD_AFTER_DAYS', 0))
+app.config['STORAGE_PREFETCH_HOURS'] = float(os.environ.get('STORAGE_PREFETCH_HOURS', 6))
+app.config['STORAGE_CHECK_INTERVAL'] = float(os.environ.get('STORAGE_CHECK_INTERVAL', 300))
+
+# Pre-roll: el trabajo se dispara PREROLL_SECONDS antes de la hora programada para validar el archivo,
+# precalentar la caché de disco y el destino RTMP, y lanzar ffmpeg a la hora menos su tiempo de arranque
+# (estimado por perfil; PREROLL_LAUNCH_LEAD es el valor inicial). PREROLL_SECONDS=0 lo desactiva.
+app.config['PREROLL_SECONDS'] = float(os.environ.get('PREROLL_SECONDS', 15))
+app.config['PREROLL_LAUNCH_LEAD'] = float(os.environ.get('PREROLL_LAUNCH_LEAD', 1.0))
+app.config['PREROLL_RTMP_TIMEOUT'] = float(os.environ.get('PREROLL_RTMP_TIMEOUT', 2))
+app.config['PREROLL_READAHEAD_BYTES'] = int(os.environ.get('PREROLL_READAHEAD_BYTES', 32 * 1024 * 1024))
+
+# Reconexión: si ffmpeg se corta a mitad de la transmisión se relanza desde el último instante confirmado,
+# con backoff exponencial (BACKOFF, 2*BACKOFF, ... hasta BACKOFF_MAX) y un máximo de BUDGET reintentos;
+# un segmento que se sostiene RETRY_RESET segundos devuelve el presupuesto completo.
+app.config['BROADCAST_RETRY_BUDGET'] = int(os.environ.get('BROADCAST_RETRY_BUDGET', 5))
+app.config['BROADCAST_RETRY_BACKOFF'] = float(os.environ.get('BROADCAST_RETRY_BACKOFF', 1))
+app.config['BROADCAST_RETRY_BACKOFF_MAX'] = float(os.environ.get('BROADCAST_RETRY_BACKOFF_MAX', 30))
+app.config['BROADCAST_RETRY_RESET'] = float(os.environ.get('BROADCAST_RETRY_RESET', 300))
+
+# Streams con el mismo archivo, parámetros y hora salen en un solo ffmpeg (muxer tee, un destino por stream)
+app.config['FANOUT_BROADCASTS'] = os.environ.get('FANOUT_BROADCASTS', 'true').lower() in ('1', 'true', 'yes')
+
+# Canales 24/7: un solo ffmpeg por canal lee una lista principal de CHANNEL_PLAYLIST_BATCHES tandas ffconcat
+# que el runner escribe a medida que avanza, de al menos CHANNEL_PLAYLIST_WINDOW segundos cada una (2016
+# tandas de 5 minutos son una semana; al agotarlas ffmpeg se relanza una vez). Un elemento con hora que se
+# perdió (p. ej. porque el canal arrancó tarde) todavía se emite si no pasaron más de CHANNEL_INSERT_GRACE
+# segundos.
+app.config['CHANNEL_FOLDER'] = os.environ.get(
+    'CHANNEL_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'channels')
+)
+app.config['CHANNEL_PLAYLIST_WINDOW'] = float(os.environ.get('CHANNEL_PLAYLIST_WINDOW', 300))
+app.config['CHANNEL_PLAYLIST_BATCHES'] = int(os.environ.get('CHANNEL_PLAYLIST_BATCHES', 2016))
+app.config['CHANNEL_INSERT_GRACE'] = float(os.environ.get('CHANNEL_INSERT_GRACE', 60))
+
+def escape_label_value(value):
+    """Escapa un valor de etiqueta según el formato de texto de Prometheus (\\, comillas y saltos de línea)"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metric:
+    """
+    Métrica en memoria (counter, gauge o histogram) con etiquetas opcionales.
+
+    Se exporta en el formato de texto de Prometheus desde /metrics sin lanzar
+    ningún proceso ni consultar el sistema en cada scrape.
+    """
+    def __init__(self, name, kind, documentation, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.buckets = tuple(buckets) if buckets else None
+        self.values = {}
+        self.callback = None
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def set_function(self, callback):
+        """Calcula el valor del gauge en el momento del scrape"""
+        self.callback = callback
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            state = self.values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def render(self):
+        def format_labels(key, extra=()):
+            pairs = list(key) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{escape_label_value(v)}"' for k, v in pairs) + '}'
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        if self.callback:
+            try:
+                lines.append(f'{self.name} {self.callback()}')
+            except Exception as e:
+                print(f"Error al calcular métrica {self.name}: {str(e)}")
+            return lines
+        with self.lock:
+            items = sorted(self.values.items())
+            if self.kind != 'histogram':
+                lines.extend(f'{self.name}{format_labels(key)} {value}' for key, value in items)
+                return lines
+            for key, state in items:
+                for bound, count in zip(self.buckets, state['buckets']):
+                    lines.append(f'{self.name}_bucket{format_labels(key, [("le", bound)])} {count}')
+                lines.append(f'{self.name}_bucket{format_labels(key, [("le", "+Inf")])} {state["count"]}')
+                lines.append(f'{self.name}_sum{format_labels(key)} {state["sum"]}')
+                lines.append(f'{self.name}_count{format_labels(key)} {state["count"]}')
+        return lines
+
+class MetricsRegistry:
+    """Registro de métricas del proceso"""
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation):
+        return self._register(Metric(name, 'counter', documentation))
+
+    def gauge(self, name, documentation):
+        return self._register(Metric(name, 'gauge', documentation))
+
+    def histogram(self, name, documentation, buckets):
+        return self._register(Metric(name, 'histogram', documentation, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+process_start_time = time.time()
+
+JOBS_SCHEDULED = metrics.counter('rtmp_scheduler_jobs_scheduled_total', 'Trabajos de transmisión programados')
+JOBS_FIRED = metrics.counter('rtmp_scheduler_jobs_fired_total', 'Trabajos de transmisión disparados por el scheduler')
+JOBS_MISSED = metrics.counter('rtmp_scheduler_jobs_missed_total', 'Trabajos de transmisión perdidos (misfire)')
+JOBS_FAILED = metrics.counter('rtmp_scheduler_jobs_failed_total', 'Trabajos del scheduler que lanzaron una excepción')
+FFMPEG_PROCESSES = metrics.gauge('rtmp_ffmpeg_processes', 'Procesos ffmpeg en ejecución')
+FFMPEG_EXITS = metrics.counter('rtmp_ffmpeg_exits_total', 'Procesos ffmpeg terminados por código de salida')
+BROADCAST_RETRIES = metrics.counter('rtmp_broadcast_retries_total', 'Relanzamientos de ffmpeg tras un corte a mitad de la transmisión')
+BROADCAST_START_LAG = metrics.histogram(
+    'rtmp_broadcast_start_lag_seconds', 'Retraso entre la hora programada y el inicio real de ffmpeg',
+    (0.5, 1, 2, 5, 10, 30, 60, 300, 900)
+)
+BROADCAST_START_SKEW = metrics.histogram(
+    'rtmp_broadcast_start_skew_seconds', 'Desvío absoluto entre la hora programada y la salida al aire',
+    (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 30)
+)
+BROADCAST_QUEUE_WAIT = metrics.histogram(
+    'rtmp_broadcast_queue_wait_seconds', 'Tiempo de espera en la cola del ejecutor de transmisiones',
+    (0.1, 1, 5, 15, 60, 300, 900)
+)
+DB_QUERY_DURATION = metrics.histogram(
+    'rtmp_db_query_duration_seconds', 'Latencia de las consultas a la base de datos',
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+)
+UPLOAD_BYTES = metrics.counter('rtmp_upload_bytes_total', 'Bytes recibidos en subidas de video')
+UPLOAD_DURATION = metrics.histogram(
+    'rtmp_upload_duration_seconds', 'Duración de la escritura de subidas de video',
+    (0.1, 1, 5, 30, 120, 600, 1800)
+)
+WATCHDOG_EVENTS = metrics.counter('rtmp_watchdog_events_total', 'Eventos de sistema de archivos recibidos por StreamMonitor')
+INGEST_STALLS = metrics.counter('rtmp_ingest_stalls_total', 'Grabaciones entrantes que dejaron de crecer')
+STORAGE_EVICTIONS = metrics.counter('rtmp_storage_evictions_total', 'Contenidos movidos al almacenamiento frío')
+STORAGE_RECALLS = metrics.counter('rtmp_storage_recalls_total', 'Contenidos traídos de vuelta del almacenamiento frío')
+STORAGE_HOT_BYTES = metrics.gauge('rtmp_storage_hot_bytes', 'Bytes ocupados en uploads en la última revisión del almacenamiento')
+PROCESS_UPTIME = metrics.gauge('rtmp_process_uptime_seconds', 'Segundos desde el inicio del proceso')
+PROCESS_UPTIME.set_function(lambda: round(time.time() - process_start_time, 3))
+for metric in (JOBS_SCHEDULED, JOBS_FIRED, JOBS_MISSED, JOBS_FAILED, FFMPEG_PROCESSES, BROADCAST_RETRIES, UPLOAD_BYTES, INGEST_STALLS,
+               STORAGE_EVICTIONS, STORAGE_RECALLS):
+    metric.set(0)
+
+def on_scheduler_event(scheduler_event):
+    if scheduler_event.code == EVENT_JOB_SUBMITTED:
+        JOBS_FIRED.inc()
+    elif scheduler_event.code == EVENT_JOB_MISSED:
+        JOBS_MISSED.inc()
+        if scheduler_event.job_id.startswith('stream_'):
+            # Se ejecuta en otro hilo: el scheduler elimina el trabajo perdido al terminar este ciclo
+            threading.Thread(
+                target=handle_missed_broadcast,
+                args=(int(scheduler_event.job_id.split('_', 1)[1]),),
+                daemon=True
+            ).start()
+    elif scheduler_event.code == EVENT_JOB_ERROR:
+        JOBS_FAILED.inc()
+
+scheduler.add_listener(on_scheduler_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_ERROR)
+
 class Stream(db.Model):
     """
     Modelo de Stream que representa una transmisión de video.
@@ -45,52 +400,568 @@ class Stream(db.Model):
     name (str): Nombre del stream.
     input_path (str): Ruta del archivo de video de entrada.
     output_rtmp (str): URL de salida RTMP para la transmisión.
-    scheduled_time (datetime): Hora programada para la transmisión.
-    status (str): Estado actual del stream (pending, streaming, completed, error, expired).
+    scheduled_time (datetime): Hora programada; en streams recurrentes es el inicio de la serie.
+    status (str): Estado actual del stream (pending, queued, streaming, completed, error, expired).
     is_active (bool): Indica si el stream está activo o no.
     last_played (datetime): Fecha y hora de la última transmisión.
     play_count (int): Número de veces que se ha transmitido el stream.
     video_params (str): Parámetros de codificación de video para ffmpeg.
-    repeat_type (str): Tipo de repetición (once, daily, weekly, monthly).
+    repeat_type (str): Tipo de repetición (once, daily, weekly, monthly, hourly, weekdays, cron).
+    recurrence_rule (str): Regla adicional: horas para 'hourly', días 0-6 para 'weekdays', expresión para 'cron'.
+    next_run_at (datetime): Próxima ejecución materializada (nula si el stream no está activo).
+    priority (int): Prioridad en la cola de transmisiones (mayor valor, antes se inicia).
+    owner (str): Runner que reclamó el stream en modo pool.
+    lease_expires_at (datetime): Vencimiento del lease del runner; si no lo renueva, otro lo reclama.
+    encoding_profile_id (int): Perfil de codificación; sus parámetros se copian en video_params.
     """
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     input_path = db.Column(db.String(500), nullable=False)
     output_rtmp = db.Column(db.String(500), nullable=False)
     scheduled_time = db.Column(db.DateTime, nullable=False)
-    # Estados posibles: pending, streaming, completed, error, expired
+    # Estados posibles: pending, queued, streaming, completed, error, expired
     status = db.Column(db.String(20), default='pending')
     is_active = db.Column(db.Boolean, default=True)
     last_played = db.Column(db.DateTime)
     play_count = db.Column(db.Integer, default=0)
     video_params = db.Column(db.String(500), default='-c:v copy -c:a aac -f flv')
-    repeat_type = db.Column(db.String(20), default='once')  # once, daily, weekly, monthly
+    repeat_type = db.Column(db.String(20), default='once')  # once, daily, weekly, monthly, hourly, weekdays, cron
+    recurrence_rule = db.Column(db.String(100))
+    next_run_at = db.Column(db.DateTime, index=True)
+    priority = db.Column(db.Integer, default=0)
+    owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    encoding_profile_id = db.Column(db.Integer, index=True)
+
+    # Índices compuestos para el listado paginado (orden + id como desempate) y los filtros habituales
+    __table_args__ = (
+        db.Index('ix_stream_active_status_next_run', 'is_active', 'status', 'next_run_at'),
+        db.Index('ix_stream_next_run_at_id', 'next_run_at', 'id'),
+        db.Index('ix_stream_scheduled_time_id', 'scheduled_time', 'id'),
+        db.Index('ix_stream_name_id', 'name', 'id'),
+        db.Index('ix_stream_status_id', 'status', 'id'),
+        db.Index('ix_stream_status_lease', 'status', 'lease_expires_at'),
+    )
+
+class MediaProbe(db.Model):
+    """
+    Resultado de ffprobe para un archivo de entrada.
+
+    Se identifica por la ruta (tal como se guarda en Stream.input_path) y solo
+    es válido mientras el tamaño y la fecha de modificación del archivo
+    coincidan con los registrados.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(500), nullable=False, unique=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    mtime = db.Column(db.Float, nullable=False)
+    duration = db.Column(db.Float)
+    format_name = db.Column(db.String(100))
+    bit_rate = db.Column(db.Integer)
+    video_codec = db.Column(db.String(50))
+    audio_codec = db.Column(db.String(50))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    frame_rate = db.Column(db.Float)
+    error = db.Column(db.String(500))
+    probed_at = db.Column(db.DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            'duration': self.duration,
+            'format_name': self.format_name,
+            'bit_rate': self.bit_rate,
+            'video_codec': self.video_codec,
+            'audio_codec': self.audio_codec,
+            'width': self.width,
+            'height': self.height,
+            'frame_rate': self.frame_rate,
+            'error': self.error,
+            'probed_at': self.probed_at.isoformat() if self.probed_at else None
+        }
+
+class RunnerLease(db.Model):
+    """Lease de líder del runner de transmisiones (una fila por nombre de lease)."""
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100))
+    expires_at = db.Column(db.DateTime, nullable=False)
+    renewed_at = db.Column(db.DateTime)
+
+class RunnerNode(db.Model):
+    """Estado publicado por cada runner del pool en su heartbeat."""
+    node_id = db.Column(db.String(100), primary_key=True)
+    hostname = db.Column(db.String(100))
+    pid = db.Column(db.Integer)
+    slots = db.Column(db.Integer)
+    running = db.Column(db.Integer)
+    load = db.Column(db.Float)
+    heartbeat_at = db.Column(db.DateTime)
+
+class BroadcastRun(db.Model):
+    """
+    Registro de cada salida al aire de un stream.
+
+    skew_ms es la diferencia entre la salida al aire (ffmpeg escribe la
+    cabecera de salida) y la hora programada: positiva si salió tarde.
+    lead_ms es la anticipación con la que se lanzó ffmpeg y launch_ms lo que
+    realmente tardó en salir al aire desde el lanzamiento.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    stream_id = db.Column(db.Integer, nullable=False, index=True)
+    node = db.Column(db.String(100))
+    profile = db.Column(db.String(20))
+    due_at = db.Column(db.DateTime, nullable=False)
+    preroll_at = db.Column(db.DateTime)
+    launched_at = db.Column(db.DateTime)
+    on_air_at = db.Column(db.DateTime)
+    ended_at = db.Column(db.DateTime)
+    lead_ms = db.Column(db.Integer)
+    launch_ms = db.Column(db.Integer)
+    skew_ms = db.Column(db.Integer)
+    rtmp_connect_ms = db.Column(db.Integer)
+    returncode = db.Column(db.Integer)
+    # Estados posibles: preroll, on_air, completed, error, cancelled
+    status = db.Column(db.String(20), default='preroll')
+    error = db.Column(db.String(500))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'stream_id': self.stream_id,
+            'node': self.node,
+            'profile': self.profile,
+            'due_at': self.due_at.isoformat(),
+            'preroll_at': self.preroll_at.isoformat() if self.preroll_at else None,
+            'launched_at': self.launched_at.isoformat() if self.launched_at else None,
+            'on_air_at': self.on_air_at.isoformat() if self.on_air_at else None,
+            'ended_at': self.ended_at.isoformat() if self.ended_at else None,
+            'lead_ms': self.lead_ms,
+            'launch_ms': self.launch_ms,
+            'skew_ms': self.skew_ms,
+            'rtmp_connect_ms': self.rtmp_connect_ms,
+            'returncode': self.returncode,
+            'status': self.status,
+            'error': self.error
+        }
+
+class BroadcastSegment(db.Model):
+    """
+    Tramo continuo de una ejecución: un proceso ffmpeg.
+
+    offset es el punto del archivo (segundos, -ss) desde el que arrancó y
+    out_time lo que alcanzó a emitir según -progress; el siguiente tramo de
+    la misma ejecución reanuda en offset + out_time.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, nullable=False, index=True)
+    stream_id = db.Column(db.Integer, nullable=False)
+    attempt = db.Column(db.Integer, nullable=False, default=0)
+    offset = db.Column(db.Float, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, nullable=False)
+    ended_at = db.Column(db.DateTime)
+    out_time = db.Column(db.Float)
+    returncode = db.Column(db.Integer)
+    error = db.Column(db.String(500))
+
+    def to_dict(self):
+        return {
+            'attempt': self.attempt,
+            'offset': self.offset,
+            'started_at': self.started_at.isoformat(),
+            'ended_at': self.ended_at.isoformat() if self.ended_at else None,
+            'out_time': self.out_time,
+            'returncode': self.returncode,
+            'error': self.error
+        }
+
+class Channel(db.Model):
+    """
+    Canal continuo: una sesión RTMP y un proceso ffmpeg que recorre una lista.
+
+    Los elementos sin hora rotan en orden de posición; los que tienen
+    start_at se insertan a esa hora. filler_path es el relleno (slate) que
+    cubre los huecos hasta una inserción o cuando la rotación está vacía.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    output_rtmp = db.Column(db.String(500), nullable=False)
+    video_params = db.Column(db.String(500), default='-c:v copy -c:a aac -f flv')
+    filler_path = db.Column(db.String(500))
+    starts_at = db.Column(db.DateTime)
+    is_active = db.Column(db.Boolean, default=False)
+    # Estados posibles: stopped, streaming, reconnecting, error
+    status = db.Column(db.String(20), default='stopped')
+    current_item_id = db.Column(db.Integer)
+    started_at = db.Column(db.DateTime)
+    error = db.Column(db.String(500))
+
+    def to_dict(self, items=None):
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'output_rtmp': self.output_rtmp,
+            'video_params': self.video_params or '-c:v copy -c:a aac -f flv',
+            'filler_path': self.filler_path,
+            'starts_at': self.starts_at.isoformat() if self.starts_at else None,
+            'is_active': self.is_active,
+            'status': self.status,
+            'current_item_id': self.current_item_id,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'error': self.error
+        }
+        if items is not None:
+            data['items'] = [item.to_dict() for item in items]
+        return data
+
+class ChannelItem(db.Model):
+    """Elemento de un canal: un archivo de uploads en la rotación o insertado a una hora (start_at)"""
+    id = db.Column(db.Integer, primary_key=True)
+    channel_id = db.Column(db.Integer, nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    input_path = db.Column(db.String(500), nullable=False)
+    start_at = db.Column(db.DateTime)
+    played_at = db.Column(db.DateTime)
+    play_count = db.Column(db.Integer, default=0)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'position': self.position,
+            'input_path': self.input_path,
+            'start_at': self.start_at.isoformat() if self.start_at else None,
+            'played_at': self.played_at.isoformat() if self.played_at else None,
+            'play_count': self.play_count or 0
+        }
+
+class EncodingProfile(db.Model):
+    """
+    Perfil de codificación con nombre: parámetros de ffmpeg validados y su costo medido.
+
+    cpu_cost son los núcleos que ocupa ffmpeg para codificar en tiempo real
+    (segundos de CPU por segundo de video, medidos por la calibración) y
+    speed la velocidad que alcanzó usando todos los núcleos.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    description = db.Column(db.String(500))
+    video_params = db.Column(db.String(500), nullable=False)
+    cpu_cost = db.Column(db.Float)
+    speed = db.Column(db.Float)
+    # Estados de calibración: pending, calibrating, calibrated, error
+    calibration_status = db.Column(db.String(20), default='pending')
+    calibrated_at = db.Column(db.DateTime)
+    calibration_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    def to_dict(self):
+        cores = len(cpu_allocator.cores)
+        threads = encoding_threads(self.video_params, self.cpu_cost)
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'video_params': self.video_params,
+            'profile': get_broadcast_profile(self.video_params),
+            'cpu_cost': self.cpu_cost,
+            'speed': self.speed,
+            'threads': threads,
+            'max_concurrent': cores // threads if threads else None,
+            'calibration_status': self.calibration_status,
+            'calibrated_at': self.calibrated_at.isoformat() if self.calibrated_at else None,
+            'calibration_error': self.calibration_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class RecordingJob(db.Model):
+    """
+    Trabajo de post-grabación de un .flv de uploads/receiving.
+
+    Estados: queued, remuxing, completed, error. output es el MP4 en
+    uploads y stream_id la retransmisión programada (si se pidió).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(500), nullable=False, unique=True)
+    output = db.Column(db.String(500))
+    status = db.Column(db.String(20), default='queued')
+    size = db.Column(db.BigInteger)
+    duration = db.Column(db.Float)
+    stream_id = db.Column(db.Integer)
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source': self.source,
+            'output': self.output,
+            'status': self.status,
+            'size': self.size,
+            'duration': self.duration,
+            'stream_id': self.stream_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class UploadSession(db.Model):
+    """
+    Subida por partes en curso.
+
+    Las partes se escriben en uploads/.partial/<id> a partir de `received`;
+    al finalizar, el archivo se mueve a la carpeta de uploads con `filename`.
+    `writer` es la petición que está escribiendo una parte (una por vez,
+    aunque lleguen a procesos distintos) hasta `writer_expires_at`.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(300), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, default=0)
+    expected_sha256 = db.Column(db.String(64))
+    sha256 = db.Column(db.String(64))
+    writer = db.Column(db.String(32))
+    writer_expires_at = db.Column(db.DateTime)
+    # Estados posibles: uploading, completed
+    status = db.Column(db.String(20), default='uploading')
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.total_size,
+            'offset': self.received,
+            'status': self.status,
+            'sha256': self.sha256,
+            'chunk_size': app.config['UPLOAD_CHUNK_SIZE']
+        }
+
+class MediaBlob(db.Model):
+    """
+    Contenido subido, guardado una sola vez en uploads/.blobs/<sha256[:2]>/<sha256>.
+
+    Cada nombre visible en uploads (MediaAlias) es un enlace duro al blob.
+    ref_count cuenta los streams que usan alguno de sus nombres; cuando el
+    último se elimina, el contenido se recolecta.
+    """
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+class MediaAlias(db.Model):
+    """Nombre de un archivo de uploads que es un enlace duro a un blob"""
+    name = db.Column(db.String(300), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+class ColdFile(db.Model):
+    """
+    Archivo movido al almacenamiento frío (COLD_STORAGE_FOLDER).
+
+    name es la ruta relativa a uploads ('video.mp4' o 'receiving/x.flv'). Si
+    es un nombre de un blob, lo que se movió es el blob y al traerlo se
+    vuelven a crear todos sus nombres.
+    """
+    name = db.Column(db.String(500), primary_key=True)
+    sha256 = db.Column(db.String(64), index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    last_used_at = db.Column(db.DateTime)
+    moved_at = db.Column(db.DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'sha256': self.sha256,
+            'size': self.size,
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
+            'moved_at': self.moved_at.isoformat() if self.moved_at else None
+        }
+
+with app.app_context():
+    # El inicio se guarda en el contexto de ejecución de cada sentencia: si falla, se descarta con ella
+    @event.listens_for(db.engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.query_start_time = time.perf_counter()
+
+    @event.listens_for(db.engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_DURATION.observe(time.perf_counter() - context.query_start_time)
+
+class DatabaseBackups:
+    """
+    Backups de la base SQLite con la API de backup en línea.
+
+    La copia se hace en un hilo propio por pasos de BACKUP_PAGES_PER_STEP
+    páginas con una pausa entre pasos, así un backup no bloquea la petición
+    que lo pidió ni retiene el lock de la base mientras copia. SQLite
+    garantiza que el resultado es una foto consistente: si otra conexión
+    escribe a mitad de camino, la copia vuelve a empezar. Se escribe en un
+    archivo temporal, se verifica con quick_check y recién entonces toma su
+    nombre definitivo; se conservan los últimos BACKUP_KEEP.
+    """
+    PREFIX = 'streams_backup_'
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.pending = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.last = None
+
+    def database_path(self):
+        """Ruta del archivo SQLite de la aplicación (None si la base no es SQLite)"""
+        with app.app_context():
+            url = db.engine.url
+        if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+            return None
+        return url.database
+
+    def request(self):
+        """Pide un backup; vuelve enseguida. Varios pedidos seguidos se resuelven con un solo backup"""
+        with self.lock:
+            if not self.thread:
+                self.thread = threading.Thread(target=self._run, name='database-backup', daemon=True)
+                self.thread.start()
+        self.pending.set()
+        return True
+
+    def _run(self):
+        while True:
+            self.pending.wait()
+            # running se marca antes de consumir el pedido: quien mira ambos nunca ve el backup en el aire
+            self.running = True
+            self.pending.clear()
+            try:
+                self.last = self.backup()
+            except Exception as e:
+                self.last = {'status': 'error', 'error': str(e), 'finished_at': datetime.now().isoformat()}
+                print(f"Error al crear backup: {str(e)}")
+            finally:
+                self.running = False
+
+    def backup(self):
+        source_path = self.database_path()
+        if not source_path:
+            raise RuntimeError('Los backups en línea solo están disponibles para bases SQLite')
+        os.makedirs(self.folder, exist_ok=True)
+        started = time.perf_counter()
+        backup_file = os.path.join(self.folder, f"{self.PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+        temporary = f'{backup_file}.partial'
+        steps, restarts, previous = 0, 0, None
+
+        def throttle(status, remaining, total):
+            # Si una escritura obliga a empezar de nuevo varias veces, se deja de pausar para terminar
+            nonlocal steps, restarts, previous
+            steps += 1
+            if previous is not None and remaining > previous:
+                restarts += 1
+            previous = remaining
+            if remaining and restarts < 3:
+                time.sleep(app.config['BACKUP_STEP_SLEEP'])
+
+        source = sqlite3.connect(source_path, timeout=30)
+        target = sqlite3.connect(temporary)
+        try:
+            source.backup(target, pages=app.config['BACKUP_PAGES_PER_STEP'], progress=throttle)
+            check = target.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+        if check != 'ok':
+            os.remove(temporary)
+            raise RuntimeError(f'El backup no pasó quick_check: {check}')
+        os.replace(temporary, backup_file)
+        elapsed = time.perf_counter() - started
+        print(f"Base de datos respaldada en: {backup_file} ({steps} pasos, {restarts} reinicios, {elapsed:.2f}s)")
+
+        # Mantener solo los últimos BACKUP_KEEP backups
+        for old_backup in self.list()[:-app.config['BACKUP_KEEP']]:
+            os.remove(os.path.join(self.folder, old_backup))
+            print(f"Backup antiguo eliminado: {old_backup}")
+        return {
+            'status': 'success',
+            'file': os.path.basename(backup_file),
+            'size': os.path.getsize(backup_file),
+            'seconds': round(elapsed, 3),
+            'restarts': restarts,
+            'finished_at': datetime.now().isoformat()
+        }
+
+    def list(self):
+        """Backups terminados, del más viejo al más nuevo"""
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.startswith(self.PREFIX) and name.endswith('.db'))
+
+    def taken_at(self, name):
+        return datetime.strptime(name[len(self.PREFIX):-len('.db')], '%Y%m%d_%H%M%S')
+
+    def restore(self, name):
+        """Copia un backup sobre la base con la misma API (primero respalda la base actual)"""
+        source_path = self.database_path()
+        if not source_path:
+            raise RuntimeError('La restauración solo está disponible para bases SQLite')
+        backup_path = os.path.join(self.folder, name)
+        backup = sqlite3.connect(f'file:{backup_path}?mode=ro', uri=True)
+        try:
+            check = backup.execute('PRAGMA integrity_check').fetchone()[0]
+            if check != 'ok':
+                raise RuntimeError(f'El backup {name} está dañado: {check}')
+            safety = os.path.join(self.folder, f"streams_pre_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+            current = sqlite3.connect(source_path, timeout=30)
+            try:
+                with sqlite3.connect(safety) as copy:
+                    current.backup(copy)
+                backup.backup(current)
+            finally:
+                current.close()
+        finally:
+            backup.close()
+        return safety
+
+database_backups = DatabaseBackups(app.config['BACKUP_FOLDER'])
 
 def backup_database():
-    """Crear una copia de seguridad de la base de datos con marca de tiempo."""
+    """Pide una copia de seguridad de la base en segundo plano (ver DatabaseBackups)."""
+    return database_backups.request()
+
+@app.cli.command('restore-backup')
+@click.argument('name', required=False)
+@click.option('--at', 'point_in_time', help='Restaurar el último backup tomado hasta esta fecha (ISO 8601)')
+@click.option('--list', 'list_only', is_flag=True, help='Listar los backups disponibles')
+def restore_backup_command(name, point_in_time, list_only):
+    """Restaura la base desde un backup (detener el runner y los procesos web antes)."""
+    backups = database_backups.list()
+    if list_only:
+        for backup in backups:
+            click.echo(f"{backup}  {database_backups.taken_at(backup)}")
+        return
+    if point_in_time:
+        try:
+            limit = datetime.fromisoformat(point_in_time)
+        except ValueError:
+            raise click.BadParameter(f'Formato de fecha inválido: {point_in_time}', param_hint='--at')
+        candidates = [backup for backup in backups if database_backups.taken_at(backup) <= limit]
+        if not candidates:
+            raise click.ClickException(f'No hay backups tomados hasta {limit}')
+        name = candidates[-1]
+    if not name:
+        raise click.UsageError('Indique el nombre del backup o --at')
+    if name not in backups:
+        raise click.ClickException(f'No existe el backup {name}')
     try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backups')
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        
-        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'streams.db')
-        backup_file = os.path.join(backup_dir, f'streams_backup_{timestamp}.db')
-        
-        shutil.copy2(source, backup_file)
-        print(f"Base de datos respaldada en: {backup_file}")
-        
-        # Mantener solo los últimos 5 backups
-        backups = sorted([f for f in os.listdir(backup_dir) if f.startswith('streams_backup_')])
-        if len(backups) > 5:
-            for old_backup in backups[:-5]:
-                os.remove(os.path.join(backup_dir, old_backup))
-                print(f"Backup antiguo eliminado: {old_backup}")
-        
-        return True
+        safety = database_backups.restore(name)
     except Exception as e:
-        print(f"Error al crear backup: {str(e)}")
-        return False
+        raise click.ClickException(str(e))
+    click.echo(f"Base restaurada desde {name} ({database_backups.taken_at(name)})")
+    click.echo(f"La base anterior quedó en {safety}")
 
 def ensure_database_exists():
     """Verifica si la base de datos existe y la crea si no está presente."""
@@ -106,54 +977,2518 @@ def ensure_database_exists():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def ensure_upload_folder():
-    """Asegura que existe la carpeta de uploads"""
+def save_uploaded_file(file):
+    """
+    Guarda un archivo subido con nombre único en la carpeta de uploads y devuelve el nombre.
+
+    El sha256 se calcula mientras se escribe el archivo; si ese contenido ya
+    estaba guardado, el nombre nuevo es un enlace al mismo blob (MediaStore).
+    El nombre queda registrado con el commit del llamador; sin commit se borra.
+    """
+    filename = secure_filename(file.filename)
+    unique_filename = f"{uuid.uuid4()}_{filename}"
+    temporary = get_partial_path(uuid.uuid4().hex)
+    os.makedirs(os.path.dirname(temporary), exist_ok=True)
+    
+    start = time.perf_counter()
+    hasher, size = hashlib.sha256(), 0
     try:
-        if not os.path.exists(UPLOAD_FOLDER):
-            os.makedirs(UPLOAD_FOLDER)
-            print(f"Carpeta de uploads creada en: {UPLOAD_FOLDER}")
+        with open(temporary, 'wb') as output:
+            while True:
+                block = file.stream.read(app.config['UPLOAD_READ_SIZE'])
+                if not block:
+                    break
+                output.write(block)
+                hasher.update(block)
+                size += len(block)
+        UPLOAD_DURATION.observe(time.perf_counter() - start)
+        UPLOAD_BYTES.inc(size)
+        media_store.ingest(temporary, hasher.hexdigest(), unique_filename)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return unique_filename
+
+def get_partial_path(upload_id):
+    return os.path.join(app.config['UPLOAD_FOLDER'], '.partial', upload_id)
+
+class UploadHashers:
+    """
+    sha256 incremental de cada subida por partes y hasta qué offset lleva calculado.
+
+    El estado de hashlib no se puede guardar en la base. Con varios procesos
+    web una subida reanudada puede llegar a otro proceso, que escribe partes
+    que este no vio (o este proceso se reinició): si el offset calculado no
+    coincide con `received`, el sha256 se vuelve a calcular desde el archivo
+    parcial.
+    """
+    def __init__(self):
+        self.hashers = {}
+        self.lock = threading.Lock()
+
+    def get(self, upload_session):
+        with self.lock:
+            hasher, offset = self.hashers.get(upload_session.id, (None, None))
+        if hasher is not None and offset == upload_session.received:
+            return hasher
+        hasher = hashlib.sha256()
+        remaining = upload_session.received
+        with open(get_partial_path(upload_session.id), 'rb') as partial:
+            while remaining:
+                block = partial.read(min(remaining, app.config['UPLOAD_READ_SIZE']))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        with self.lock:
+            self.hashers[upload_session.id] = (hasher, upload_session.received - remaining)
+        return hasher
+
+    def update(self, upload_id, hasher, block):
+        """Agrega un bloque escrito a continuación de lo ya calculado"""
+        hasher.update(block)
+        with self.lock:
+            _, offset = self.hashers.get(upload_id, (hasher, 0))
+            self.hashers[upload_id] = (hasher, offset + len(block))
+
+    def reset(self, upload_id):
+        with self.lock:
+            self.hashers.pop(upload_id, None)
+
+    def discard(self, upload_id):
+        self.reset(upload_id)
+
+upload_hashers = UploadHashers()
+
+class MediaStore:
+    """
+    Almacén por contenido de los archivos subidos.
+
+    Cada subida se guarda una sola vez por sha256 en uploads/.blobs y el
+    nombre que ve el usuario es un enlace duro al blob, así el mismo video
+    subido por varios operadores ocupa el espacio de una copia y comparte
+    análisis y vista previa. Los streams y los elementos y rellenos de los
+    canales suman referencias (ref_count) y al quitar la última se borran el
+    blob y sus nombres, salvo que algo todavía los use.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.lock = threading.Lock()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.folder, '.blobs', sha256[:2], sha256)
+
+    def ingest(self, temporary, sha256, name):
+        """
+        Guarda como `name` el archivo ya recibido y hasheado; si el contenido existe solo se enlaza.
+
+        Sin enlaces duros (p. ej. un sistema de archivos que no los admite),
+        o si el blob desaparece en los dos intentos, el archivo queda como
+        copia propia sin deduplicar. El nombre se registra en el almacén solo
+        cuando el enlace existe. No hace commit: el llamador confirma el
+        nombre junto con lo que lo usa (p. ej. el stream), y si la sesión
+        termina sin commit discard_ingested_files borra el archivo.
+        """
+        blob_path = self.blob_path(sha256)
+        target = os.path.join(self.folder, name)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        linked = duplicate = False
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    os.link(temporary, blob_path)
+                    duplicate = False
+                except FileExistsError:
+                    duplicate = True
+                except OSError as e:
+                    print(f"No se pudo deduplicar {name}: {str(e)}")
+                    break
+                try:
+                    os.link(blob_path, target)
+                    linked = True
+                    break
+                except FileNotFoundError:
+                    continue  # otro proceso recolectó el blob entre los dos enlaces
+            if linked:
+                os.remove(temporary)
+                blob = db.session.get(MediaBlob, sha256)
+                if not blob:
+                    blob = MediaBlob(sha256=sha256, size=os.path.getsize(blob_path), ref_count=0)
+                    db.session.add(blob)
+                db.session.add(MediaAlias(name=name, sha256=sha256))
+                if duplicate:
+                    self.share_probe(sha256, name)
+            else:
+                os.replace(temporary, target)
+            db.session.flush()
+            db.session.info.setdefault('ingested', []).append((name, sha256, linked and not duplicate))
+        file_catalog.refresh(target)
+        if linked and duplicate:
+            print(f"{name}: el contenido ya estaba guardado ({sha256[:12]}), se enlazó sin ocupar espacio")
+        return linked and duplicate
+
+    def discard(self, name, sha256, created):
+        """Borra el archivo de un ingest sin commit, y el blob si lo creó ese ingest y nadie más lo enlazó"""
+        target = os.path.join(self.folder, name)
+        with self.lock:
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+            try:
+                if created and os.stat(self.blob_path(sha256)).st_nlink == 1:
+                    os.remove(self.blob_path(sha256))
+            except OSError:
+                pass
+        file_catalog.refresh(target)
+        print(f"{name}: la subida no se confirmó, se descartó el archivo")
+
+    def share_probe(self, sha256, name):
+        """Copia el análisis de otro nombre del mismo contenido (comparten tamaño y mtime)"""
+        others = db.select(MediaAlias.name).where(MediaAlias.sha256 == sha256, MediaAlias.name != name)
+        probe = MediaProbe.query.filter(MediaProbe.path.in_(others), MediaProbe.error.is_(None)).first()
+        if not probe:
+            return
+        stat = os.stat(os.path.join(self.folder, name))
+        if (probe.size, probe.mtime) != (stat.st_size, stat.st_mtime):
+            return
+        copy = MediaProbe.query.filter_by(path=name).first() or MediaProbe(path=name)
+        for field in ('size', 'mtime', 'duration', 'format_name', 'bit_rate', 'video_codec', 'audio_codec',
+                      'width', 'height', 'frame_rate', 'probed_at'):
+            setattr(copy, field, getattr(probe, field))
+        db.session.add(copy)
+
+    def content_key(self, name):
+        """sha256 del contenido de un nombre de uploads (None si no está en el almacén)"""
+        with app.app_context():
+            alias = db.session.get(MediaAlias, name)
+            return alias.sha256 if alias else None
+
+    def retain(self, name):
+        """Suma la referencia de un stream o canal al contenido de `name` (se confirma con el commit del llamador)"""
+        alias = db.session.get(MediaAlias, name) if name else None
+        if alias:
+            db.session.execute(
+                db.update(MediaBlob).where(MediaBlob.sha256 == alias.sha256).values(ref_count=MediaBlob.ref_count + 1)
+            )
+
+    def release(self, name):
+        """Resta la referencia de un stream o canal; devuelve el sha256 si quedó sin referencias (para collect)"""
+        alias = db.session.get(MediaAlias, name) if name else None
+        if not alias:
+            return None
+        db.session.execute(
+            db.update(MediaBlob).where(MediaBlob.sha256 == alias.sha256, MediaBlob.ref_count > 0)
+            .values(ref_count=MediaBlob.ref_count - 1)
+        )
+        remaining = db.session.execute(
+            db.select(MediaBlob.ref_count).where(MediaBlob.sha256 == alias.sha256)
+        ).scalar()
+        return alias.sha256 if not remaining else None
+
+    def collect(self, sha256):
+        """
+        Borra un contenido sin referencias: sus nombres en uploads, el blob y sus análisis.
+
+        Antes de borrar se cuentan los usos reales en streams y canales; si
+        el contador quedó desfasado, se corrige y no se borra nada.
+        """
+        with self.lock:
+            blob = db.session.get(MediaBlob, sha256)
+            if not blob or blob.ref_count:
+                return
+            names = [alias.name for alias in MediaAlias.query.filter_by(sha256=sha256)]
+            streams = Stream.query.filter(Stream.input_path.in_(names)).count()
+            channels = (
+                ChannelItem.query.filter(ChannelItem.input_path.in_(names)).count()
+                + Channel.query.filter(Channel.filler_path.in_(names)).count()
+            )
+            if streams or channels:
+                blob.ref_count = streams + channels
+                db.session.commit()
+                print(f"Contenido {sha256[:12]} todavía en uso ({streams} streams, {channels} canales), no se borra")
+                return
+            size = blob.size
+            MediaAlias.query.filter_by(sha256=sha256).delete()
+            MediaProbe.query.filter(MediaProbe.path.in_(names)).delete()
+            db.session.delete(blob)
+            db.session.commit()
+            preview_renditions.discard(sha256)
+            for name in names + [None]:
+                path = os.path.join(self.folder, name) if name else self.blob_path(sha256)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            for name in names:
+                file_catalog.refresh(os.path.join(self.folder, name))
+            storage_tiers.forget(names, sha256)
+        print(f"Contenido {sha256[:12]} eliminado ({format_size(size)}): {', '.join(names) or 'sin nombres'}")
+
+    def remove_unused(self, name):
+        """Borra un archivo de uploads que no está en el almacén (anterior a la deduplicación) si nadie lo usa"""
+        path = safe_join(self.folder, name) if name else None
+        if not path or os.path.dirname(path) != self.folder or db.session.get(MediaAlias, name):
+            return
+        if (Stream.query.filter_by(input_path=name).count()
+                or ChannelItem.query.filter_by(input_path=name).count()
+                or Channel.query.filter_by(filler_path=name).count()):
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        MediaProbe.query.filter_by(path=name).delete()
+        db.session.commit()
+        file_catalog.refresh(path)
+        storage_tiers.forget([name])
+        print(f"Archivo {name} eliminado: ningún stream ni canal lo usa")
+
+media_store = MediaStore(app.config['UPLOAD_FOLDER'])
+
+@event.listens_for(db.session, 'after_commit')
+def confirm_ingested_files(session):
+    session.info.pop('ingested', None)
+
+@event.listens_for(db.session, 'after_transaction_end')
+def discard_ingested_files(session, transaction):
+    """Los archivos guardados por ingest en una transacción que terminó sin commit (rollback o sesión cerrada)"""
+    if transaction.parent is None:
+        for name, sha256, created in session.info.pop('ingested', ()):
+            media_store.discard(name, sha256, created)
+
+def move_file(source, target):
+    """Mueve un archivo aunque el destino esté en otro disco; conserva la fecha de modificación"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.replace(source, target)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    temporary = f'{target}.partial'
+    try:
+        shutil.copy2(source, temporary)
+        os.replace(temporary, target)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    os.remove(source)
+
+class StorageTiers:
+    """
+    Ciclo de vida del almacenamiento: uploads es el disco caliente y COLD_STORAGE_FOLDER el frío.
+
+    El líder revisa cada STORAGE_CHECK_INTERVAL: primero trae de vuelta lo que
+    los streams activos usan en las próximas STORAGE_PREFETCH_HOURS y después,
+    si uploads supera la cuota (o hay contenido sin usar hace
+    STORAGE_COLD_AFTER_DAYS), mueve al frío lo usado hace más tiempo. El
+    último uso es la última transmisión de un stream que lo usa o, si nunca
+    salió, la fecha de modificación del archivo. Un contenido deduplicado se
+    mueve entero (el blob) y sus nombres desaparecen de uploads hasta que se
+    trae. No se mueven los archivos de canales 24/7 ni los de streams en
+    curso o próximos; el runner trae el archivo antes de lanzar ffmpeg si la
+    anticipación no llegó a tiempo.
+    """
+    def __init__(self, hot_folder, cold_folder):
+        self.hot_folder = hot_folder
+        self.cold_folder = cold_folder
+        self.lock = threading.Lock()
+        self.running = threading.Lock()
+
+    def hot_path(self, name):
+        return os.path.join(self.hot_folder, name)
+
+    def cold_path(self, name):
+        return os.path.join(self.cold_folder, name)
+
+    def cold_blob_path(self, sha256):
+        return self.cold_path(os.path.relpath(media_store.blob_path(sha256), self.hot_folder))
+
+    def is_cold(self, name):
+        return bool(self.cold_folder and name and db.session.get(ColdFile, name))
+
+    def tick(self):
+        """Lanza una revisión en segundo plano (mover archivos grandes no debe frenar el lease)"""
+        if self.cold_folder and not self.running.locked():
+            threading.Thread(target=self.check, name='storage-tiers', daemon=True).start()
+
+    def check(self):
+        if not self.running.acquire(blocking=False):
+            return
+        try:
+            with app.app_context():
+                self.prefetch()
+                self.evict()
+        except Exception as e:
+            print(f"Error al revisar el almacenamiento: {str(e)}")
+        finally:
+            self.running.release()
+
+    def prefetch(self):
+        """Trae del frío los archivos de los streams activos que salen en las próximas horas"""
+        horizon = datetime.now() + timedelta(hours=app.config['STORAGE_PREFETCH_HOURS'])
+        names = db.session.execute(
+            db.select(Stream.input_path)
+            .join(ColdFile, ColdFile.name == Stream.input_path)
+            .where(Stream.is_active.is_(True), Stream.next_run_at <= horizon)
+            .group_by(Stream.input_path)
+            .order_by(db.func.min(Stream.next_run_at))
+        ).scalars().all()
+        for name in names:
+            self.recall(name)
+
+    def pinned_names(self):
+        """Archivos que no se mueven: streams en curso o próximos y todo lo que usan los canales"""
+        horizon = datetime.now() + timedelta(hours=app.config['STORAGE_PREFETCH_HOURS'])
+        streams = db.session.execute(
+            db.select(Stream.input_path).where(db.or_(
+                Stream.status.in_(('streaming', 'queued')),
+                db.and_(Stream.is_active.is_(True), Stream.next_run_at <= horizon)
+            ))
+        ).scalars()
+        items = db.session.execute(db.select(ChannelItem.input_path)).scalars()
+        fillers = db.session.execute(db.select(Channel.filler_path).where(Channel.filler_path.is_not(None))).scalars()
+        return set(streams) | set(items) | set(fillers)
+
+    def hot_units(self):
+        """Contenidos del disco caliente: nombres, tamaño (una vez por blob) y último uso"""
+        aliases = dict(db.session.execute(db.select(MediaAlias.name, MediaAlias.sha256)).all())
+        played = dict(db.session.execute(
+            db.select(Stream.input_path, db.func.max(Stream.last_played)).group_by(Stream.input_path)
+        ).all())
+        units = {}
+        files, _ = file_catalog.listing()
+        for entry in files:
+            sha256 = aliases.get(entry['name'])
+            unit = units.setdefault(sha256 or entry['name'], {
+                'sha256': sha256, 'names': [], 'size': entry['size'],
+                'last_used': datetime.fromtimestamp(entry['mtime'])
+            })
+            unit['names'].append(entry['name'])
+            if played.get(entry['name']):
+                unit['last_used'] = max(unit['last_used'], played[entry['name']])
+        # Originales de grabaciones ya convertidas a MP4 (RECORD_KEEP_SOURCE)
+        for job in RecordingJob.query.filter_by(status='completed'):
+            name = os.path.join('receiving', job.source)
+            try:
+                stat = os.stat(self.hot_path(name))
+            except OSError:
+                continue
+            units[name] = {
+                'sha256': None, 'names': [name], 'size': stat.st_size,
+                'last_used': job.finished_at or datetime.fromtimestamp(stat.st_mtime)
+            }
+        return list(units.values())
+
+    def evict(self):
+        """Mueve al frío lo menos usado si se pasó la cuota (hasta STORAGE_HOT_TARGET) o lo viejo"""
+        quota = app.config['STORAGE_HOT_QUOTA_GB'] * 1024 ** 3
+        max_age = app.config['STORAGE_COLD_AFTER_DAYS']
+        stale_before = datetime.now() - timedelta(days=max_age) if max_age else None
+        units = self.hot_units()
+        used = sum(unit['size'] for unit in units)
+        over_quota = quota and used > quota
+        pinned = self.pinned_names()
+        for unit in sorted(units, key=lambda unit: unit['last_used']):
+            over = over_quota and used > quota * app.config['STORAGE_HOT_TARGET']
+            stale = stale_before and unit['last_used'] < stale_before
+            if not over and not stale:
+                break  # ordenado por último uso: los siguientes tampoco califican
+            if pinned.intersection(unit['names']):
+                continue
+            if self.evict_unit(unit):
+                used -= unit['size']
+        STORAGE_HOT_BYTES.set(used)
+        if quota and used > quota:
+            print(f"Advertencia: uploads ocupa {format_size(used)} y la cuota es {format_size(quota)}; "
+                  f"el resto está en uso por streams próximos o canales")
+
+    def evict_unit(self, unit):
+        names, sha256 = unit['names'], unit['sha256']
+        with self.lock:
+            try:
+                if sha256:
+                    move_file(media_store.blob_path(sha256), self.cold_blob_path(sha256))
+                else:
+                    move_file(self.hot_path(names[0]), self.cold_path(names[0]))
+            except OSError as e:
+                print(f"Error al mover {names[0]} al almacenamiento frío: {str(e)}")
+                return False
+            for name in names:
+                db.session.merge(ColdFile(
+                    name=name, sha256=sha256, size=unit['size'], last_used_at=unit['last_used'], moved_at=datetime.now()
+                ))
+            db.session.commit()
+            if sha256:
+                for name in names:
+                    try:
+                        os.remove(self.hot_path(name))
+                    except OSError:
+                        pass
+        for name in names:
+            file_catalog.refresh(self.hot_path(name))
+        STORAGE_EVICTIONS.inc()
+        print(f"Movido al almacenamiento frío ({format_size(unit['size'])}, último uso "
+              f"{unit['last_used']:%Y-%m-%d %H:%M}): {', '.join(names)}")
         return True
-    except Exception as e:
-        print(f"Error al crear la carpeta de uploads: {str(e)}")
-        return False
 
-def calculate_next_run(stream):
-    """Calcula la próxima ejecución basada en el tipo de repetición"""
-    if not stream.last_played:
-        return stream.scheduled_time
+    def recall(self, name):
+        """Trae un archivo del frío (con todos los nombres de su contenido); True si quedó en uploads"""
+        if not self.cold_folder or not name:
+            return False
+        with self.lock:
+            cold = db.session.get(ColdFile, name)
+            if not cold:
+                return False
+            start = time.perf_counter()
+            sha256 = cold.sha256
+            try:
+                if sha256:
+                    names = [row.name for row in ColdFile.query.filter_by(sha256=sha256)]
+                    blob_path, cold_blob = media_store.blob_path(sha256), self.cold_blob_path(sha256)
+                    # Si mientras tanto se volvió a subir el mismo contenido, el blob ya está en uploads
+                    if not os.path.exists(blob_path):
+                        move_file(cold_blob, blob_path)
+                    for alias in names:
+                        try:
+                            os.link(blob_path, self.hot_path(alias))
+                        except FileExistsError:
+                            pass
+                    if os.path.exists(cold_blob):
+                        os.remove(cold_blob)
+                else:
+                    names = [name]
+                    move_file(self.cold_path(name), self.hot_path(name))
+            except OSError as e:
+                print(f"Error al traer {name} del almacenamiento frío: {str(e)}")
+                return False
+            ColdFile.query.filter(ColdFile.name.in_(names)).delete()
+            db.session.commit()
+        for alias in names:
+            file_catalog.refresh(self.hot_path(alias))
+        STORAGE_RECALLS.inc()
+        print(f"Traído del almacenamiento frío en {time.perf_counter() - start:.1f}s: {', '.join(names)}")
+        return True
+
+    def forget(self, names, sha256=None):
+        """Borra las copias en frío de archivos eliminados"""
+        if not self.cold_folder:
+            return
+        ColdFile.query.filter(ColdFile.name.in_(names)).delete()
+        db.session.commit()
+        for path in [self.cold_path(name) for name in names] + ([self.cold_blob_path(sha256)] if sha256 else []):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def summary(self):
+        """Uso del disco caliente (sin contar dos veces un blob) y archivos en el frío"""
+        cold = ColdFile.query.order_by(ColdFile.moved_at.desc()).all()
+        return {
+            'enabled': bool(self.cold_folder),
+            'hot_quota_bytes': int(app.config['STORAGE_HOT_QUOTA_GB'] * 1024 ** 3),
+            'hot_bytes': sum(unit['size'] for unit in self.hot_units()),
+            'cold_bytes': sum({row.sha256 or row.name: row.size for row in cold}.values()),
+            'cold_files': [row.to_dict() for row in cold]
+        }
+
+storage_tiers = StorageTiers(app.config['UPLOAD_FOLDER'], app.config['COLD_STORAGE_FOLDER'])
+
+def recall_cold_file(name):
+    with app.app_context():
+        storage_tiers.recall(name)
+
+def cleanup_upload_sessions():
+    """Descarta las subidas por partes sin actividad durante UPLOAD_SESSION_TTL horas"""
+    limit = datetime.now() - timedelta(hours=app.config['UPLOAD_SESSION_TTL'])
+    stale = UploadSession.query.filter(UploadSession.status == 'uploading', UploadSession.updated_at < limit).all()
+    for upload_session in stale:
+        try:
+            os.remove(get_partial_path(upload_session.id))
+        except OSError:
+            pass
+        upload_hashers.discard(upload_session.id)
+        db.session.delete(upload_session)
+    if stale:
+        db.session.commit()
+        print(f"Subidas abandonadas eliminadas: {len(stale)}")
+
+def ensure_upload_folder():
+    """Asegura que existe la carpeta de uploads"""
+    try:
+        if not os.path.exists(UPLOAD_FOLDER):
+            os.makedirs(UPLOAD_FOLDER)
+            print(f"Carpeta de uploads creada en: {UPLOAD_FOLDER}")
+        return True
+    except Exception as e:
+        print(f"Error al crear la carpeta de uploads: {str(e)}")
+        return False
+
+# Tipos de repetición soportados. 'hourly' usa recurrence_rule = N (cada N horas),
+# 'weekdays' una lista de días (0=lunes ... 6=domingo) y 'cron' una expresión crontab.
+RECURRENCE_TYPES = ('once', 'daily', 'weekly', 'monthly', 'hourly', 'weekdays', 'cron')
+RECURRENCE_EPOCH = datetime(2000, 1, 3)  # lunes, referencia para las series de periodo fijo
+
+CRONTAB_WEEKDAYS = ('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat')
+
+def crontab_weekdays(field):
+    """
+    Convierte el día de la semana de crontab (0 o 7 = domingo) a la numeración de APScheduler (0 = lunes).
+
+    CronTrigger.from_crontab toma los números tal cual, así "1-5" sería de
+    martes a sábado. Se expande el campo a días sueltos para que los rangos
+    que cruzan el domingo (p. ej. "5-1" no es válido, pero "0-3" sí) sigan
+    funcionando con la otra numeración.
+    """
+    if field == '*':
+        return field
+
+    def to_day(token):
+        token = token.strip().lower()
+        if token.isdigit() and int(token) <= 7:
+            return int(token)
+        if token in CRONTAB_WEEKDAYS:
+            return CRONTAB_WEEKDAYS.index(token)
+        raise ValueError(f'Día de la semana inválido: {token}')
+
+    days = set()
+    for item in field.split(','):
+        span, _, step = item.partition('/')
+        if step and (not step.isdigit() or int(step) < 1):
+            raise ValueError(f'Paso inválido: {item}')
+        if span == '*':
+            first, last = 0, 6
+        else:
+            first, _, last = span.partition('-')
+            first = to_day(first)
+            last = to_day(last) if last else (7 if step else first)
+        if first > last:
+            raise ValueError(f'Rango de días inválido: {item}')
+        days.update(day % 7 for day in range(first, last + 1, int(step or 1)))
+    return ','.join(str((day - 1) % 7) for day in sorted(days, key=lambda day: (day - 1) % 7))
+
+def crontab_trigger(rule, timezone=None):
+    """CronTrigger para una expresión crontab de 5 campos con el día de la semana de crontab"""
+    fields = rule.split()
+    if len(fields) != 5:
+        raise ValueError(f'Se esperan 5 campos, hay {len(fields)}')
+    minute, hour, day, month, day_of_week = fields
+    return CronTrigger(
+        minute=minute, hour=hour, day=day, month=month, day_of_week=crontab_weekdays(day_of_week),
+        timezone=timezone
+    )
+
+def parse_recurrence_rule(repeat_type, rule):
+    """Valida la regla de repetición y la devuelve normalizada (ValueError si es inválida)"""
+    rule = (rule or '').strip()
+    if repeat_type not in RECURRENCE_TYPES:
+        raise ValueError('Tipo de repetición inválido')
+    if repeat_type == 'hourly':
+        if not rule.isdigit() or int(rule) < 1:
+            raise ValueError('La repetición por horas requiere un número de horas mayor que cero')
+        return str(int(rule))
+    if repeat_type == 'weekdays':
+        try:
+            days = sorted({int(day) for day in rule.split(',') if day.strip()})
+        except ValueError:
+            raise ValueError('Los días de la semana deben ser números del 0 (lunes) al 6 (domingo)')
+        if not days or days[0] < 0 or days[-1] > 6:
+            raise ValueError('Los días de la semana deben ser números del 0 (lunes) al 6 (domingo)')
+        return ','.join(str(day) for day in days)
+    if repeat_type == 'cron':
+        try:
+            crontab_trigger(rule)
+        except ValueError as e:
+            raise ValueError(f'Expresión cron inválida: {str(e)}')
+        return ' '.join(rule.split())
+    return None
+
+def add_months(value, months):
+    """Suma meses a una fecha ajustando el día al último día del mes si es necesario"""
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    next_month = datetime(year + month // 12, month % 12 + 1, 1)
+    last_day = (next_month - timedelta(days=1)).day
+    return value.replace(year=year, month=month, day=min(value.day, last_day))
+
+def recurrence_key(scheduled_time, repeat_type, rule):
+    """
+    Clave de grupo de una serie recurrente.
+
+    Todas las series con la misma clave comparten la próxima ocurrencia una vez
+    iniciadas, por lo que basta evaluar cada clave una sola vez.
+    """
+    if repeat_type in ('daily', 'weekly', 'hourly'):
+        period = {
+            'daily': timedelta(days=1),
+            'weekly': timedelta(weeks=1),
+            'hourly': timedelta(hours=int(rule or 1))
+        }[repeat_type]
+        return ('period', period, (scheduled_time - RECURRENCE_EPOCH) % period)
+    if repeat_type == 'monthly':
+        return ('monthly', scheduled_time.day, scheduled_time.time())
+    if repeat_type == 'weekdays':
+        return ('weekdays', rule, scheduled_time.time())
+    if repeat_type == 'cron':
+        return ('cron', rule)
+    return None
+
+def next_for_key(key, after):
+    """Primera ocurrencia estrictamente posterior a `after` para una clave de recurrencia"""
+    kind = key[0]
+    if kind == 'period':
+        _, period, phase = key
+        base = RECURRENCE_EPOCH + phase
+        return base + ((after - base) // period + 1) * period
+    if kind == 'monthly':
+        _, day, time_of_day = key
+        anchor = datetime.combine(datetime(2000, 1, day).date(), time_of_day)
+        months = (after.year - anchor.year) * 12 + after.month - anchor.month
+        candidate = add_months(anchor, months)
+        return candidate if candidate > after else add_months(anchor, months + 1)
+    if kind == 'weekdays':
+        _, rule, time_of_day = key
+        days = {int(day) for day in rule.split(',')}
+        for offset in range(8):
+            candidate = datetime.combine(after.date() + timedelta(days=offset), time_of_day)
+            if candidate > after and candidate.weekday() in days:
+                return candidate
+        return None
+    if kind == 'cron':
+        trigger = crontab_trigger(key[1], timezone=scheduler.timezone)
+        fire_time = trigger.get_next_fire_time(
+            None, localize(after + timedelta(microseconds=1), scheduler.timezone)
+        )
+        return fire_time.replace(tzinfo=None) if fire_time else None
+    return None
+
+def compute_next_runs(rows, after):
+    """
+    Calcula la próxima ejecución posterior a `after` para muchas series a la vez.
+
+    `rows` son tuplas (id, scheduled_time, repeat_type, recurrence_rule), donde
+    scheduled_time es el inicio de la serie. Las filas se agrupan por clave de
+    recurrencia y cada grupo se evalúa una sola vez. Devuelve {id: datetime|None}.
+    """
+    results = {}
+    groups = {}
+    for stream_id, scheduled_time, repeat_type, rule in rows:
+        if repeat_type not in RECURRENCE_TYPES or repeat_type == 'once':
+            results[stream_id] = scheduled_time if scheduled_time > after else None
+            continue
+        if scheduled_time > after and repeat_type in ('daily', 'weekly', 'monthly', 'hourly'):
+            # Serie aún no iniciada: la primera ocurrencia es su hora programada
+            results[stream_id] = scheduled_time
+            continue
+        # Las series de días/cron no iniciadas se evalúan desde su inicio
+        bound = max(after, scheduled_time - timedelta(microseconds=1))
+        groups.setdefault((recurrence_key(scheduled_time, repeat_type, rule), bound), []).append(stream_id)
+
+    for (key, bound), stream_ids in groups.items():
+        next_run = next_for_key(key, bound)
+        for stream_id in stream_ids:
+            results[stream_id] = next_run
+    return results
+
+def compute_next_run(stream, after):
+    """Próxima ejecución de un único stream posterior a `after`"""
+    return compute_next_runs(
+        [(stream.id, stream.scheduled_time, stream.repeat_type, stream.recurrence_rule)], after
+    )[stream.id]
+
+def initial_next_run(stream):
+    """Primera ejecución al crear o editar un stream, admitiendo el margen de misfire"""
+    after = max(
+        datetime.now() - timedelta(seconds=get_misfire_grace(stream.repeat_type)),
+        stream.scheduled_time - timedelta(microseconds=1)
+    )
+    return compute_next_run(stream, after)
+
+def recompute_next_runs(stream_ids=None, after=None):
+    """
+    Recalcula next_run_at de los streams recurrentes activos en una sola transacción.
+
+    Sirve para adelantar miles de series tras una caída del servicio: se leen
+    solo las columnas necesarias, se evalúa una vez por grupo de recurrencia y
+    se escribe con un UPDATE masivo por clave primaria.
+    """
+    after = after or datetime.now()
+    query = db.select(Stream.id, Stream.scheduled_time, Stream.repeat_type, Stream.recurrence_rule).where(
+        Stream.is_active == True,
+        Stream.repeat_type != 'once',
+        Stream.status != 'streaming'
+    )
+    if stream_ids is not None:
+        query = query.where(Stream.id.in_(stream_ids))
+    next_runs = compute_next_runs(db.session.execute(query).all(), after)
+    if next_runs:
+        db.session.execute(db.update(Stream), [
+            {'id': stream_id, 'next_run_at': next_run} for stream_id, next_run in next_runs.items()
+        ])
+    db.session.commit()
+    return next_runs
+
+def get_misfire_grace(repeat_type):
+    grace_times = app.config['MISFIRE_GRACE_TIME']
+    return grace_times.get(repeat_type, grace_times['once'])
+
+def get_absolute_path(relative_path):
+    """Convierte una ruta relativa a absoluta, relativa al directorio de uploads"""
+    if os.path.isabs(relative_path):
+        return relative_path
+    return os.path.join(app.config['UPLOAD_FOLDER'], relative_path)
+
+def get_broadcast_profile(video_params):
+    """Clasifica los parámetros de ffmpeg en el perfil 'copy' o 'transcode'"""
+    params = (video_params or '-c:v copy -c:a aac -f flv').split()
+    for flag, value in zip(params, params[1:]):
+        if flag in ('-c:v', '-vcodec', '-codec:v', '-c', '-codec'):
+            return 'copy' if value == 'copy' else 'transcode'
+    # Sin códec de video explícito ffmpeg transcodifica con el códec por defecto
+    return 'transcode'
+
+# Presets de x264/x265 que no sostienen tiempo real en hardware común
+SLOW_PRESETS = ('slow', 'slower', 'veryslow', 'placebo')
+# Opciones que arma el runner (entrada, búsqueda, progreso e hilos) y no pueden venir en los parámetros
+RESERVED_FFMPEG_OPTIONS = ('-i', '-re', '-ss', '-progress', '-y', '-threads')
+
+def validate_video_params(video_params):
+    """Valida los parámetros de salida de ffmpeg; lanza ValueError con el motivo"""
+    params = (video_params or '').split()
+    if not params:
+        raise ValueError('Faltan los parámetros de video')
+    for flag, value in zip(params, params[1:] + ['']):
+        if flag in RESERVED_FFMPEG_OPTIONS or flag.startswith('-threads:'):
+            raise ValueError(f'La opción {flag} la asigna el runner; quítela de los parámetros')
+        if flag.split(':')[0] == '-preset' and value in SLOW_PRESETS:
+            raise ValueError(f'El preset {value} no sostiene tiempo real; use medium o uno más rápido')
+    if '-f' not in params[:-1]:
+        raise ValueError('Falta el formato de salida (p. ej. -f flv)')
+
+def parse_core_list(value):
+    """Convierte una lista de núcleos como "0-3,6" en [0, 1, 2, 3, 6]"""
+    cores = set()
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        first, _, last = part.partition('-')
+        cores.update(range(int(first), int(last or first) + 1))
+    return sorted(cores)
+
+class CpuAllocator:
+    """
+    Reparte los núcleos entre los ffmpeg que transcodifican.
+
+    Cada proceso recibe tantos núcleos como el costo de sus parámetros
+    (redondeado hacia arriba), elegidos entre los menos ocupados; con eso
+    se fija -threads y, con CPU_PINNING, la afinidad del proceso. Así N
+    transcodificaciones se reparten los núcleos en vez de usar todas cada una.
+    """
+    def __init__(self, cores):
+        self.cores = list(cores)
+        self.load = {core: 0 for core in self.cores}
+        self.assigned = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key, count):
+        with self.lock:
+            self._release(key)
+            count = max(1, min(count, len(self.cores)))
+            chosen = sorted(sorted(self.cores, key=lambda core: (self.load[core], core))[:count])
+            for core in chosen:
+                self.load[core] += 1
+            self.assigned[key] = chosen
+            return chosen
+
+    def release(self, key):
+        with self.lock:
+            self._release(key)
+
+    def _release(self, key):
+        for core in self.assigned.pop(key, []):
+            self.load[core] -= 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'cores': list(self.cores),
+                'load': dict(self.load),
+                'assigned': {str(key): list(cores) for key, cores in self.assigned.items()}
+            }
+
+def available_cores():
+    """Núcleos configurados en ENCODING_CORES, o los que el sistema permite usar al proceso"""
+    if app.config['ENCODING_CORES']:
+        return parse_core_list(app.config['ENCODING_CORES'])
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+cpu_allocator = CpuAllocator(available_cores())
+
+def encoding_threads(video_params, cpu_cost=None):
+    """Núcleos (y -threads) para unos parámetros; None si no transcodifican"""
+    if get_broadcast_profile(video_params) != 'transcode':
+        return None
+    cost = cpu_cost if cpu_cost else app.config['ENCODING_DEFAULT_COST']
+    return max(1, min(math.ceil(cost), len(cpu_allocator.cores)))
+
+def allocate_encoding_cores(key, video_params):
+    """
+    Reserva núcleos para un ffmpeg que transcodifica (lista vacía si copia).
+
+    El costo sale del perfil calibrado con esos mismos parámetros; sin
+    perfil se usa ENCODING_DEFAULT_COST. Se libera con cpu_allocator.release(key).
+    """
+    params = video_params or '-c:v copy -c:a aac -f flv'
+    profile = EncodingProfile.query.filter_by(video_params=params).order_by(EncodingProfile.calibrated_at.desc()).first()
+    threads = encoding_threads(params, profile.cpu_cost if profile else None)
+    if not threads or '-threads' in params.split():
+        return []
+    return cpu_allocator.acquire(key, threads)
+
+calibration_lock = threading.Lock()
+
+def calibrate_encoding_profile(profile_id, input_path=None):
+    """
+    Mide cuántos núcleos ocupa un perfil para codificar en tiempo real.
+
+    Codifica CALIBRATION_SECONDS de la fuente sintética (o de input_path)
+    sin -re hacia /dev/null y toma el tiempo de CPU del proceso con wait4.
+    Las calibraciones corren de a una para no medirse entre sí.
+    """
+    with app.app_context(), calibration_lock:
+        profile = db.session.get(EncodingProfile, profile_id)
+        if not profile:
+            return
+        seconds = app.config['CALIBRATION_SECONDS']
+        if input_path:
+            source = ['-i', get_absolute_path(input_path)]
+            duration = media_probes.get_duration(input_path)
+            if duration:
+                seconds = min(seconds, duration)
+        elif get_broadcast_profile(profile.video_params) == 'copy':
+            profile.calibration_status = 'error'
+            profile.calibration_error = 'Un perfil que copia el video se calibra con un archivo (input_path)'
+            db.session.commit()
+            return
+        else:
+            source = [
+                '-f', 'lavfi', '-i', app.config['CALIBRATION_SOURCE'],
+                '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000'
+            ]
+        command = ['ffmpeg', '-hide_banner', '-nostats', '-y'] + source + ['-t', str(seconds)]
+        command += profile.video_params.split() + [os.devnull]
+        print(f"Calibrando perfil {profile.name}: {' '.join(command)}")
+        try:
+            started = time.monotonic()
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+            stderr = process.stderr.read().decode('utf-8', errors='replace')
+            process.stderr.close()
+            # wait4 devuelve el uso de recursos de este hijo (RUSAGE_CHILDREN sumaría las transmisiones)
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            elapsed = time.monotonic() - started
+        except OSError as e:
+            profile.calibration_status = 'error'
+            profile.calibration_error = str(e)[:500]
+            db.session.commit()
+            return
+        if process.returncode != 0:
+            profile.calibration_status = 'error'
+            profile.calibration_error = (stderr.strip().splitlines() or [f'código {process.returncode}'])[-1][:500]
+        else:
+            profile.cpu_cost = round((usage.ru_utime + usage.ru_stime) / seconds, 3)
+            profile.speed = round(seconds / elapsed, 2) if elapsed > 0 else None
+            profile.calibration_status = 'calibrated'
+            profile.calibrated_at = datetime.now()
+            profile.calibration_error = None
+            if profile.speed is not None and profile.speed < 1:
+                profile.calibration_error = f'No alcanza tiempo real: {profile.speed}x con todos los núcleos'
+            print(f"Perfil {profile.name}: {profile.cpu_cost} núcleos, {profile.speed}x")
+        db.session.commit()
+        publish_event('encoding_profile', profile.to_dict())
+
+def summarize_probe(info):
+    """Extrae de la salida de ffprobe los datos que usan el panel y el scheduler"""
+    def to_number(value, cast=float):
+        try:
+            return cast(value) if value not in (None, '', 'N/A') else None
+        except ValueError:
+            return None
+
+    def to_rate(value):
+        try:
+            num, den = (value or '').split('/')
+            return round(int(num) / int(den), 3) if int(den) else None
+        except ValueError:
+            return None
+
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+    media_format = info.get('format', {})
+    return {
+        'duration': to_number(media_format.get('duration')),
+        'format_name': media_format.get('format_name'),
+        'bit_rate': to_number(media_format.get('bit_rate'), int),
+        'video_codec': video.get('codec_name'),
+        'audio_codec': audio.get('codec_name'),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'frame_rate': to_rate(video.get('avg_frame_rate')),
+    }
+
+class MediaProbeCache:
+    """
+    Caché de metadatos de archivos de entrada.
+
+    ffprobe se ejecuta una sola vez por (ruta, tamaño, mtime) en un pool de
+    hilos; el resultado queda en la tabla media_probe y se copia al catálogo
+    de archivos para que /list_files no tenga que consultar la base. Si
+    ffprobe ni siquiera se pudo ejecutar, el fallo es del entorno y no del
+    archivo: no se guarda y solo se espera `retry_after` segundos antes de
+    volver a intentarlo.
+    """
+    def __init__(self, workers, retry_after):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ffprobe')
+        self.retry_after = retry_after
+        self.pending = {}
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def _file_key(self, path):
+        try:
+            stat = os.stat(get_absolute_path(path))
+        except OSError:
+            return None
+        return (path, stat.st_size, stat.st_mtime)
+
+    def request(self, path):
+        """Encola el análisis del archivo si no hay un resultado válido ni uno en curso"""
+        key = self._file_key(path)
+        if not key:
+            return None
+        with self.lock:
+            failed_at = self.failures.get(key)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_after:
+                return None
+            if key not in self.pending:
+                self.pending[key] = self.executor.submit(self._probe, key)
+            return self.pending[key]
+
+    def wait(self, path, timeout):
+        """Analiza el archivo (si hace falta) esperando como máximo `timeout` segundos"""
+        future = self.request(path)
+        if future:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+        return self.get(path)
+
+    def _probe(self, key):
+        path, size, mtime = key
+        try:
+            with app.app_context():
+                probe = MediaProbe.query.filter_by(path=path).first()
+                if probe and probe.size == size and probe.mtime == mtime:
+                    # Puede venir copiado de otro nombre del mismo contenido (MediaStore)
+                    file_catalog.set_probe(path, size, mtime, probe.to_dict())
+                    return
+                try:
+                    summary, error = summarize_probe(ffmpeg.probe(get_absolute_path(path))), None
+                except ffmpeg.Error as e:
+                    stderr = e.stderr.decode('utf-8', 'replace') if e.stderr else ''
+                    summary, error = {}, (stderr.strip().splitlines() or [str(e)])[-1][:500]
+                except OSError as e:
+                    with self.lock:
+                        self.failures[key] = time.monotonic()
+                    print(f"No se pudo ejecutar ffprobe para {path}: {str(e)}")
+                    return
+                with self.lock:
+                    self.failures.pop(key, None)
+                if not probe:
+                    probe = MediaProbe(path=path)
+                    db.session.add(probe)
+                for field in ('duration', 'format_name', 'bit_rate', 'video_codec', 'audio_codec',
+                              'width', 'height', 'frame_rate'):
+                    setattr(probe, field, summary.get(field))
+                probe.size, probe.mtime, probe.error = size, mtime, error
+                probe.probed_at = datetime.now()
+                db.session.commit()
+                schedule_index.invalidate(paths=[path])
+                file_catalog.set_probe(path, size, mtime, probe.to_dict())
+                if error:
+                    print(f"Error al analizar {path}: {error}")
+        except Exception as e:
+            print(f"Error al analizar {path}: {str(e)}")
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def get(self, path):
+        """Metadatos del archivo si el análisis guardado sigue siendo válido"""
+        key = self._file_key(path)
+        if not key:
+            return None
+        with db.session.no_autoflush:
+            probe = MediaProbe.query.filter_by(path=path).first()
+        if probe and (probe.size, probe.mtime) == key[1:]:
+            return probe.to_dict()
+        return None
+
+    def get_duration(self, path):
+        """Duración en segundos del archivo (None si aún no se analizó)"""
+        probe = self.get(path)
+        return probe['duration'] if probe else None
+
+    def load_all(self):
+        """Resultados guardados por ruta, leídos en una sola consulta"""
+        try:
+            with app.app_context():
+                return {probe.path: probe for probe in MediaProbe.query.all()}
+        except Exception as e:
+            print(f"Error al leer los análisis de archivos: {str(e)}")
+            return {}
+
+media_probes = MediaProbeCache(app.config['PROBE_WORKERS'], app.config['PROBE_RETRY_SECONDS'])
+
+class PreviewRenditions:
+    """
+    Versiones livianas (MP4 de baja resolución con +faststart) para previsualizar.
+
+    Se generan una sola vez por contenido en uploads/.previews (los nombres
+    que son enlaces al mismo blob comparten la versión) y se regeneran solo
+    si el original es más nuevo que la versión guardada.
+    """
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def path_for(self, filename):
+        key = media_store.content_key(filename) or filename
+        return os.path.join(app.config['UPLOAD_FOLDER'], '.previews', f'{key}.mp4')
+
+    def is_ready(self, filename):
+        try:
+            return os.path.getmtime(self.path_for(filename)) >= os.path.getmtime(get_absolute_path(filename))
+        except OSError:
+            return False
+
+    def request(self, filename):
+        """Encola la generación si la versión liviana no existe o quedó vieja"""
+        target = self.path_for(filename)
+        with self.lock:
+            # Por destino: dos nombres del mismo contenido comparten la versión liviana
+            if target in self.pending or self.is_ready(filename):
+                return
+            self.pending.add(target)
+        self.executor.submit(self._generate, filename, target)
+
+    def _generate(self, filename, target):
+        temporary = f'{target}.tmp.mp4'
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            command = [
+                'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-i', get_absolute_path(filename),
+                '-vf', f"scale=-2:'min({app.config['PREVIEW_HEIGHT']},ih)'",
+                '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '30', '-g', '48',
+                '-c:a', 'aac', '-b:a', '96k', '-ac', '2',
+                '-movflags', '+faststart', temporary
+            ]
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+            if result.returncode != 0:
+                print(f"Error al generar la vista previa de {filename}: {result.stderr.decode('utf-8', 'replace').strip()[-500:]}")
+                return
+            os.replace(temporary, target)
+            print(f"Vista previa generada: {filename}")
+        except Exception as e:
+            print(f"Error al generar la vista previa de {filename}: {str(e)}")
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            with self.lock:
+                self.pending.discard(target)
+
+    def discard(self, filename):
+        """Elimina la versión liviana de un archivo borrado"""
+        try:
+            os.remove(self.path_for(filename))
+        except OSError:
+            pass
+
+preview_renditions = PreviewRenditions(app.config['PREVIEW_WORKERS'])
+
+class PostRecordPipeline:
+    """
+    Cola de post-grabación: remux de .flv a MP4, análisis, catálogo y retransmisión.
+
+    Reemplaza al exec_record_done de nginx, que lanzaba un ffmpeg por cada
+    grabación terminada sin límite y sin avisar a la aplicación. Solo el runner
+    líder procesa la cola; el estado de cada grabación queda en recording_job.
+    """
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='postrecord')
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def receiving_path(self, source):
+        return os.path.join(app.config['UPLOAD_FOLDER'], 'receiving', source)
+
+    def submit(self, source, retry=False):
+        """Encola una grabación terminada (nombre del .flv); las ya procesadas solo se repiten con retry"""
+        with self.lock:
+            if source in self.pending:
+                return
+            self.pending.add(source)
+        try:
+            with app.app_context():
+                job = RecordingJob.query.filter_by(source=source).first()
+                if job and job.status in ('completed', 'error') and not retry:
+                    with self.lock:
+                        self.pending.discard(source)
+                    return
+                if not job:
+                    job = RecordingJob(source=source)
+                    db.session.add(job)
+                job.status, job.error = 'queued', None
+                db.session.commit()
+        except Exception:
+            with self.lock:
+                self.pending.discard(source)
+            raise
+        print(f"Grabación {source} en cola de post-grabación")
+        self.executor.submit(self._process, source)
+
+    def recover(self):
+        """Al tomar el liderazgo, encola las grabaciones terminadas que quedaron sin procesar"""
+        folder = os.path.join(app.config['UPLOAD_FOLDER'], 'receiving')
+        cutoff = time.time() - app.config['RECORD_FINISH_SECONDS']
+        with app.app_context():
+            done = {job.source for job in RecordingJob.query.filter(RecordingJob.status.in_(('completed', 'error')))}
+        try:
+            with os.scandir(folder) as entries:
+                finished = [
+                    entry.name for entry in entries
+                    if entry.name.endswith('.flv') and entry.name not in done and entry.stat().st_mtime < cutoff
+                ]
+        except OSError:
+            return
+        for source in finished:
+            self.submit(source)
+
+    def output_name(self, source):
+        """Nombre del MP4 en uploads (con sufijo si ya existe uno igual)"""
+        stem = os.path.splitext(source)[0]
+        name = f'{stem}.mp4'
+        for counter in itertools.count(1):
+            if not os.path.exists(get_absolute_path(name)):
+                return name
+            name = f'{stem}-{counter}.mp4'
+
+    def _process(self, source):
+        temporary = None
+        try:
+            with app.app_context():
+                job = RecordingJob.query.filter_by(source=source).first()
+                input_path = self.receiving_path(source)
+                if not os.path.exists(input_path):
+                    raise RuntimeError('La grabación ya no existe en receiving')
+                output = self.output_name(source)
+                target = get_absolute_path(output)
+                # Oculto (empieza con punto) para que el catálogo no lo muestre a medio escribir
+                temporary = os.path.join(app.config['UPLOAD_FOLDER'], f'.{output}.tmp.mp4')
+                job.status, job.started_at = 'remuxing', datetime.now()
+                db.session.commit()
+                command = [
+                    'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-i', input_path,
+                    '-map', '0', '-c', 'copy', '-movflags', '+faststart', temporary
+                ]
+                result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip()[-500:] or f'ffmpeg salió con código {result.returncode}')
+                os.replace(temporary, target)
+                temporary = None
+                file_catalog.refresh(target)
+                probe = media_probes.wait(output, app.config['PROBE_TIMEOUT'] * 2)
+                if probe and probe['error']:
+                    # El MP4 no sirve: se descarta y se conserva el .flv para reintentar
+                    os.remove(target)
+                    file_catalog.refresh(target)
+                    raise RuntimeError(f"ffprobe: {probe['error']}")
+                job.output = output
+                job.size = os.path.getsize(target)
+                job.duration = probe['duration'] if probe else None
+                if app.config['RECORD_AUTO_SCHEDULE']:
+                    job.stream_id, job.error = self.schedule_rerun(output)
+                job.status, job.finished_at = 'completed', datetime.now()
+                db.session.commit()
+                if not app.config['RECORD_KEEP_SOURCE']:
+                    os.remove(input_path)
+                print(f"Grabación {source} lista como {output}")
+                publish_event('recording_ready', job.to_dict())
+        except Exception as e:
+            print(f"Error en la post-grabación de {source}: {str(e)}")
+            try:
+                with app.app_context():
+                    db.session.rollback()
+                    job = RecordingJob.query.filter_by(source=source).first()
+                    if job:
+                        job.status, job.error, job.finished_at = 'error', str(e)[:500], datetime.now()
+                        db.session.commit()
+            except Exception:
+                print(f"Error al actualizar la post-grabación de {source}")
+        finally:
+            if temporary and os.path.exists(temporary):
+                os.remove(temporary)
+            with self.lock:
+                self.pending.discard(source)
+
+    def schedule_rerun(self, output):
+        """Programa la retransmisión del MP4; devuelve (id del stream, aviso)"""
+        if not app.config['RECORD_RERUN_RTMP']:
+            return None, 'RECORD_AUTO_SCHEDULE sin RECORD_RERUN_RTMP: no se programó la retransmisión'
+        scheduled_time = datetime.now() + timedelta(seconds=app.config['RECORD_RERUN_DELAY'])
+        stream = Stream(
+            name=f'Retransmisión {os.path.splitext(output)[0]}'[:100],
+            input_path=output,
+            output_rtmp=app.config['RECORD_RERUN_RTMP'],
+            scheduled_time=scheduled_time,
+            next_run_at=scheduled_time,
+            repeat_type='once'
+        )
+        problems, rejected = validate_schedule(stream)
+        if rejected:
+            return None, f"Retransmisión no programada: {problems[0]['message'] if problems else 'conflicto en la agenda'}"[:500]
+        db.session.add(stream)
+        db.session.commit()
+        schedule_stream(stream)
+        return stream.id, None
+
+post_record = PostRecordPipeline(app.config['RECORD_WORKERS'])
+
+def parse_bitrate_kbps(value):
+    """Convierte un bitrate de ffmpeg ('2500k', '3M', '128000') a kbit/s"""
+    multipliers = {'k': 1, 'K': 1, 'm': 1000, 'M': 1000}
+    try:
+        if value[-1] in multipliers:
+            return float(value[:-1]) * multipliers[value[-1]]
+        return float(value) / 1000
+    except (ValueError, IndexError):
+        return None
+
+def estimate_egress_kbps(video_params, file_bit_rate):
+    """
+    Ancho de banda de salida estimado de una transmisión en kbit/s.
+
+    Usa -maxrate / -b:v (+ -b:a) si los parámetros fijan el bitrate; si no,
+    el bitrate del archivo según ffprobe. None si no se puede estimar.
+    """
+    params = (video_params or '').split()
+    options = dict(zip(params, params[1:]))
+    video = parse_bitrate_kbps(options.get('-maxrate') or options.get('-b:v') or '')
+    if video is None or get_broadcast_profile(video_params) == 'copy':
+        return file_bit_rate / 1000 if file_bit_rate else None
+    return video + (parse_bitrate_kbps(options.get('-b:a') or '') or 128)
+
+def normalize_destination(output_rtmp):
+    return (output_rtmp or '').strip().rstrip('/')
+
+def to_seconds(value):
+    return (value - RECURRENCE_EPOCH).total_seconds()
+
+def from_seconds(value):
+    return RECURRENCE_EPOCH + timedelta(seconds=value)
+
+class IntervalSet:
+    """
+    Intervalos [inicio, fin) ordenados por inicio con el máximo acumulado de los fines.
+
+    Para una consulta [a, b) los candidatos son los intervalos con inicio < b
+    (búsqueda binaria) cuyo máximo acumulado de fin supera `a` (otra búsqueda
+    binaria, porque el máximo acumulado es no decreciente).
+    """
+    def __init__(self, intervals):
+        intervals.sort()
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.ids = [stream_id for _, _, stream_id in intervals]
+        self.max_ends = list(itertools.accumulate(self.ends, max))
+
+    def overlapping(self, start, end, exclude_id=None):
+        hi = bisect.bisect_left(self.starts, end)
+        lo = bisect.bisect_right(self.max_ends, start, 0, hi)
+        return [
+            (self.ids[i], self.starts[i], self.ends[i]) for i in range(lo, hi)
+            if self.ends[i] > start and self.ids[i] != exclude_id
+        ]
+
+class EgressProfile:
+    """
+    Egreso agregado proyectado como función escalonada en el tiempo.
+
+    `values[i]` es el ancho de banda total en [times[i], times[i + 1]). Una
+    tabla dispersa (sparse table) responde el máximo en cualquier rango en O(1).
+    """
+    def __init__(self, intervals):
+        deltas = {}
+        for start, end, kbps in intervals:
+            deltas[start] = deltas.get(start, 0) + kbps
+            deltas[end] = deltas.get(end, 0) - kbps
+        self.times = sorted(deltas)
+        values = list(itertools.accumulate(deltas[t] for t in self.times))
+        self.table = [values]
+        width = 1
+        while width * 2 <= len(values):
+            previous = self.table[-1]
+            self.table.append([max(previous[i], previous[i + width]) for i in range(len(previous) - width)])
+            width *= 2
+
+    def peak(self, start, end):
+        """Máximo egreso agregado en [start, end)"""
+        # Escalones que intersectan el rango; antes del primer cambio el egreso es cero
+        lo = max(bisect.bisect_right(self.times, start) - 1, 0)
+        hi = bisect.bisect_left(self.times, end) - 1
+        if hi < lo:
+            return 0
+        level = (hi - lo + 1).bit_length() - 1
+        return max(self.table[level][lo], self.table[level][hi - (1 << level) + 1], 0)
+
+class ScheduleIndex:
+    """
+    Índice de reservas futuras (ocurrencias de streams activos dentro del horizonte).
+
+    Cada ocurrencia ocupa [inicio, inicio + duración) según ffprobe. Se indexa
+    por destino RTMP para detectar solapes y globalmente para el egreso
+    agregado. Un commit que cambia un stream en algo que afecta la agenda (o
+    el análisis de un archivo) marca solo esos streams: antes de la siguiente
+    consulta se releen y pasan a una capa de cambios que reemplaza sus
+    intervalos de la base. Cuando la capa supera COMPACT_INTERVALS la base se
+    reconstruye en segundo plano mientras se sigue respondiendo con la
+    anterior más la capa. Los commits de leases, estado y telemetría no lo
+    tocan.
+    """
+    COMPACT_INTERVALS = 4096
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending_ids, self.pending_paths, self.pending_full = set(), set(), True
+        self.sequence = 0
+        self.base_sequence = 0
+        self.compacting = False
+        self.destinations = {}
+        self.egress = EgressProfile([])
+        self.stream_intervals = {}
+        self.names = {}
+        # Capa de cambios: id -> (secuencia de la lectura, destino, intervalos); sin intervalos = quitado
+        self.overlay = {}
+        self.overlay_destinations = {}
+        self.overlay_egress = IntervalSet([])
+
+    def invalidate(self, stream_ids=None, paths=None):
+        """Marca streams (por id) o archivos (por ruta) cambiados; sin argumentos, todo el índice"""
+        with self.pending_lock:
+            if stream_ids is None and paths is None:
+                self.pending_full = True
+            else:
+                self.pending_ids.update(stream_ids or ())
+                self.pending_paths.update(paths or ())
+
+    def occurrences(self, first, repeat_type, rule, scheduled_time, until, cache=None):
+        """
+        Ocurrencias de una serie desde `first` (siempre incluida) hasta `until`.
+
+        El horizonte solo acota la expansión de las series recurrentes; un
+        stream de una sola vez se indexa aunque esté más lejos.
+        """
+        if not first:
+            return []
+        key = recurrence_key(scheduled_time, repeat_type, rule) if repeat_type != 'once' else None
+        if key is None:
+            return [first]
+        cache_key = (key, first)
+        if cache is not None and cache_key in cache:
+            return cache[cache_key]
+        result, current = [first], next_for_key(key, first)
+        while current and current < until and len(result) < app.config['SCHEDULE_MAX_OCCURRENCES']:
+            result.append(current)
+            current = next_for_key(key, current)
+        if cache is not None:
+            cache[cache_key] = result
+        return result
+
+    def _load(self, condition=None):
+        """Lee los streams activos (todos o los que cumplen `condition`): id -> (nombre, destino, intervalos)"""
+        until = datetime.now() + timedelta(days=app.config['SCHEDULE_HORIZON_DAYS'])
+        query = db.select(
+            Stream.id, Stream.name, Stream.input_path, Stream.output_rtmp, Stream.video_params,
+            Stream.scheduled_time, Stream.repeat_type, Stream.recurrence_rule, Stream.next_run_at
+        ).where(Stream.is_active == True, Stream.next_run_at.is_not(None))
+        probe_query = db.select(MediaProbe.path, MediaProbe.duration, MediaProbe.bit_rate)
+        with app.app_context():
+            if condition is not None:
+                query = query.where(condition)
+            rows = db.session.execute(query).all()
+            if condition is not None:
+                probe_query = probe_query.where(MediaProbe.path.in_({row.input_path for row in rows}))
+            probes = {path: (duration, bit_rate) for path, duration, bit_rate in db.session.execute(probe_query).all()}
+
+        loaded, cache = {}, {}
+        for row in rows:
+            duration, bit_rate = probes.get(row.input_path, (None, None))
+            if not duration:
+                continue
+            kbps = estimate_egress_kbps(row.video_params, bit_rate)
+            intervals = []
+            for start in self.occurrences(row.next_run_at, row.repeat_type, row.recurrence_rule,
+                                          row.scheduled_time, until, cache):
+                begin = to_seconds(start)
+                intervals.append((begin, begin + duration, kbps))
+            loaded[row.id] = (row.name, normalize_destination(row.output_rtmp), intervals)
+        return loaded
+
+    def _build(self):
+        """Base completa a partir de la base de datos (no modifica el índice)"""
+        by_destination, egress, stream_intervals, names = {}, [], {}, {}
+        for stream_id, (name, destination, intervals) in self._load().items():
+            for begin, end, kbps in intervals:
+                by_destination.setdefault(destination, []).append((begin, end, stream_id))
+                if kbps:
+                    egress.append((begin, end, kbps))
+            stream_intervals[stream_id] = intervals
+            names[stream_id] = name
+        return {dest: IntervalSet(items) for dest, items in by_destination.items()}, EgressProfile(egress), stream_intervals, names
+
+    def _install(self, built, sequence):
+        """Reemplaza la base; la capa conserva solo lo leído después de empezar a construirla"""
+        if sequence <= self.base_sequence:
+            return
+        self.destinations, self.egress, self.stream_intervals, names = built
+        self.names.update(names)
+        self.base_sequence = sequence
+        self.overlay = {stream_id: entry for stream_id, entry in self.overlay.items() if entry[0] > sequence}
+        self._index_overlay()
+
+    def _index_overlay(self):
+        by_destination, deltas = {}, []
+        for stream_id, (_, destination, intervals) in self.overlay.items():
+            for begin, end, kbps in intervals:
+                by_destination.setdefault(destination, []).append((begin, end, stream_id))
+                if kbps:
+                    deltas.append((begin, end, (stream_id, kbps)))
+            # El egreso de la base se corrige restando los intervalos que la capa reemplaza
+            for begin, end, kbps in self.stream_intervals.get(stream_id, ()):
+                if kbps:
+                    deltas.append((begin, end, (stream_id, -kbps)))
+        self.overlay_destinations = {dest: IntervalSet(items) for dest, items in by_destination.items()}
+        self.overlay_egress = IntervalSet(deltas)
+
+    def _compact(self, sequence):
+        try:
+            start = time.perf_counter()
+            built = self._build()
+            with self.lock:
+                self._install(built, sequence)
+            print(f"Índice de programación compactado en {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            print(f"Error al compactar el índice de programación: {str(e)}")
+        finally:
+            self.compacting = False
+
+    def ensure_built(self):
+        """Aplica los cambios marcados: relee solo los streams afectados (o todo tras invalidate())"""
+        with self.lock:
+            with self.pending_lock:
+                full, ids, paths = self.pending_full, self.pending_ids, self.pending_paths
+                self.pending_full, self.pending_ids, self.pending_paths = False, set(), set()
+            try:
+                if full:
+                    start = time.perf_counter()
+                    self.sequence += 1
+                    self._install(self._build(), self.sequence)
+                    print(f"Índice de programación reconstruido en {time.perf_counter() - start:.3f}s")
+                elif ids or paths:
+                    self.sequence += 1
+                    conditions = ([Stream.id.in_(ids)] if ids else []) + ([Stream.input_path.in_(paths)] if paths else [])
+                    loaded = self._load(db.or_(*conditions))
+                    for stream_id in ids | set(loaded):
+                        name, destination, intervals = loaded.get(stream_id, (None, None, []))
+                        self.overlay[stream_id] = (self.sequence, destination, intervals)
+                        if name:
+                            self.names[stream_id] = name
+                    self._index_overlay()
+            except Exception:
+                # Lo marcado no se pierde: se reintenta en la próxima consulta
+                if full:
+                    self.invalidate()
+                else:
+                    self.invalidate(ids, paths)
+                raise
+            size = sum(len(entry[2]) for entry in self.overlay.values())
+            if size > self.COMPACT_INTERVALS and not self.compacting:
+                self.compacting = True
+                threading.Thread(
+                    target=self._compact, args=(self.sequence,), name='schedule-index-compact', daemon=True
+                ).start()
+
+    def _overlapping(self, destination, start, end, exclude_id):
+        """Reservas del destino que se solapan con [start, end): base sin lo reemplazado, más la capa"""
+        found = []
+        if destination in self.destinations:
+            found.extend(
+                item for item in self.destinations[destination].overlapping(start, end, exclude_id)
+                if item[0] not in self.overlay
+            )
+        if destination in self.overlay_destinations:
+            found.extend(self.overlay_destinations[destination].overlapping(start, end, exclude_id))
+        return sorted(found, key=lambda item: item[1])
+
+    def _egress_excluding(self, start, end, exclude_id):
+        """Egreso máximo en [start, end) con la capa de cambios y sin contar las ocurrencias de `exclude_id`"""
+        adjustments = [
+            (s, e, kbps) for (stream_id, kbps), s, e in self.overlay_egress.overlapping(start, end)
+            if stream_id != exclude_id or kbps < 0
+        ]
+        if exclude_id not in self.overlay:
+            adjustments.extend(
+                (s, e, -kbps) for s, e, kbps in self.stream_intervals.get(exclude_id, []) if s < end and e > start and kbps
+            )
+        if not adjustments:
+            return self.egress.peak(start, end)
+        cuts = sorted({start, end} | {t for item in adjustments for t in item[:2] if start < t < end})
+        return max(
+            self.egress.peak(a, b) + sum(kbps for s, e, kbps in adjustments if s <= a and e > a)
+            for a, b in zip(cuts, cuts[1:])
+        )
+
+    def check(self, stream, duration, bit_rate, exclude_id=None):
+        """
+        Valida las ocurrencias futuras de un stream contra las reservas existentes.
+
+        Devuelve una lista de problemas: solapes en el mismo destino RTMP y
+        franjas en las que el egreso proyectado supera EGRESS_CAP_KBPS.
+        """
+        self.ensure_built()
+        until = datetime.now() + timedelta(days=app.config['SCHEDULE_HORIZON_DAYS'])
+        cap = app.config['EGRESS_CAP_KBPS']
+        kbps = estimate_egress_kbps(stream.video_params, bit_rate)
+        destination = normalize_destination(stream.output_rtmp)
+        problems, seen, over_cap = [], set(), False
+        for start in self.occurrences(stream.next_run_at, stream.repeat_type, stream.recurrence_rule,
+                                      stream.scheduled_time, until):
+            begin = to_seconds(start)
+            end = begin + duration
+            for other_id, other_start, other_end in self._overlapping(destination, begin, end, exclude_id):
+                if other_id not in seen:
+                    seen.add(other_id)
+                    problems.append({
+                        'type': 'overlap',
+                        'stream_id': other_id,
+                        'name': self.names.get(other_id),
+                        'start': from_seconds(other_start).isoformat(),
+                        'end': from_seconds(other_end).isoformat(),
+                        'message': f"Se solapa con '{self.names.get(other_id)}' en el mismo destino RTMP"
+                    })
+            if cap and kbps and not over_cap:
+                projected = self._egress_excluding(begin, end, exclude_id) + kbps
+                if projected > cap:
+                    over_cap = True
+                    problems.append({
+                        'type': 'egress',
+                        'start': start.isoformat(),
+                        'projected_kbps': round(projected),
+                        'cap_kbps': cap,
+                        'message': f"El egreso proyectado ({round(projected)} kbit/s) supera el límite de {cap} kbit/s"
+                    })
+        return problems
+
+schedule_index = ScheduleIndex()
+
+# Columnas de Stream que usa el índice de la agenda
+SCHEDULE_INDEX_COLUMNS = frozenset((
+    'name', 'input_path', 'output_rtmp', 'video_params', 'scheduled_time',
+    'repeat_type', 'recurrence_rule', 'next_run_at', 'is_active'
+))
+
+def mark_schedule_changes(session, stream_ids=(), paths=(), full=False):
+    """Acumula en la sesión los streams y archivos cambiados hasta el commit"""
+    changes = session.info.setdefault('schedule_changes', {'streams': set(), 'paths': set(), 'full': False})
+    changes['streams'].update(stream_ids)
+    changes['paths'].update(paths)
+    changes['full'] = changes['full'] or full
+
+@event.listens_for(db.session, 'after_flush')
+def track_schedule_changes(session, flush_context):
+    """Registra los streams y análisis que el flush agregó, borró o cambió en algo que usa el índice"""
+    for obj in itertools.chain(session.new, session.deleted, session.dirty):
+        state = db.inspect(obj)
+        if isinstance(obj, Stream):
+            if obj in session.dirty and not any(
+                state.attrs[column].history.has_changes() for column in SCHEDULE_INDEX_COLUMNS
+            ):
+                continue
+            # Los nuevos todavía no tienen identidad en after_flush, pero ya tienen id
+            mark_schedule_changes(session, stream_ids=[state.identity[0] if state.identity else state.dict.get('id')])
+        elif isinstance(obj, MediaProbe):
+            # Sin la ruta cargada (objeto expirado) no se sabe qué streams la usan
+            path = state.dict.get('path')
+            mark_schedule_changes(session, paths=[path] if path else (), full=not path)
+
+@event.listens_for(db.session, 'do_orm_execute')
+def track_bulk_schedule_changes(orm_execute_state):
+    """Lo mismo para los UPDATE y DELETE masivos: por clave primaria se marcan los ids, si no todo el índice"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    entity = mapper.class_ if mapper else None
+    session = orm_execute_state.session
+    if entity is MediaProbe or (entity is Stream and orm_execute_state.is_delete):
+        mark_schedule_changes(session, full=True)
+    elif entity is Stream:
+        parameters = orm_execute_state.parameters
+        rows = parameters if isinstance(parameters, (list, tuple)) else [parameters or {}]
+        columns = set(rows[0] if rows else ()) | set(orm_execute_state.statement.compile().params)
+        if not columns & SCHEDULE_INDEX_COLUMNS:
+            return
+        if rows and all('id' in row for row in rows):
+            mark_schedule_changes(session, stream_ids=[row['id'] for row in rows])
+        else:
+            mark_schedule_changes(session, full=True)
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_schedule_index(session):
+    changes = session.info.pop('schedule_changes', None)
+    if not changes:
+        return
+    if changes['full']:
+        schedule_index.invalidate()
+    else:
+        schedule_index.invalidate(changes['streams'], changes['paths'])
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_schedule_changes(session, previous_transaction):
+    session.info.pop('schedule_changes', None)
+
+def validate_schedule(stream, exclude_id=None):
+    """
+    Aplica SCHEDULE_CONFLICT_POLICY a un stream antes de guardarlo.
+
+    Devuelve (problemas, rechazar). Solo usa el análisis ya guardado: si el
+    archivo todavía no tiene duración conocida (se está analizando) no se
+    puede validar, se avisa y la petición no espera a ffprobe.
+    """
+    policy = app.config['SCHEDULE_CONFLICT_POLICY']
+    if policy == 'off' or stream.is_active is False or not stream.next_run_at:
+        return [], False
+    media = media_probes.get(stream.input_path)
+    if not media or not media['duration']:
+        media_probes.request(stream.input_path)
+        return [{
+            'type': 'unknown_duration',
+            'message': 'La duración del archivo todavía no se conoce; no se validaron solapes ni egreso'
+        }], False
+    problems = schedule_index.check(stream, media['duration'], media['bit_rate'], exclude_id)
+    return problems, bool(problems) and policy == 'reject'
+
+class BroadcastExecutor:
+    """
+    Ejecutor dedicado para las transmisiones con control de admisión.
+
+    Limita el número de procesos ffmpeg simultáneos por perfil ('copy' y
+    'transcode'). Las transmisiones que superan el límite esperan en una cola
+    ordenada por prioridad (mayor primero) y hora programada, y se registra
+    el tiempo de espera de cada stream: el de los streams en cola o en curso,
+    y el de las últimas `history` transmisiones terminadas (las más viejas se
+    descartan para que no crezca sin límite). Los argumentos extra de submit pasan
+    a stream_video (p. ej. solo y resume_offset de un destino que sale del
+    grupo tee).
+    """
+    def __init__(self, limits, history=None):
+        self.limits = dict(limits)
+        self.queues = {profile: [] for profile in self.limits}
+        self.running = {profile: {} for profile in self.limits}
+        self.queue_waits = {}
+        self.finished_waits = deque(maxlen=app.config['BROADCAST_QUEUE_HISTORY'] if history is None else history)
+        self.options = {}
+        self.lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    def submit(self, stream_id, profile, priority=0, scheduled_time=None, **options):
+        """Encola una transmisión; devuelve False si ya está en cola o en curso"""
+        with self.lock:
+            if self._find(stream_id):
+                print(f"Stream {stream_id} ya está en cola o transmitiendo")
+                return False
+            scheduled_ts = scheduled_time.timestamp() if scheduled_time else time.time()
+            heapq.heappush(self.queues[profile], (
+                -(priority or 0), scheduled_ts, next(self._sequence), stream_id, time.monotonic()
+            ))
+            self.options[stream_id] = options
+            self.queue_waits[stream_id] = {
+                'profile': profile,
+                'priority': priority or 0,
+                'enqueued_at': datetime.now().isoformat(),
+                'started_at': None,
+                'wait_seconds': None
+            }
+        self._dispatch()
+        return True
+
+    def cancel(self, stream_id):
+        """Quita un stream de la cola de espera (no detiene transmisiones en curso)"""
+        with self.lock:
+            for profile, queue in self.queues.items():
+                remaining = [entry for entry in queue if entry[3] != stream_id]
+                if len(remaining) != len(queue):
+                    heapq.heapify(remaining)
+                    self.queues[profile] = remaining
+                    self.queue_waits.pop(stream_id, None)
+                    self.options.pop(stream_id, None)
+                    return True
+        return False
+
+    def active(self):
+        """Ids de los streams en cola o en curso en este proceso"""
+        with self.lock:
+            return {entry[3] for queue in self.queues.values() for entry in queue} | {
+                stream_id for running in self.running.values() for stream_id in running
+            }
+
+    def _find(self, stream_id):
+        for profile in self.limits:
+            if stream_id in self.running[profile]:
+                return 'running'
+            if any(entry[3] == stream_id for entry in self.queues[profile]):
+                return 'queued'
+        return None
+
+    def _dispatch(self):
+        to_start = []
+        with self.lock:
+            for profile, queue in self.queues.items():
+                while queue and len(self.running[profile]) < self.limits[profile]:
+                    _, _, _, stream_id, enqueued = heapq.heappop(queue)
+                    wait = time.monotonic() - enqueued
+                    self.running[profile][stream_id] = datetime.now().isoformat()
+                    stats = self.queue_waits.setdefault(stream_id, {'profile': profile})
+                    stats['started_at'] = self.running[profile][stream_id]
+                    stats['wait_seconds'] = round(wait, 3)
+                    BROADCAST_QUEUE_WAIT.observe(wait)
+                    to_start.append((stream_id, profile, self.options.pop(stream_id, {})))
+        for stream_id, profile, options in to_start:
+            if self.queue_waits[stream_id]['wait_seconds'] >= 1:
+                print(f"Stream {stream_id} esperó {self.queue_waits[stream_id]['wait_seconds']}s en cola ({profile})")
+            threading.Thread(
+                target=self._run, args=(stream_id, profile, options),
+                name=f'broadcast-{stream_id}', daemon=True
+            ).start()
+
+    def _run(self, stream_id, profile, options):
+        try:
+            stream_video(stream_id, **options)
+        finally:
+            with self.lock:
+                self.running[profile].pop(stream_id, None)
+                stats = self.queue_waits.pop(stream_id, None)
+                if stats:
+                    stats['finished_at'] = datetime.now().isoformat()
+                    self.finished_waits.append((stream_id, stats))
+            self._dispatch()
+
+    def snapshot(self):
+        """Estado actual de la cola y límites por perfil"""
+        with self.lock:
+            return {
+                profile: {
+                    'limit': self.limits[profile],
+                    'running': dict(self.running[profile]),
+                    'queued': [entry[3] for entry in sorted(self.queues[profile])]
+                }
+                for profile in self.limits
+            }, {
+                stream_id: dict(stats)
+                for stream_id, stats in itertools.chain(self.finished_waits, self.queue_waits.items())
+            }
+
+broadcast_executor = BroadcastExecutor({
+    'copy': app.config['MAX_COPY_BROADCASTS'],
+    'transcode': app.config['MAX_TRANSCODE_BROADCASTS']
+})
+
+def enqueue_broadcast(stream_id):
+    """Encola la transmisión en el ejecutor de broadcasts (invocado por el scheduler)"""
+    with app.app_context():
+        stream = db.session.get(Stream, stream_id)
+        if not stream:
+            print(f"Error: Stream {stream_id} no encontrado")
+            return
+        if not stream.is_active:
+            print(f"Stream {stream_id} inactivo, no se encola")
+            return
+        if app.config['RUNNER_POOL']:
+            # El stream queda disponible para que lo reclame el runner con capacidad libre
+            if stream.status in ('queued', 'streaming'):
+                print(f"Stream {stream_id} ya está en cola o transmitiendo")
+                return
+            stream.status = 'queued'
+            stream.owner = None
+            stream.lease_expires_at = None
+            db.session.commit()
+            return
+        profile = get_broadcast_profile(stream.video_params)
+        broadcast_executor.submit(stream.id, profile, stream.priority, stream.next_run_at or stream.scheduled_time)
+
+def parse_progress_sample(fields):
+    """Convierte un bloque clave=valor de ffmpeg -progress en una muestra con tipos numéricos"""
+    def to_number(value, cast=float, suffix=''):
+        if value in (None, '', 'N/A'):
+            return None
+        try:
+            return cast(value[:-len(suffix)] if suffix and value.endswith(suffix) else value)
+        except ValueError:
+            return None
+
+    out_time_us = to_number(fields.get('out_time_us') or fields.get('out_time_ms'), int)
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'frame': to_number(fields.get('frame'), int),
+        'fps': to_number(fields.get('fps')),
+        'bitrate_kbps': to_number(fields.get('bitrate'), suffix='kbits/s'),
+        'total_size': to_number(fields.get('total_size'), int),
+        'out_time': fields.get('out_time'),
+        'out_time_seconds': out_time_us / 1000000 if out_time_us is not None else None,
+        'dup_frames': to_number(fields.get('dup_frames'), int),
+        'drop_frames': to_number(fields.get('drop_frames'), int),
+        'speed': to_number(fields.get('speed'), suffix='x'),
+        'progress': fields.get('progress')
+    }
+
+def publish_event(event_name, data):
+    """
+    Emite un evento a todos los clientes conectados.
+
+    Solo publica el runner líder: con la cola de mensajes el evento llega a
+    los clientes de todos los procesos web, y así cada proceso con su propio
+    watchdog no lo duplica.
+    """
+    if broadcast_runner.is_leader:
+        socketio.emit(event_name, data)
+
+class EventCoalescer:
+    """
+    Agrupa eventos de Socket.IO por clave y los emite en lote a intervalo fijo.
+
+    Si una misma clave se publica varias veces dentro del intervalo solo se
+    envía el último valor, así un panel con muchos streams recibe un único
+    mensaje por intervalo.
+    """
+    def __init__(self, event, interval):
+        self.event = event
+        self.interval = interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        self._started = False
+
+    def publish(self, key, payload):
+        with self.lock:
+            self.pending[key] = payload
+            if not self._started:
+                self._started = True
+                socketio.start_background_task(self._run)
+
+    def flush(self):
+        with self.lock:
+            batch = list(self.pending.values())
+            self.pending.clear()
+        if batch:
+            publish_event(self.event, batch)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error al emitir {self.event}: {str(e)}")
+
+class BroadcastProgress:
+    """
+    Progreso de un proceso ffmpeg en curso.
+
+    Guarda en buffers circulares las últimas muestras de -progress y las
+    últimas líneas de stderr, de modo que una transmisión de varias horas no
+    acumula su log completo en memoria.
+    """
+    def __init__(self, stream_id, max_samples, max_lines):
+        self.stream_id = stream_id
+        self.samples = deque(maxlen=max_samples)
+        self.stderr_lines = deque(maxlen=max_lines)
+        self.started_at = datetime.now()
+        self.returncode = None
+        self.process = None
+        # Instante (time.time()) en que ffmpeg escribió la cabecera de salida, y aviso de cancelación en pre-roll
+        self.on_air_at = None
+        self.cancelled = threading.Event()
+        # Streams de un grupo tee cancelados mientras el resto sigue al aire
+        self.dropped = set()
+        self.lock = threading.Lock()
+
+    def add_sample(self, sample):
+        with self.lock:
+            self.samples.append(sample)
+
+    def add_stderr_line(self, line):
+        with self.lock:
+            self.stderr_lines.append(line)
+
+    def latest(self):
+        with self.lock:
+            return dict(self.samples[-1]) if self.samples else None
+
+    def mark_on_air(self):
+        with self.lock:
+            if self.on_air_at is None:
+                self.on_air_at = time.time()
+
+    def stop(self):
+        """Cancela el pre-roll o termina el proceso ffmpeg si sigue en curso"""
+        self.cancelled.set()
+        if self.process and self.returncode is None:
+            self.process.terminate()
+
+    def drop(self, stream_id):
+        """Saca un destino del grupo tee: ffmpeg se corta y se relanza sin él"""
+        with self.lock:
+            self.dropped.add(stream_id)
+        if self.process and self.returncode is None:
+            self.process.terminate()
+
+    def is_dropped(self, stream_id):
+        with self.lock:
+            return stream_id in self.dropped
+
+    def stderr_tail(self):
+        with self.lock:
+            return '\n'.join(self.stderr_lines)
+
+broadcast_progress = {}
+broadcast_progress_lock = threading.Lock()
+
+def start_broadcast_progress(stream_id):
+    """Crea (o reemplaza) el registro de progreso de un stream"""
+    progress = BroadcastProgress(
+        stream_id,
+        app.config['FFMPEG_PROGRESS_SAMPLES'],
+        app.config['FFMPEG_STDERR_LINES']
+    )
+    with broadcast_progress_lock:
+        broadcast_progress[stream_id] = progress
+    return progress
+
+def get_broadcast_progress(stream_id):
+    with broadcast_progress_lock:
+        return broadcast_progress.get(stream_id)
+
+def cancel_broadcast(stream_id):
+    """
+    Detiene la transmisión de un stream, esté en cola, en pre-roll o al aire.
+
+    Si comparte el ffmpeg con otros streams (grupo tee) solo se saca su
+    destino: el proceso se relanza sin él y los demás siguen.
+    """
+    broadcast_executor.cancel(stream_id)
+    progress = get_broadcast_progress(stream_id)
+    if not progress:
+        return
+    with broadcast_progress_lock:
+        sharing = {key for key, value in broadcast_progress.items() if value is progress}
+    if any(key != stream_id and not progress.is_dropped(key) for key in sharing):
+        progress.drop(stream_id)
+    else:
+        progress.stop()
+
+broadcast_telemetry = EventCoalescer('broadcast_stats', app.config['TELEMETRY_INTERVAL'])
+
+def publish_broadcast_telemetry(stream_id, sample, status='streaming'):
+    """Publica (agrupada) la última muestra de progreso de un stream saliente"""
+    broadcast_telemetry.publish(stream_id, {
+        'stream_id': stream_id,
+        'status': status,
+        'timestamp': sample.get('timestamp'),
+        'frame': sample.get('frame'),
+        'fps': sample.get('fps'),
+        'speed': sample.get('speed'),
+        'bitrate_kbps': sample.get('bitrate_kbps'),
+        'dup_frames': sample.get('dup_frames'),
+        'drop_frames': sample.get('drop_frames'),
+        'out_time': sample.get('out_time')
+    })
+
+def run_ffmpeg(command, progress, on_sample=None, on_spawn=None, on_stderr=None, cores=None):
+    """
+    Ejecuta ffmpeg leyendo su salida de forma incremental.
+
+    El comando recibe `-progress pipe:1`; stdout se interpreta como bloques
+    clave=valor y stderr se guarda línea a línea en el buffer circular. La
+    línea "Output #0" de stderr (cabecera de salida escrita) marca la salida
+    al aire; si no aparece, se toma la primera muestra de progreso. Con
+    cores (y CPU_PINNING) el proceso se fija a esos núcleos al lanzarlo.
+    Devuelve el código de salida del proceso.
+    """
+    command = [command[0], '-hide_banner', '-nostats', '-progress', 'pipe:1'] + list(command[1:])
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.DEVNULL
+    )
+    if cores and app.config['CPU_PINNING']:
+        try:
+            os.sched_setaffinity(process.pid, cores)
+        except (AttributeError, OSError) as e:
+            print(f"No se pudo fijar ffmpeg a los núcleos {cores}: {str(e)}")
+    progress.process = process
+    progress.returncode = None
+    FFMPEG_PROCESSES.inc()
+    if progress.cancelled.is_set():
+        process.terminate()  # cancelado mientras se lanzaba
+    if on_spawn:
+        on_spawn()
+
+    def read_stderr():
+        for raw_line in process.stderr:
+            line = raw_line.decode('utf-8', errors='replace').rstrip()
+            if line:
+                if line.startswith('Output #'):
+                    progress.mark_on_air()
+                if on_stderr:
+                    on_stderr(line)
+                progress.add_stderr_line(line)
+
+    stderr_reader = threading.Thread(target=read_stderr, name=f'ffmpeg-stderr-{progress.stream_id}', daemon=True)
+    stderr_reader.start()
+
+    fields = {}
+    for raw_line in process.stdout:
+        key, _, value = raw_line.decode('utf-8', errors='replace').strip().partition('=')
+        if not key:
+            continue
+        fields[key] = value.strip()
+        if key == 'progress':
+            sample = parse_progress_sample(fields)
+            progress.mark_on_air()
+            progress.add_sample(sample)
+            if on_sample:
+                on_sample(sample)
+            fields = {}
+
+    process.wait()
+    FFMPEG_PROCESSES.dec()
+    FFMPEG_EXITS.inc(code=process.returncode)
+    stderr_reader.join()
+    process.stdout.close()
+    process.stderr.close()
+    progress.returncode = process.returncode
+    return process.returncode
+
+class LaunchLeadEstimator:
+    """
+    Tiempo de arranque de ffmpeg por perfil (del lanzamiento a la salida al aire).
+
+    Es una media móvil exponencial de lo medido en cada transmisión; al
+    reiniciar se siembra con las últimas ejecuciones registradas.
+    """
+    def __init__(self, initial, alpha=0.3):
+        self.initial = initial
+        self.alpha = alpha
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get(self, profile):
+        with self.lock:
+            value = self.values.get(profile)
+        if value is None:
+            recent = db.session.execute(
+                db.select(BroadcastRun.launch_ms)
+                .where(BroadcastRun.profile == profile, BroadcastRun.launch_ms.is_not(None))
+                .order_by(BroadcastRun.id.desc())
+                .limit(10)
+            ).scalars().all()
+            if recent:
+                with self.lock:
+                    value = self.values.setdefault(profile, sum(recent) / len(recent) / 1000)
+            else:
+                value = self.initial  # sin historial: la primera medición reemplaza al valor inicial
+        return min(max(value, 0.0), app.config['PREROLL_SECONDS'])
+
+    def update(self, profile, seconds):
+        with self.lock:
+            previous = self.values.get(profile, seconds)
+            self.values[profile] = previous + self.alpha * (seconds - previous)
+
+launch_leads = LaunchLeadEstimator(app.config['PREROLL_LAUNCH_LEAD'])
+
+def preroll_run_date(run_date):
+    """Hora de disparo del trabajo de un stream: la hora programada menos el pre-roll"""
+    return run_date - timedelta(seconds=app.config['PREROLL_SECONDS'])
+
+def warm_input_file(path, length):
+    """Pide al kernel que traiga a la caché de páginas el comienzo del archivo de entrada"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, length, os.POSIX_FADV_WILLNEED)
+        else:
+            os.read(fd, min(length, 1024 * 1024))
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def check_rtmp_endpoint(output_rtmp, timeout):
+    """
+    Resuelve y conecta por TCP con el servidor de ingesta RTMP.
+
+    Deja el nombre resuelto en caché y detecta un destino caído antes de la
+    hora. Devuelve (milisegundos de conexión, error o None).
+    """
+    parsed = urlparse(output_rtmp)
+    if not parsed.hostname:
+        return None, 'URL RTMP sin host'
+    port = parsed.port or (443 if parsed.scheme in ('rtmps', 'rtmpts') else 1935)
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((parsed.hostname, port), timeout=timeout):
+            pass
+    except OSError as e:
+        return None, str(e)
+    return round((time.perf_counter() - start) * 1000), None
+
+def record_on_air(run, on_air_at):
+    """Completa en la ejecución la salida al aire, el desvío respecto de la hora y el tiempo de arranque"""
+    run.on_air_at = datetime.fromtimestamp(on_air_at)
+    run.status = 'on_air'
+    run.skew_ms = round((run.on_air_at - run.due_at).total_seconds() * 1000)
+    if run.launched_at:
+        run.launch_ms = round((run.on_air_at - run.launched_at).total_seconds() * 1000)
+        launch_leads.update(run.profile, run.launch_ms / 1000)
+    BROADCAST_START_SKEW.observe(abs(run.skew_ms) / 1000)
+    print(f"Stream {run.stream_id} al aire con un desvío de {run.skew_ms} ms (arranque de ffmpeg: {run.launch_ms} ms)")
+
+def tee_escape(url):
+    """Escapa una URL de salida para la lista de destinos del muxer tee"""
+    for char in ('\\', "'", '|'):
+        url = url.replace(char, '\\' + char)
+    return url
+
+def build_broadcast_command(streams, input_path, offset=0, threads=None):
+    """
+    Comando ffmpeg de la transmisión; con offset se busca en la entrada (-ss antes de -i).
+
+    Con varios streams (mismo archivo, parámetros y hora) se codifica una sola
+    vez y el muxer tee reparte la salida; onfail=ignore aísla los destinos:
+    si uno se cae, los demás siguen.
+    """
+    command = ['ffmpeg', '-re']
+    if offset > 0:
+        command += ['-ss', f'{offset:.3f}']
+    command += ['-i', input_path]
+    if threads:
+        command += ['-threads', str(threads)]
+    # Usar parámetros por defecto si no hay personalizados
+    params = (streams[0].video_params or '-c:v copy -c:a aac -f flv').split()
+    if len(streams) == 1:
+        return command + params + [streams[0].output_rtmp]
+    output_format = 'flv'
+    if '-f' in params[:-1]:
+        index = params.index('-f')
+        output_format = params[index + 1]
+        del params[index:index + 2]
+    if '-map' not in params:
+        params += ['-map', '0:v?', '-map', '0:a?']
+    slaves = '|'.join(f'[f={output_format}:onfail=ignore]{tee_escape(stream.output_rtmp)}' for stream in streams)
+    return command + params + ['-f', 'tee', slaves]
+
+class FanoutGroups:
+    """
+    Grupos de streams que comparten archivo, parámetros y hora en este runner.
+
+    El primero que llega a stream_video es el líder; los que llegan mientras
+    el grupo está abierto (pre-roll) se suman y no lanzan nada. Al lanzar, el
+    líder cierra el grupo agregando los hermanos que reclamó de la base.
+    """
+    def __init__(self):
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def join(self, key, stream_id):
+        """Devuelve el líder si el stream se sumó a un grupo, o None si debe transmitir él mismo"""
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None:
+                self.groups[key] = {'leader': stream_id, 'members': set(), 'open': True}
+                return None
+            if stream_id in group['members'] or (group['open'] and stream_id != group['leader']):
+                group['members'].add(stream_id)
+                return group['leader']
+            return None  # el grupo ya salió al aire sin este stream
+
+    def close(self, key, claimed=()):
+        """Cierra el grupo y devuelve sus miembros (sin el líder)"""
+        with self.lock:
+            group = self.groups.get(key)
+            if not group:
+                return []
+            group['members'].update(claimed)
+            group['members'].discard(group['leader'])
+            group['open'] = False
+            return sorted(group['members'])
+
+    def discard(self, key):
+        with self.lock:
+            self.groups.pop(key, None)
+
+fanout_groups = FanoutGroups()
+
+def claim_fanout_siblings(stream, due_time):
+    """Reclama los streams activos con el mismo archivo, parámetros y hora que todavía no salieron"""
+    params = stream.video_params or '-c:v copy -c:a aac -f flv'
+    candidates = [
+        sibling_id for sibling_id, video_params in db.session.execute(
+            db.select(Stream.id, Stream.video_params).where(
+                Stream.id != stream.id,
+                Stream.is_active == True,
+                Stream.input_path == stream.input_path,
+                Stream.next_run_at == due_time,
+                Stream.status.in_(('pending', 'queued'))
+            )
+        ).all() if (video_params or '-c:v copy -c:a aac -f flv') == params
+    ]
+    if app.config['RUNNER_POOL']:
+        # Solo los que este runner ya tiene o puede reclamar; los de otros nodos salen por su cuenta
+        now, claimed = datetime.now(), []
+        for sibling_id in candidates:
+            result = db.session.execute(
+                db.update(Stream)
+                .where(Stream.id == sibling_id, db.or_(Stream.owner == broadcast_runner.node_id, runner_pool.claimable(now)))
+                .values(owner=broadcast_runner.node_id, lease_expires_at=now + timedelta(seconds=app.config['STREAM_LEASE_TTL']))
+            )
+            if result.rowcount == 1:
+                claimed.append(sibling_id)
+        db.session.commit()
+        candidates = claimed
+    for sibling_id in candidates:
+        broadcast_executor.cancel(sibling_id)
+    return candidates
+
+def broadcast_still_wanted(stream):
+    """Indica si el stream sigue activo (y, en modo pool, reclamado por este runner)"""
+    try:
+        db.session.refresh(stream)
+    except InvalidRequestError:
+        return False  # el stream fue borrado
+    return stream.is_active and (not app.config['RUNNER_POOL'] or stream.owner == broadcast_runner.node_id)
+
+def supervise_broadcast(targets, progress, build_command, on_sample=None, on_spawn=None, offset=0.0, on_stderr=None, cores=None, on_drop=None):
+    """
+    Ejecuta ffmpeg y lo relanza si se corta a mitad de la transmisión.
+
+    targets son los pares (stream, ejecución) que comparten el proceso; la
+    lista puede achicarse mientras corre (destinos que siguen por separado o
+    que se cancelan: ffmpeg se relanza al momento sin ellos y on_drop cierra
+    su ejecución). Cada proceso es un tramo (tabla broadcast_segment). Tras una salida con
+    error se espera con backoff exponencial y se reanuda con -ss en el último
+    instante de salida confirmado por -progress, hasta agotar el presupuesto
+    de reintentos. Devuelve el código de salida del último tramo.
+    """
+    stream_id, budget = targets[0][0].id, app.config['BROADCAST_RETRY_BUDGET']
+    duration = media_probes.get_duration(targets[0][0].input_path)
+    retries, returncode = 0, None
+    for attempt in itertools.count():
+        for pair in [pair for pair in targets if progress.is_dropped(pair[1].stream_id)]:
+            targets.remove(pair)
+            if on_drop:
+                on_drop(*pair, returncode)
+        if not targets:
+            return returncode
+        segments = [
+            BroadcastSegment(
+                run_id=run.id, stream_id=run.stream_id, attempt=attempt, offset=round(offset, 3), started_at=datetime.now()
+            )
+            for _, run in targets
+        ]
+        db.session.add_all(segments)
+        db.session.commit()
+        command = build_command(offset)
+        confirmed = [0.0]
+
+        def on_segment_sample(sample, start=offset):
+            if sample.get('out_time_seconds'):
+                confirmed[0] = max(confirmed[0], sample['out_time_seconds'])
+            sample['position'] = start + confirmed[0]
+            if on_sample:
+                on_sample(sample)
+
+        returncode = run_ffmpeg(
+            command, progress, on_sample=on_segment_sample,
+            on_spawn=on_spawn if attempt == 0 else None, on_stderr=on_stderr, cores=cores
+        )
+        ended_at = datetime.now()
+        for segment in segments:
+            segment.ended_at = ended_at
+            segment.out_time = round(confirmed[0], 3)
+            segment.returncode = returncode
+            if returncode != 0:
+                segment.error = progress.stderr_tail()[-500:] or None
+        held = (ended_at - segments[0].started_at).total_seconds()
+        db.session.commit()
+
+        offset += confirmed[0]
+        if returncode == 0 or progress.cancelled.is_set():
+            return returncode
+        if duration and offset >= duration - 1:
+            print(f"Stream {stream_id}: ffmpeg se cortó al final del archivo ({offset:.3f}s de {duration:.3f}s)")
+            return 0
+        if any(progress.is_dropped(run.stream_id) for _, run in targets):
+            continue  # corte pedido para sacar destinos del grupo: no cuenta como reintento
+        if held >= app.config['BROADCAST_RETRY_RESET']:
+            retries = 0
+        if retries >= budget:
+            print(f"Stream {stream_id}: se agotaron los {budget} reintentos")
+            return returncode
+        delay = min(app.config['BROADCAST_RETRY_BACKOFF'] * 2 ** retries, app.config['BROADCAST_RETRY_BACKOFF_MAX'])
+        retries += 1
+        BROADCAST_RETRIES.inc()
+        print(
+            f"Stream {stream_id}: ffmpeg salió con código {returncode}; "
+            f"reintento {retries}/{budget} en {delay:.1f}s desde {offset:.3f}s"
+        )
+        for stream, _ in targets:
+            publish_broadcast_telemetry(stream.id, progress.latest() or {}, status='reconnecting')
+        if progress.cancelled.wait(delay) or not any(broadcast_still_wanted(stream) for stream, _ in targets):
+            return returncode
+
+def finish_broadcast(stream, run, returncode, due_time, progress):
+    """
+    Cierra la ejecución de un stream: estado final, próxima ocurrencia y reprogramación.
+
+    Una transmisión cancelada (desactivada, editada o borrada) solo cierra
+    su ejecución y deja el stream pendiente; si el stream se borró mientras
+    salía al aire no queda fila que actualizar.
+    """
+    if run.skew_ms is None and progress.on_air_at:
+        record_on_air(run, progress.on_air_at)
+    run.ended_at = datetime.now()
+    run.returncode = returncode
+    # Un stream borrado durante la transmisión ya no tiene fila: se usa el id de la ejecución
+    cancelled = progress.cancelled.is_set() or progress.is_dropped(run.stream_id)
+    run.status = 'cancelled' if cancelled else 'completed' if returncode == 0 else 'error'
+    
+    try:
+        db.session.refresh(stream)
+    except InvalidRequestError:
+        print(f"Stream {run.stream_id} fue eliminado durante la transmisión")
+        db.session.expunge(stream)
+        db.session.commit()
+        return
     
-    current_time = datetime.now()
-    base_time = max(stream.last_played, current_time)
+    if cancelled:
+        # En modo pool el stream pudo pasar a otro runner: no se pisa su estado
+        print(f"Stream {stream.id} cancelado durante la transmisión (código de salida {returncode})")
+        if not app.config['RUNNER_POOL'] or stream.owner == broadcast_runner.node_id:
+            stream.status = 'pending'
+            stream.owner = None
+            stream.lease_expires_at = None
+        db.session.commit()
+        return
     
-    if stream.repeat_type == 'once':
-        return None
-    elif stream.repeat_type == 'daily':
-        next_run = base_time + timedelta(days=1)
-        return datetime.combine(next_run.date(), stream.scheduled_time.time())
-    elif stream.repeat_type == 'weekly':
-        next_run = base_time + timedelta(weeks=1)
-        return datetime.combine(next_run.date(), stream.scheduled_time.time())
-    elif stream.repeat_type == 'monthly':
-        # Calcular el próximo mes manteniendo el mismo día del mes
-        next_month = base_time.replace(day=1) + timedelta(days=32)
-        next_run = next_month.replace(day=min(stream.scheduled_time.day, (next_month.replace(day=1) + timedelta(days=32) - timedelta(days=1)).day))
-        return datetime.combine(next_run.date(), stream.scheduled_time.time())
-    return None
+    if returncode == 0:
+        print(f"\n{'='*50}")
+        print(f"Stream {stream.id} completado exitosamente")
+        print(f"Duración total: {datetime.now() - stream.last_played}")
+        stream.status = 'completed'
+        
+        # Calcular próxima ejecución (posterior a la ocurrencia que acaba de transmitirse)
+        next_run = None
+        if stream.repeat_type != 'once':
+            next_run = compute_next_run(stream, max(datetime.now(), due_time))
+        stream.next_run_at = next_run
+        if next_run:
+            stream.status = 'pending'
+            print(f"Próxima ejecución programada: {next_run}")
+        else:
+            stream.is_active = False
+            print("No hay más repeticiones programadas")
+        
+        print(f"{'='*50}\n")
+    else:
+        print(f"\n{'='*50}")
+        print(f"Error en stream {stream.id}:")
+        print(f"Código de salida: {returncode}")
+        print("Últimas líneas de ffmpeg:")
+        print(progress.stderr_tail())
+        print(f"{'='*50}\n")
+        stream.status = 'error'
+    
+    stream.owner = None
+    stream.lease_expires_at = None
+    db.session.commit()
+    
+    # Reprogramar si es necesario
+    if stream.is_active and stream.status == 'pending':
+        schedule_stream(stream)
 
-def get_absolute_path(relative_path):
-    """Convierte una ruta relativa a absoluta, relativa al directorio de uploads"""
-    if os.path.isabs(relative_path):
-        return relative_path
-    return os.path.join(app.config['UPLOAD_FOLDER'], relative_path)
+def start_solo_broadcast(stream_id, resume_offset=0.0):
+    """Encola un stream para que salga por separado (fuera de su grupo tee), opcionalmente desde resume_offset"""
+    stream = db.session.get(Stream, stream_id)
+    if not stream:
+        return
+    broadcast_executor.submit(
+        stream.id, get_broadcast_profile(stream.video_params), stream.priority,
+        stream.next_run_at or stream.scheduled_time, solo=True, resume_offset=resume_offset
+    )
+
+def stream_video(stream_id, solo=False, resume_offset=0.0):
+    """
+    Función que maneja la transmisión del video.
 
-def stream_video(stream_id):
-    """Función que maneja la transmisión del video"""
+    Si se invoca antes de la hora programada (pre-roll), valida el archivo,
+    precalienta la caché de disco y el destino RTMP, registra la ejecución y
+    espera para lanzar ffmpeg a la hora menos su tiempo de arranque estimado.
+    El estado del stream se escribe después de lanzar ffmpeg, así nada se
+    interpone entre el fin de la espera y el lanzamiento.
+
+    Los streams con el mismo archivo, parámetros y hora salen en un solo
+    ffmpeg con el muxer tee: el primero en llegar lanza el proceso y los
+    demás terminan aquí. Con solo=True el stream sale por separado, p. ej.
+    un destino que falló dentro del grupo y se reanuda en resume_offset.
+    """
     with app.app_context():
+        targets, fanout_key, cores_key = [], None, None
         try:
             stream = db.session.get(Stream, stream_id)
             if not stream:
                 print(f"Error: Stream {stream_id} no encontrado")
                 return
+            if app.config['RUNNER_POOL'] and stream.owner != broadcast_runner.node_id:
+                print(f"Stream {stream_id} fue reclamado por otro runner ({stream.owner})")
+                return
+            
+            due_time = stream.next_run_at or stream.scheduled_time
+            if app.config['FANOUT_BROADCASTS'] and not solo:
+                key = (stream.input_path, stream.video_params or '-c:v copy -c:a aac -f flv', due_time)
+                leader = fanout_groups.join(key, stream_id)
+                if leader is not None:
+                    print(f"Stream {stream_id} sale en el mismo ffmpeg que el stream {leader} (tee)")
+                    return
+                fanout_key = key
             
             print(f"\n{'='*50}")
             print(f"Iniciando transmisión del stream {stream_id} - {stream.name}")
@@ -165,69 +3500,149 @@ def stream_video(stream_id):
             print(f"Tipo de repetición: {stream.repeat_type}")
             print(f"{'='*50}\n")
             
-            # Convertir la ruta de entrada a absoluta
+            # Convertir la ruta de entrada a absoluta (si la anticipación no lo trajo del almacenamiento frío, se trae ahora)
             absolute_input_path = get_absolute_path(stream.input_path)
+            if storage_tiers.recall(stream.input_path):
+                print(f"Advertencia: {stream.input_path} estaba en el almacenamiento frío al lanzar el stream {stream_id}")
             if not os.path.exists(absolute_input_path):
                 print(f"Error: Archivo de video no encontrado en {absolute_input_path}")
                 stream.status = 'error'
+                stream.owner = None
+                stream.lease_expires_at = None
                 db.session.commit()
                 return
             
-            stream.status = 'streaming'
-            stream.last_played = datetime.now()
-            stream.play_count += 1
+            profile = get_broadcast_profile(stream.video_params)
+            progress = start_broadcast_progress(stream_id)
+            run = BroadcastRun(
+                stream_id=stream.id, node=broadcast_runner.node_id, profile=profile,
+                due_at=due_time, preroll_at=datetime.now()
+            )
+            targets.append((stream, run))
+            probe = media_probes.get(stream.input_path)
+            if probe and probe['error']:
+                run.error = f"ffprobe: {probe['error']}"[:500]
+                print(f"Advertencia: ffprobe no pudo analizar {stream.input_path}: {probe['error']}")
+            if due_time > datetime.now() and not resume_offset:
+                warm_input_file(absolute_input_path, app.config['PREROLL_READAHEAD_BYTES'])
+                run.rtmp_connect_ms, rtmp_error = check_rtmp_endpoint(stream.output_rtmp, app.config['PREROLL_RTMP_TIMEOUT'])
+                if rtmp_error:
+                    run.error = '; '.join(filter(None, [run.error, f"RTMP: {rtmp_error}"]))[:500]
+                    print(f"Advertencia: el destino RTMP no responde en el pre-roll: {rtmp_error}")
+            if resume_offset:
+                run.error = '; '.join(filter(None, [run.error, f"Reanudado por separado en {resume_offset:.3f}s"]))[:500]
+            lead = launch_leads.get(profile)
+            db.session.add(run)
             db.session.commit()
             
-            # Comando ffmpeg para streaming
-            command = ['ffmpeg', '-re', '-i', absolute_input_path]
-            # Usar parámetros por defecto si no hay personalizados
-            video_params = (stream.video_params or '-c:v copy -c:a aac -f flv').split()
-            command.extend(video_params)
-            command.append(stream.output_rtmp)
+            # Esperar hasta la hora programada menos el tiempo de arranque de ffmpeg (una reanudación sale ya)
+            wait = 0 if resume_offset else (due_time - datetime.now()).total_seconds() - lead
+            if wait > 0:
+                print(f"Pre-roll listo: ffmpeg se lanza en {wait:.3f}s ({lead:.3f}s antes de la hora)")
+                if progress.cancelled.wait(wait):
+                    print(f"Stream {stream_id} cancelado durante el pre-roll")
+                    run.status = 'cancelled'
+                    run.ended_at = datetime.now()
+                    db.session.commit()
+                    targets.clear()
+                    # Los que se sumaron al grupo salen igual, cada uno por su cuenta
+                    for member_id in fanout_groups.close(fanout_key) if fanout_key else []:
+                        start_solo_broadcast(member_id)
+                    return
+            
+            # Sumar al grupo los hermanos que llegaron durante el pre-roll o que todavía no se dispararon
+            if fanout_key:
+                for member_id in fanout_groups.close(fanout_key, claim_fanout_siblings(stream, due_time)):
+                    member = db.session.get(Stream, member_id)
+                    if not member or not broadcast_still_wanted(member):
+                        continue
+                    member_run = BroadcastRun(
+                        stream_id=member_id, node=broadcast_runner.node_id, profile=profile,
+                        due_at=due_time, preroll_at=run.preroll_at
+                    )
+                    db.session.add(member_run)
+                    targets.append((member, member_run))
+                    with broadcast_progress_lock:
+                        broadcast_progress[member_id] = progress
+                db.session.commit()
+            
+            # Núcleos para transcodificar (-threads y afinidad) según el costo calibrado de los parámetros
+            cores_key = f'run-{run.id}'
+            cores = allocate_encoding_cores(cores_key, stream.video_params)
+            if cores:
+                print(f"Núcleos asignados: {cores}")
+            
+            # Comando ffmpeg para streaming (los destinos del tee, en el orden del último lanzamiento)
+            slaves = []
+            
+            def build_command(offset):
+                slaves[:] = list(targets)
+                return build_broadcast_command(
+                    [target for target, _ in slaves], absolute_input_path, offset, threads=len(cores) or None
+                )
             
             print("Ejecutando ffmpeg:")
-            print(f"Comando: {' '.join(command)}")
-            print("\nIniciando proceso de streaming...")
+            print(f"Comando: {' '.join(build_command(resume_offset))}")
+            if len(targets) > 1:
+                print(f"Un solo ffmpeg para los streams {[target.id for target, _ in targets]} (tee)")
             
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+            def on_spawn():
+                launched_at = datetime.now()
+                BROADCAST_START_LAG.observe(max(0.0, (launched_at - due_time).total_seconds()))
+                for target, target_run in targets:
+                    target_run.launched_at = launched_at
+                    target_run.lead_ms = round((due_time - launched_at).total_seconds() * 1000)
+                    target.status = 'streaming'
+                    target.last_played = launched_at
+                    if not resume_offset:
+                        target.play_count += 1
+                db.session.commit()
+                print("\nIniciando proceso de streaming...")
             
-            stdout, stderr = process.communicate()
+            # Destinos del tee que fallaron (índice en slaves), informados por stderr
+            failed_slaves = set()
             
-            if process.returncode == 0:
-                print(f"\n{'='*50}")
-                print(f"Stream {stream_id} completado exitosamente")
-                print(f"Duración total: {datetime.now() - stream.last_played}")
-                stream.status = 'completed'
-                
-                # Calcular próxima ejecución
-                next_run = calculate_next_run(stream)
-                if next_run:
-                    stream.scheduled_time = next_run
-                    stream.status = 'pending'
-                    print(f"Próxima ejecución programada: {next_run}")
-                else:
-                    stream.is_active = False
-                    print("No hay más repeticiones programadas")
-                
-                print(f"{'='*50}\n")
-            else:
-                print(f"\n{'='*50}")
-                print(f"Error en stream {stream_id}:")
-                print(f"Código de salida: {process.returncode}")
-                print("Mensaje de error:")
-                print(stderr.decode())
-                print(f"{'='*50}\n")
-                stream.status = 'error'
+            def on_stderr(line):
+                match = re.match(r'.*Slave muxer #(\d+) failed', line)
+                if match:
+                    failed_slaves.add(int(match.group(1)))
             
-            db.session.commit()
+            def on_sample(sample):
+                for index in sorted(failed_slaves):
+                    failed_slaves.discard(index)
+                    if index >= len(slaves) or slaves[index] not in targets or len(targets) < 2:
+                        continue
+                    target, target_run = slaves[index]
+                    targets.remove(slaves[index])
+                    print(f"Stream {target.id}: su destino falló dentro del tee; sigue por separado en {sample['position']:.3f}s")
+                    target_run.status = 'error'
+                    target_run.ended_at = datetime.now()
+                    target_run.error = 'El destino falló dentro del grupo tee y siguió por separado'
+                    db.session.commit()
+                    start_solo_broadcast(target.id, sample['position'])
+                if progress.on_air_at and any(target_run.skew_ms is None for _, target_run in targets):
+                    for _, target_run in targets:
+                        if target_run.skew_ms is None:
+                            record_on_air(target_run, progress.on_air_at)
+                    db.session.commit()
+                for _, target_run in targets:
+                    publish_broadcast_telemetry(target_run.stream_id, sample)
             
-            # Reprogramar si es necesario
-            if stream.is_active and stream.status == 'pending':
-                schedule_stream(stream)
+            def on_drop(target, target_run, returncode):
+                print(f"Stream {target_run.stream_id}: cancelado; el resto del grupo tee se relanza sin su destino")
+                publish_broadcast_telemetry(target_run.stream_id, progress.latest() or {}, status='cancelled')
+                finish_broadcast(target, target_run, returncode, due_time, progress)
+            
+            returncode = supervise_broadcast(
+                targets, progress, build_command, on_sample=on_sample, on_spawn=on_spawn,
+                offset=resume_offset, on_stderr=on_stderr, cores=cores, on_drop=on_drop
+            )
+            for target, target_run in targets:
+                publish_broadcast_telemetry(
+                    target_run.stream_id, progress.latest() or {},
+                    status='cancelled' if progress.cancelled.is_set() else 'completed' if returncode == 0 else 'error'
+                )
+                finish_broadcast(target, target_run, returncode, due_time, progress)
             
         except Exception as e:
             print(f"\n{'='*50}")
@@ -235,99 +3650,1155 @@ def stream_video(stream_id):
             print(str(e))
             print(f"{'='*50}\n")
             try:
-                stream.status = 'error'
+                db.session.rollback()
+                for target, target_run in targets or [(stream, None)]:
+                    target.status = 'error'
+                    target.owner = None
+                    target.lease_expires_at = None
+                    if target_run is not None and target_run.id is not None:
+                        target_run.status = 'error'
+                        target_run.ended_at = datetime.now()
+                        target_run.error = str(e)[:500]
                 db.session.commit()
             except:
                 print("Error al actualizar estado del stream")
+        finally:
+            if cores_key:
+                cpu_allocator.release(cores_key)
+            if fanout_key:
+                fanout_groups.discard(fanout_key)
 
 def schedule_stream(stream):
     """Programa un stream para su transmisión"""
     job_id = f'stream_{stream.id}'
     
-    # Remover el trabajo anterior si existe
-    try:
-        if scheduler.get_job(job_id):
-            scheduler.remove_job(job_id)
-    except Exception as e:
-        print(f"Error al remover trabajo anterior: {str(e)}")
-    
-    # Programar el nuevo trabajo
+    # Programar el nuevo trabajo (reemplaza el anterior si existe)
     try:
+        # Referencia importable: los trabajos los ejecuta el runner, que no es el proceso que los escribe
         scheduler.add_job(
-            func=stream_video,
+            func='app:enqueue_broadcast',
             trigger='date',
-            run_date=stream.scheduled_time,
+            run_date=preroll_run_date(stream.next_run_at or stream.scheduled_time),
             id=job_id,
-            args=[stream.id]
+            args=[stream.id],
+            misfire_grace_time=get_misfire_grace(stream.repeat_type),
+            replace_existing=True
         )
-        print(f"Stream {stream.id} programado para {stream.scheduled_time}")
+        JOBS_SCHEDULED.inc()
+        send_runner_command({'cmd': 'wakeup'})
+        print(f"Stream {stream.id} programado para {stream.next_run_at or stream.scheduled_time}")
     except Exception as e:
         print(f"Error al programar stream: {str(e)}")
         raise
 
+def handle_missed_broadcast(stream_id):
+    """Reprograma (o expira) un stream cuyo trabajo superó el margen de misfire"""
+    with app.app_context():
+        stream = db.session.get(Stream, stream_id)
+        if not stream or not stream.is_active or stream.status != 'pending':
+            return
+        missed_time = stream.next_run_at or stream.scheduled_time
+        next_run = compute_next_run(stream, datetime.now()) if stream.repeat_type != 'once' else None
+        stream.next_run_at = next_run
+        if next_run:
+            print(f"Stream {stream_id} perdió su horario {missed_time}; siguiente ocurrencia: {next_run}")
+            db.session.commit()
+            schedule_stream(stream)
+        else:
+            print(f"Stream {stream_id} perdió su horario {missed_time} y expiró")
+            stream.status = 'expired'
+            stream.is_active = False
+            db.session.commit()
+
+def rehydrate_schedule():
+    """
+    Reconcilia en una sola pasada los streams activos con los trabajos guardados.
+
+    Los trabajos que ya coinciden con su stream no se tocan, así un reinicio en
+    caliente solo hace dos consultas. Los que faltan o cambiaron se escriben con
+    el scheduler en pausa (nada se dispara a mitad de la reconciliación); los
+    streams atrasados más allá del margen de misfire avanzan a su siguiente
+    ocurrencia o expiran, y se eliminan los trabajos huérfanos. Sin modo pool,
+    los streams que un runner caído dejó en cola vuelven a pendientes y los
+    que dejó al aire se cierran con error (las series siguen con su próxima
+    ocurrencia).
+    """
+    start = time.perf_counter()
+    now = datetime.now()
+    interrupted = set()
+    if not app.config['RUNNER_POOL']:
+        # En modo pool los leases vencidos los reclama RunnerPool; aquí solo este proceso transmite
+        local = broadcast_executor.active()
+        stuck = [
+            row for row in db.session.execute(
+                db.select(Stream.id, Stream.status, Stream.repeat_type).where(Stream.status.in_(('queued', 'streaming')))
+            ) if row.id not in local
+        ]
+        if stuck:
+            stuck_ids = [row.id for row in stuck]
+            on_air = [row.id for row in stuck if row.status == 'streaming']
+            interrupted = {row.id for row in stuck if row.status == 'streaming' and row.repeat_type != 'once'}
+            db.session.execute(
+                db.update(Stream).where(Stream.id.in_(stuck_ids)).values(status='pending', owner=None, lease_expires_at=None)
+            )
+            db.session.execute(
+                db.update(Stream).where(Stream.id.in_(on_air), Stream.repeat_type == 'once').values(status='error')
+            )
+            db.session.execute(
+                db.update(BroadcastRun).where(BroadcastRun.stream_id.in_(stuck_ids), BroadcastRun.ended_at.is_(None))
+                .values(status='error', ended_at=now, error='Interrumpida: el runner se detuvo durante la transmisión')
+            )
+            print(f"Streams interrumpidos por la caída del runner: {len(on_air)} al aire, {len(stuck) - len(on_air)} en cola")
+    store = job_store
+    stored = {
+        job_id: next_run_time
+        for job_id, next_run_time in db.session.execute(
+            db.select(store.jobs_t.c.id, store.jobs_t.c.next_run_time)
+        )
+    }
+    rows = db.session.execute(
+        db.select(Stream.id, Stream.scheduled_time, Stream.next_run_at, Stream.repeat_type).where(
+            Stream.is_active == True,
+            Stream.status == 'pending'
+        )
+    ).all()
+
+    run_dates, overdue, expired, materialized = {}, [], [], []
+    repeat_types = {}
+    for stream_id, scheduled_time, next_run_at, repeat_type in rows:
+        repeat_types[stream_id] = repeat_type
+        if stream_id in interrupted:
+            overdue.append(stream_id)  # la ocurrencia interrumpida ya salió al aire: no se repite
+            continue
+        run_date = next_run_at or scheduled_time
+        if run_date < now - timedelta(seconds=get_misfire_grace(repeat_type)):
+            (expired if repeat_type == 'once' else overdue).append(stream_id)
+            continue
+        if next_run_at is None:
+            materialized.append({'id': stream_id, 'next_run_at': run_date})
+        run_dates[stream_id] = run_date
+
+    # Las series atrasadas más allá del margen avanzan todas juntas a su siguiente ocurrencia;
+    # las que ya no tienen ninguna expiran como las únicas
+    if overdue:
+        next_runs = recompute_next_runs(overdue, now)
+        for stream_id in overdue:
+            next_run = next_runs.get(stream_id)
+            if next_run:
+                run_dates[stream_id] = next_run
+            else:
+                expired.append(stream_id)
+
+    written = 0
+    for stream_id, run_date in run_dates.items():
+        job_id = f'stream_{stream_id}'
+        trigger = DateTrigger(run_date=preroll_run_date(run_date), timezone=scheduler.timezone)
+        if stored.pop(job_id, None) == datetime_to_utc_timestamp(trigger.run_date):
+            continue
+        scheduler.add_job(
+            func='app:enqueue_broadcast',
+            trigger=trigger,
+            id=job_id,
+            args=[stream_id],
+            misfire_grace_time=get_misfire_grace(repeat_types[stream_id]),
+            replace_existing=True
+        )
+        written += 1
+
+    orphaned = [job_id for job_id in stored if job_id.startswith('stream_')]
+    for job_id in orphaned:
+        try:
+            scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass  # otro proceso ya lo quitó
+    if materialized:
+        db.session.execute(db.update(Stream), materialized)
+    if expired:
+        db.session.execute(
+            db.update(Stream).where(Stream.id.in_(expired)).values(status='expired', is_active=False, next_run_at=None)
+        )
+    db.session.commit()
+    scheduler.wakeup()
+
+    print(
+        f"Scheduler rehidratado en {time.perf_counter() - start:.3f}s: {len(rows)} streams, "
+        f"{written} trabajos escritos, {len(overdue)} reprogramados, "
+        f"{len(expired)} expirados, {len(orphaned)} huérfanos eliminados"
+    )
+
 # Clase para manejar eventos del sistema de archivos
 class StreamMonitor(FileSystemEventHandler):
-    def __init__(self):
+    """
+    Grabaciones entrantes: los .flv que nginx-rtmp escribe en uploads/receiving.
+
+    Los eventos de inotify solo registran qué archivos están activos (una
+    grabación genera miles de modificaciones por segundo). Cada `interval`
+    segundos se leen los tamaños, se calcula la tasa de ingesta, se marcan
+    las grabaciones que no crecieron en `stall_after` segundos y se emite un
+    único evento streams_update con todas las grabaciones activas.
+
+    Una grabación termina cuando nginx cierra el archivo (evento closed de
+    inotify) o, con el observador por sondeo, cuando no crece en
+    `finish_after` segundos; entonces pasa a la cola de post-grabación.
+    """
+    def __init__(self, interval, stall_after, finish_after):
+        self.interval = interval
+        self.stall_after = stall_after
+        self.finish_after = finish_after
         self.active_streams = {}
+        # Último muestreo por grabación: (instante, tamaño, último instante en que creció)
+        self.samples = {}
         self.lock = threading.Lock()
+        self._started = False
+
+    def track(self, path):
+        """Registra una grabación; devuelve False si ya estaba activa"""
+        stream_name = os.path.basename(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with self.lock:
+            if stream_name in self.active_streams:
+                return False
+            now = time.monotonic()
+            self.active_streams[stream_name] = {
+                'start_time': datetime.now().isoformat(),
+                'path': path,
+                'size': size,
+                'bitrate_kbps': 0.0,
+                'stalled': False
+            }
+            self.samples[stream_name] = (now, size, now)
+            if not self._started:
+                self._started = True
+                socketio.start_background_task(self._run)
+        return True
+
+    def untrack(self, stream_name):
+        with self.lock:
+            self.samples.pop(stream_name, None)
+            return self.active_streams.pop(stream_name, None) is not None
 
     def on_created(self, event):
         if event.is_directory:
             return
+        WATCHDOG_EVENTS.inc(event='created')
+        if event.src_path.endswith('.flv') and self.track(event.src_path):
+            publish_event('stream_started', {'stream': os.path.basename(event.src_path)})
+
+    def on_modified(self, event):
+        if event.is_directory:
+            return
+        WATCHDOG_EVENTS.inc(event='modified')
+        # El tamaño lo lee el muestreo; aquí solo se recoge una grabación que empezó antes que el monitor
+        if event.src_path.endswith('.flv') and os.path.basename(event.src_path) not in self.active_streams:
+            if self.track(event.src_path):
+                publish_event('stream_started', {'stream': os.path.basename(event.src_path)})
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            return
+        WATCHDOG_EVENTS.inc(event='deleted')
+        if event.src_path.endswith('.flv'):
+            stream_name = os.path.basename(event.src_path)
+            if self.untrack(stream_name):
+                publish_event('stream_ended', {'stream': stream_name})
+
+    def on_closed(self, event):
+        if event.is_directory:
+            return
+        WATCHDOG_EVENTS.inc(event='closed')
         if event.src_path.endswith('.flv'):
+            self.finish(os.path.basename(event.src_path))
+
+    def finish(self, stream_name):
+        """La grabación terminó: deja de muestrearse y el runner líder la encola para post-grabación"""
+        if not self.untrack(stream_name):
+            return
+        publish_event('stream_ended', {'stream': stream_name})
+        if broadcast_runner.is_leader:
+            post_record.submit(stream_name)
+
+    def sample(self):
+        """Lee el tamaño de cada grabación activa y emite el lote de actualizaciones"""
+        with self.lock:
+            paths = [(stream_name, info['path']) for stream_name, info in self.active_streams.items()]
+        updates, ended, finished = [], [], []
+        for stream_name, path in paths:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                ended.append(stream_name)  # movida o borrada sin que llegara el evento
+                continue
+            now = time.monotonic()
             with self.lock:
-                stream_name = os.path.basename(event.src_path)
-                self.active_streams[stream_name] = {
-                    'start_time': datetime.now().isoformat(),
-                    'path': event.src_path,
-                    'size': 0
-                }
-            socketio.emit('stream_started', {'stream': stream_name})
+                info = self.active_streams.get(stream_name)
+                if info is None:
+                    continue
+                sampled_at, previous_size, grew_at = self.samples[stream_name]
+                if size != previous_size:
+                    grew_at = now
+                elapsed = now - sampled_at
+                info['size'] = size
+                info['bitrate_kbps'] = round(max(0, size - previous_size) * 8 / 1000 / elapsed, 1) if elapsed > 0 else 0.0
+                stalled = now - grew_at >= self.stall_after
+                if stalled and not info['stalled']:
+                    INGEST_STALLS.inc()
+                    print(f"Grabación {stream_name} sin datos desde hace {now - grew_at:.1f}s")
+                elif info['stalled'] and not stalled:
+                    print(f"Grabación {stream_name} volvió a recibir datos")
+                info['stalled'] = stalled
+                self.samples[stream_name] = (now, size, grew_at)
+                if now - grew_at >= self.finish_after:
+                    finished.append(stream_name)
+                    continue
+                updates.append({
+                    'stream': stream_name,
+                    'size': size,
+                    'bitrate_kbps': info['bitrate_kbps'],
+                    'stalled': stalled
+                })
+        for stream_name in ended:
+            if self.untrack(stream_name):
+                publish_event('stream_ended', {'stream': stream_name})
+        for stream_name in finished:
+            self.finish(stream_name)
+        if updates:
+            publish_event('streams_update', updates)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Error al muestrear las grabaciones entrantes: {str(e)}")
+
+    def get_active_streams(self):
+        with self.lock:
+            return {stream_name: dict(info) for stream_name, info in self.active_streams.items()}
+
+class FileCatalog(FileSystemEventHandler):
+    """
+    Catálogo en memoria de la carpeta de uploads.
+
+    En los runners se llena con un único recorrido al iniciar y después se
+    mantiene con los eventos del Observer de watchdog, de modo que listar
+    archivos no recorre el disco. Los procesos web no vigilan la carpeta:
+    la recorren al listar solo si cambió su fecha de modificación (altas,
+    bajas y renombres de otros procesos). Cada cambio incrementa la versión
+    (usada como ETag) y se publica agrupado por Socket.IO en el evento
+    'files_delta'.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.watched = False
+        self.folder_mtime = None
+        self.sync_lock = threading.Lock()
+        self.files = {}
+        self.total_size = 0
+        self.version = 0
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self._listing = (None, None)
+        self.deltas = EventCoalescer('files_delta', app.config['TELEMETRY_INTERVAL'])
+
+    def scan(self):
+        """Recorre la carpeta una sola vez para construir el catálogo inicial"""
+        files = {}
+        probes = media_probes.load_all()
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if self._is_catalog_name(entry.name) and entry.is_file():
+                        stat = entry.stat()
+                        files[entry.name] = self._make_entry(entry.name, stat)
+                        probe = probes.get(entry.name)
+                        if probe and (probe.size, probe.mtime) == (stat.st_size, stat.st_mtime):
+                            files[entry.name]['probe'] = probe.to_dict()
+        except OSError as e:
+            print(f"Error al listar archivos: {str(e)}")
+        with self.lock:
+            self.files = files
+            self.total_size = sum(entry['size'] for entry in files.values())
+            self.version += 1
+        self.ready.set()
+
+    def sync(self):
+        """Sin watchdog, vuelve a recorrer la carpeta si cambió desde el último recorrido"""
+        if self.watched:
+            return
+        with self.sync_lock:
+            try:
+                mtime = os.stat(self.folder).st_mtime_ns
+            except OSError:
+                return
+            if mtime != self.folder_mtime:
+                self.folder_mtime = mtime
+                self.scan()
+
+    def _is_catalog_name(self, name):
+        # Se ignoran archivos ocultos (temporales, subidas parciales)
+        return not name.startswith('.')
+
+    def _make_entry(self, name, stat):
+        return {
+            'name': name,
+            'size': stat.st_size,
+            'size_formatted': format_size(stat.st_size),
+            'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+            'mtime': stat.st_mtime,
+            'type': os.path.splitext(name)[1][1:].upper() or 'FILE',
+            'probe': None
+        }
+
+    def refresh(self, path):
+        """Actualiza (o elimina) la entrada de un archivo de la carpeta"""
+        if os.path.dirname(path) != self.folder:
+            return
+        name = os.path.basename(path)
+        if not self._is_catalog_name(name):
+            return
+        try:
+            stat = os.stat(path)
+            entry = self._make_entry(name, stat) if os.path.isfile(path) else None
+        except FileNotFoundError:
+            entry = None
+        with self.lock:
+            previous = self.files.pop(name, None)
+            if previous:
+                self.total_size -= previous['size']
+                # El análisis sigue valiendo si el archivo no cambió
+                if entry and (previous['size'], previous['mtime']) == (entry['size'], entry['mtime']):
+                    entry['probe'] = previous['probe']
+            if entry:
+                self.files[name] = entry
+                self.total_size += entry['size']
+            elif not previous:
+                return
+            self._publish(name, entry)
+        if not entry:
+            preview_renditions.discard(name)
+
+    def set_probe(self, name, size, mtime, probe):
+        """Adjunta el resultado de ffprobe a la entrada si el archivo no cambió desde el análisis"""
+        with self.lock:
+            entry = self.files.get(name)
+            if not entry or (entry['size'], entry['mtime']) != (size, mtime):
+                return
+            entry = dict(entry, probe=probe)
+            self.files[name] = entry
+            self._publish(name, entry)
+
+    def _publish(self, name, entry):
+        # Se llama con self.lock tomado
+        self.version += 1
+        self.deltas.publish(name, {
+            'action': 'upsert' if entry else 'remove',
+            'name': name,
+            'file': entry,
+            'version': self.version,
+            'total_size': format_size(self.total_size)
+        })
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.refresh(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.refresh(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.refresh(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.refresh(event.src_path)
+            self.refresh(event.dest_path)
+
+    def etag(self):
+        self.sync()
+        return f'{self.instance_id}-{self.version}'
+
+    def listing(self):
+        """Lista ordenada por fecha de modificación; se recalcula solo si cambió la versión"""
+        self.sync()
+        self.ready.wait()
+        with self.lock:
+            version, cached = self._listing
+            if version != self.version:
+                cached = (
+                    sorted(self.files.values(), key=lambda entry: entry['mtime'], reverse=True),
+                    format_size(self.total_size)
+                )
+                self._listing = (self.version, cached)
+            return cached
+
+# Inicializar el monitor
+stream_monitor = StreamMonitor(
+    app.config['INGEST_SAMPLE_INTERVAL'], app.config['INGEST_STALL_SECONDS'], app.config['RECORD_FINISH_SECONDS']
+)
+metrics.gauge('rtmp_active_recordings', 'Grabaciones entrantes activas en la carpeta receiving').set_function(
+    lambda: len(stream_monitor.get_active_streams())
+)
+metrics.gauge('rtmp_ingest_bitrate_kbps', 'Tasa de ingesta total de las grabaciones entrantes (kbit/s)').set_function(
+    lambda: sum(info['bitrate_kbps'] for info in stream_monitor.get_active_streams().values())
+)
+metrics.gauge('rtmp_broadcast_queue_length', 'Transmisiones esperando en la cola del ejecutor').set_function(
+    lambda: sum(len(queue) for queue in broadcast_executor.queues.values())
+)
+# inotify bloquea el proceso completo en un bucle de eventos (gevent/eventlet): ahí se usa sondeo
+if app.config['SOCKETIO_ASYNC_MODE'] == 'threading':
+    observer = Observer()
+else:
+    observer = PollingObserver(timeout=app.config['WATCHDOG_POLL_INTERVAL'])
+observer.schedule(stream_monitor, os.path.join(app.config['UPLOAD_FOLDER'], 'receiving'), recursive=False)
+file_catalog = FileCatalog(app.config['UPLOAD_FOLDER'])
+observer.schedule(file_catalog, app.config['UPLOAD_FOLDER'], recursive=False)
+
+class BroadcastRunner:
+    """
+    Elección de líder y canal de comandos del runner de transmisiones.
+
+    El líder renueva cada RUNNER_LEASE_RENEW segundos una fila de la tabla
+    runner_lease; mientras la tenga, reanuda el scheduler, atiende el socket
+    de comandos y relee el almacén de trabajos cada SCHEDULER_POLL_INTERVAL.
+    Un runner en espera toma el lease cuando vence (RUNNER_LEASE_TTL).
+    """
+    LEASE_NAME = 'broadcast_runner'
+
+    def __init__(self):
+        self.node_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.is_leader = False
+        self.command_socket = None
+
+    def try_acquire_lease(self):
+        now = datetime.now()
+        with app.app_context():
+            if not db.session.get(RunnerLease, self.LEASE_NAME):
+                try:
+                    db.session.add(RunnerLease(name=self.LEASE_NAME, expires_at=now))
+                    db.session.commit()
+                except IntegrityError:
+                    db.session.rollback()
+            result = db.session.execute(
+                db.update(RunnerLease)
+                .where(
+                    RunnerLease.name == self.LEASE_NAME,
+                    db.or_(RunnerLease.holder == self.node_id, RunnerLease.expires_at < now)
+                )
+                .values(
+                    holder=self.node_id,
+                    expires_at=now + timedelta(seconds=app.config['RUNNER_LEASE_TTL']),
+                    renewed_at=now
+                )
+            )
+            db.session.commit()
+            return result.rowcount == 1
+
+    def release_lease(self):
+        with app.app_context():
+            db.session.execute(
+                db.update(RunnerLease)
+                .where(RunnerLease.name == self.LEASE_NAME, RunnerLease.holder == self.node_id)
+                .values(expires_at=datetime.now())
+            )
+            db.session.commit()
+
+    def run(self):
+        """Bucle del runner: renueva (o intenta tomar) el lease y relee el almacén de trabajos"""
+        last_poll = last_storage_check = time.monotonic()
+        while True:
+            try:
+                leader = self.try_acquire_lease()
+            except Exception as e:
+                print(f"Error al renovar el lease del runner: {str(e)}")
+                leader = False
+            if leader and not self.is_leader:
+                self.promote()
+            elif not leader and self.is_leader:
+                self.demote()
+            if self.is_leader and time.monotonic() - last_poll >= app.config['SCHEDULER_POLL_INTERVAL']:
+                last_poll = time.monotonic()
+                scheduler.wakeup()
+                channel_manager.sync()
+            if self.is_leader and time.monotonic() - last_storage_check >= app.config['STORAGE_CHECK_INTERVAL']:
+                last_storage_check = time.monotonic()
+                storage_tiers.tick()
+            time.sleep(app.config['RUNNER_LEASE_RENEW'])
+
+    def promote(self):
+        print(f"Runner {self.node_id}: lease obtenido, tomando el scheduler")
+        self.is_leader = True
+        self.open_command_socket()
+        with app.app_context():
+            rehydrate_schedule()
+            backup_database()
+        scheduler.resume()
+        channel_manager.sync()
+        threading.Thread(target=post_record.recover, name='postrecord-recover', daemon=True).start()
+
+    def demote(self):
+        print(f"Runner {self.node_id}: lease perdido, scheduler en pausa")
+        self.is_leader = False
+        scheduler.pause()
+        channel_manager.stop_all()
+        if self.command_socket:
+            self.command_socket.close()
+            self.command_socket = None
+
+    def open_command_socket(self):
+        path = app.config['RUNNER_COMMAND_SOCKET']
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.command_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.command_socket.bind(path)
+        threading.Thread(target=self.serve_commands, args=(self.command_socket,), name='runner-commands', daemon=True).start()
+
+    def serve_commands(self, command_socket):
+        while True:
+            try:
+                data, address = command_socket.recvfrom(65536)
+            except OSError:
+                return  # socket cerrado al perder el lease
+            try:
+                reply = self.handle_command(json.loads(data))
+                if address:
+                    command_socket.sendto(json.dumps(reply).encode('utf-8'), address)
+            except Exception as e:
+                if self.command_socket is command_socket:
+                    print(f"Error al atender comando del runner: {str(e)}")
+
+    def handle_command(self, command):
+        """Ejecuta un comando recibido de un proceso web (o del mismo proceso)"""
+        name = command.get('cmd')
+        if name == 'wakeup':
+            scheduler.wakeup()
+            return {'ok': True}
+        if name == 'cancel':
+            cancel_broadcast(command['stream_id'])
+            return {'ok': True}
+        if name == 'queue':
+            profiles, queue_waits = broadcast_executor.snapshot()
+            return {'profiles': profiles, 'queue_waits': queue_waits, 'cores': cpu_allocator.snapshot()}
+        if name == 'stats':
+            return broadcast_stats_payload(command['stream_id'])
+        if name == 'recordings':
+            return stream_monitor.get_active_streams()
+        if name == 'channels':
+            channel_manager.sync(replan=True)
+            return {'ok': True}
+        if name == 'postrecord':
+            post_record.submit(command['source'], retry=True)
+            return {'ok': True}
+        if name == 'recall':
+            threading.Thread(
+                target=recall_cold_file, args=(command['name'],), name='storage-recall', daemon=True
+            ).start()
+            return {'ok': True}
+        if name == 'calibrate':
+            threading.Thread(
+                target=calibrate_encoding_profile, args=(command['profile_id'], command.get('input_path')),
+                name=f"calibrate-{command['profile_id']}", daemon=True
+            ).start()
+            return {'ok': True}
+        return {'error': f'Comando desconocido: {name}'}
+
+broadcast_runner = BroadcastRunner()
+
+class RunnerPool:
+    """
+    Reparto de transmisiones entre varios runners que comparten la tabla stream.
+
+    Cada runner reclama streams 'queued' (o 'streaming' con el lease vencido,
+    es decir, de un runner caído) con un UPDATE condicional: solo uno gana la
+    fila. Reclama según sus cupos libres por perfil y su carga de CPU, y los
+    runners más ocupados esperan más entre rondas para que ganen los libres.
+    El heartbeat renueva el lease de sus streams y detiene los que ya no le
+    pertenecen (desactivados o reclamados por otro runner).
+    """
+    def __init__(self, node_id):
+        self.node_id = node_id
+
+    def free_slots(self):
+        profiles, _ = broadcast_executor.snapshot()
+        return {
+            profile: state['limit'] - len(state['running']) - len(state['queued'])
+            for profile, state in profiles.items()
+        }
+
+    def load(self):
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            return 0.0
+
+    def claimable(self, now):
+        return db.or_(
+            db.and_(Stream.status == 'queued', db.or_(Stream.owner.is_(None), Stream.lease_expires_at < now)),
+            db.and_(Stream.status == 'streaming', Stream.owner.is_not(None), Stream.lease_expires_at < now)
+        )
+
+    def claim(self):
+        """Reclama streams pendientes hasta llenar los cupos libres; devuelve cuántos tomó"""
+        free = self.free_slots()
+        if sum(free.values()) <= 0 or self.load() > app.config['RUNNER_MAX_LOAD']:
+            return 0
+        now = datetime.now()
+        claimed, seen = 0, []
+        with app.app_context():
+            # Por tandas: los candidatos de un perfil sin cupo no deben tapar a los de otro perfil
+            while any(slots > 0 for slots in free.values()):
+                candidates = db.session.execute(
+                    db.select(Stream.id, Stream.video_params, Stream.priority, Stream.next_run_at, Stream.scheduled_time)
+                    .where(Stream.is_active == True, self.claimable(now), Stream.id.not_in(seen))
+                    .order_by(Stream.priority.desc(), Stream.next_run_at)
+                    .limit(sum(max(slots, 0) for slots in free.values()))
+                ).all()
+                if not candidates:
+                    break
+                for row in candidates:
+                    seen.append(row.id)
+                    profile = get_broadcast_profile(row.video_params)
+                    if free[profile] <= 0:
+                        continue
+                    result = db.session.execute(
+                        db.update(Stream)
+                        .where(Stream.id == row.id, self.claimable(now))
+                        .values(owner=self.node_id, lease_expires_at=now + timedelta(seconds=app.config['STREAM_LEASE_TTL']))
+                    )
+                    db.session.commit()
+                    if result.rowcount != 1:
+                        continue  # otro runner la reclamó primero
+                    free[profile] -= 1
+                    claimed += 1
+                    print(f"Runner {self.node_id}: stream {row.id} reclamado")
+                    broadcast_executor.submit(row.id, profile, row.priority, row.next_run_at or row.scheduled_time)
+        return claimed
+
+    def heartbeat(self):
+        """Renueva el lease de los streams propios y publica el estado del nodo"""
+        now = datetime.now()
+        profiles, _ = broadcast_executor.snapshot()
+        local = {stream_id for state in profiles.values() for stream_id in list(state['running']) + state['queued']}
+        with app.app_context():
+            db.session.execute(
+                db.update(Stream)
+                .where(Stream.owner == self.node_id, Stream.is_active == True, Stream.status.in_(('queued', 'streaming')))
+                .values(lease_expires_at=now + timedelta(seconds=app.config['STREAM_LEASE_TTL']))
+            )
+            # Los que terminan liberan el owner (None); se detienen los desactivados, borrados o reclamados por otro
+            kept = {
+                stream_id for stream_id, owner, is_active in db.session.execute(
+                    db.select(Stream.id, Stream.owner, Stream.is_active).where(Stream.id.in_(local))
+                ).all() if is_active and owner in (None, self.node_id)
+            } if local else set()
+            node = db.session.get(RunnerNode, self.node_id) or RunnerNode(node_id=self.node_id)
+            node.hostname, node.pid = socket.gethostname(), os.getpid()
+            node.slots = sum(state['limit'] for state in profiles.values())
+            node.running = sum(len(state['running']) for state in profiles.values())
+            node.load = round(self.load(), 3)
+            node.heartbeat_at = now
+            db.session.merge(node)
+            db.session.commit()
+
+        # Streams que este nodo ejecuta pero ya no le pertenecen
+        for stream_id in local - kept:
+            print(f"Runner {self.node_id}: stream {stream_id} ya no le pertenece, se detiene")
+            cancel_broadcast(stream_id)
+
+    def run(self):
+        last_heartbeat = 0
+        while True:
+            try:
+                if time.monotonic() - last_heartbeat >= app.config['RUNNER_HEARTBEAT_INTERVAL']:
+                    last_heartbeat = time.monotonic()
+                    self.heartbeat()
+                self.claim()
+            except Exception as e:
+                print(f"Error en el pool de runners: {str(e)}")
+            # Un nodo ocupado espera más entre rondas y deja los streams a los nodos libres
+            slots = self.free_slots()
+            limit = sum(broadcast_executor.limits.values()) or 1
+            busy = 1 - max(sum(slots.values()), 0) / limit
+            time.sleep(app.config['RUNNER_CLAIM_INTERVAL'] * (1 + 2 * max(busy, self.load())))
+
+runner_pool = RunnerPool(broadcast_runner.node_id)
+
+def ffconcat_quote(path):
+    """Cita una ruta para una directiva file de ffconcat"""
+    return "'" + path.replace("'", "'\\''") + "'"
+
+class ChannelPlayer:
+    """
+    Reproductor de un canal: un único ffmpeg con el demuxer concat.
+
+    ffmpeg lee index.ffconcat, que enumera de entrada las
+    CHANNEL_PLAYLIST_BATCHES tandas (<n>.ffconcat) al mismo nivel: el demuxer
+    abre cada tanda recién al llegar a ella, así que basta con escribirla
+    antes. Las tandas tienen al menos CHANNEL_PLAYLIST_WINDOW segundos y la
+    siguiente se escribe cuando ffmpeg empieza a reproducir la última
+    escrita, así ffmpeg nunca llega a una tanda que falta y la sesión RTMP no
+    se corta entre archivos. Las tandas no se anidan (una tanda que apuntara
+    a la siguiente sumaría un demuxer abierto por tanda); al agotar la lista
+    principal ffmpeg termina y se relanza una vez. Los elementos con hora
+    se insertan a esa hora: el anterior se corta con outpoint y los huecos se
+    cubren con el relleno del canal.
+    """
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+        self.folder = os.path.join(app.config['CHANNEL_FOLDER'], str(channel_id))
+        self.stopping = threading.Event()
+        self.replan_requested = False
+        self.progress = None
+        self.thread = None
+        self.rotation = 0
+        self.reset()
+
+    def reset(self):
+        """Empieza una línea de tiempo nueva (al lanzar o relanzar ffmpeg)"""
+        self.entries = []
+        self.batches = []
+        self.timeline_end = 0.0
+        self.position = 0.0
+        self.next_mark = 0
+        self.inserted = set()
+        self.anchor = time.time()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f'channel-{self.channel_id}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.progress:
+            self.progress.stop()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def build_batch(self, channel, first=None):
+        """Elige las entradas de la tanda que empieza en timeline_end"""
+        window = app.config['CHANNEL_PLAYLIST_WINDOW']
+        wall_start = datetime.fromtimestamp(self.anchor + self.timeline_end)
+        items = ChannelItem.query.filter_by(channel_id=channel.id).order_by(ChannelItem.position, ChannelItem.id).all()
+        durations = {}
+        for path in {item.input_path for item in items} | ({channel.filler_path} if channel.filler_path else set()):
+            durations[path] = media_probes.get_duration(path)
+            if not durations[path]:
+                media_probes.request(path)  # queda disponible para la próxima tanda
+        rotation = [item for item in items if item.start_at is None and durations.get(item.input_path)]
+        earliest = wall_start - timedelta(seconds=app.config['CHANNEL_INSERT_GRACE'])
+        timed = sorted((
+            item for item in items
+            if item.start_at is not None and item.played_at is None and item.id not in self.inserted
+            and item.start_at >= earliest and durations.get(item.input_path)
+        ), key=lambda item: item.start_at)
+        filler = durations.get(channel.filler_path) if channel.filler_path else None
+
+        entries = [first] if first else []
+        offset = first['duration'] if first else 0.0
+
+        def add(path, duration, full, item_id, rotation_before):
+            entries.append({
+                't': self.timeline_end + offset, 'duration': duration, 'path': path, 'inpoint': 0.0,
+                'outpoint': duration if duration < full else None, 'item_id': item_id,
+                'rotation_before': rotation_before, 'rotation_after': self.rotation
+            })
+            return duration
+
+        while offset < window:
+            until = (timed[0].start_at - wall_start).total_seconds() if timed else None
+            if until is not None and until <= offset + 0.05:
+                item = timed.pop(0)
+                self.inserted.add(item.id)
+                full = durations[item.input_path]
+                offset += add(item.input_path, full, full, item.id, self.rotation)
+                continue
+            gap = until - offset if until is not None else None
+            if rotation:
+                item = rotation[self.rotation % len(rotation)]
+                self.rotation += 1
+                full = durations[item.input_path]
+                offset += add(item.input_path, min(full, gap) if gap is not None else full, full, item.id, self.rotation - 1)
+            elif filler:
+                offset += add(channel.filler_path, min(filler, gap) if gap is not None else filler, filler, None, self.rotation)
+            else:
+                break  # sin rotación ni relleno: solo quedan inserciones futuras sin nada que cubra el hueco
+        return entries
+
+    def write_playlist(self, path, lines):
+        with open(f'{path}.tmp', 'w') as playlist:
+            playlist.write('\n'.join(lines) + '\n')
+        os.replace(f'{path}.tmp', path)
+
+    def write_index(self):
+        """Escribe index.ffconcat con todas las tandas de esta ejecución de ffmpeg, sin anidar"""
+        lines = ['ffconcat version 1.0']
+        for number in range(app.config['CHANNEL_PLAYLIST_BATCHES']):
+            lines.append(f"file {ffconcat_quote(os.path.join(self.folder, f'{number}.ffconcat'))}")
+            lines.append('option safe 0')
+        path = os.path.join(self.folder, 'index.ffconcat')
+        self.write_playlist(path, lines)
+        return path
+
+    def has_room(self):
+        """Queda lugar en la lista principal para otra tanda"""
+        return len(self.batches) < app.config['CHANNEL_PLAYLIST_BATCHES']
+
+    def write_batch(self, entries):
+        """Escribe la tanda como <n>.ffconcat (solo archivos de uploads)"""
+        number = self.batches[-1][0] + 1 if self.batches else 0
+        lines = ['ffconcat version 1.0']
+        for entry in entries:
+            lines.append(f"file {ffconcat_quote(get_absolute_path(entry['path']))}")
+            if entry['inpoint']:
+                lines.append(f"inpoint {entry['inpoint']:.3f}")
+            if entry['outpoint'] is not None:
+                lines.append(f"outpoint {entry['outpoint']:.3f}")
+        path = os.path.join(self.folder, f'{number}.ffconcat')
+        self.write_playlist(path, lines)
+
+        self.batches.append((number, self.timeline_end))
+        self.entries.extend(entries)
+        self.timeline_end += sum(entry['duration'] for entry in entries)
+        try:
+            os.remove(os.path.join(self.folder, f'{number - 3}.ffconcat'))
+        except FileNotFoundError:
+            pass
+        return path
+
+    def rewind_last_batch(self):
+        """Descarta la última tanda si ffmpeg todavía no la abrió, para rearmarla con los cambios del canal"""
+        if len(self.batches) < 2 or self.position >= self.batches[-1][1] - 5:
+            return False
+        _, start = self.batches.pop()
+        dropped = [entry for entry in self.entries if entry['t'] >= start]
+        self.entries = self.entries[:len(self.entries) - len(dropped)]
+        self.timeline_end = start
+        if dropped:
+            self.rotation = dropped[0]['rotation_before']
+            self.inserted -= {entry['item_id'] for entry in dropped}
+        return True
+
+    def resume_entry(self):
+        """Entrada que estaba al aire, recortada para reanudarla donde quedó (None si había terminado)"""
+        if not self.next_mark:
+            return None
+        current = self.entries[self.next_mark - 1]
+        self.rotation = current['rotation_after']
+        elapsed = max(0.0, self.position - current['t'])
+        if elapsed >= current['duration'] - 0.5:
+            return None
+        return dict(
+            current, t=0.0, inpoint=current['inpoint'] + elapsed, duration=current['duration'] - elapsed,
+            rotation_before=current['rotation_after'], resumed=True
+        )
+
+    def on_sample(self, sample):
+        if sample.get('out_time_seconds') is not None:
+            self.position = sample['out_time_seconds']
+            self.anchor = time.time() - self.position
+        channel = None
+        if self.replan_requested:
+            self.replan_requested = False
+            channel = db.session.get(Channel, self.channel_id)
+            if channel and self.rewind_last_batch():
+                self.write_batch(self.build_batch(channel))
+        # ffmpeg ya entró en la última tanda escrita: escribir la siguiente (si hay qué emitir y lugar)
+        if self.position >= self.batches[-1][1] and self.has_room():
+            channel = channel or db.session.get(Channel, self.channel_id)
+            entries = self.build_batch(channel) if channel else []
+            if entries:
+                self.write_batch(entries)
+
+        current = None
+        while self.next_mark < len(self.entries) and self.entries[self.next_mark]['t'] <= self.position:
+            current = self.entries[self.next_mark]
+            self.next_mark += 1
+        if current:
+            now = datetime.now()
+            if current['item_id'] and not current.get('resumed'):
+                db.session.execute(
+                    db.update(ChannelItem).where(ChannelItem.id == current['item_id'])
+                    .values(played_at=now, play_count=ChannelItem.play_count + 1)
+                )
+            db.session.execute(
+                db.update(Channel).where(Channel.id == self.channel_id).values(current_item_id=current['item_id'])
+            )
+            db.session.commit()
+            publish_event('channel_status', {
+                'channel_id': self.channel_id, 'status': 'streaming',
+                'item_id': current['item_id'], 'input_path': current['path']
+            })
+
+    def set_status(self, status, error=None, is_active=None):
+        channel = db.session.get(Channel, self.channel_id)
+        if not channel:
+            return
+        channel.status = status
+        channel.error = error
+        if status == 'streaming' and not channel.started_at:
+            channel.started_at = datetime.now()
+        if status in ('stopped', 'error'):
+            channel.current_item_id = None
+            channel.started_at = None
+        if is_active is not None:
+            channel.is_active = is_active
+        db.session.commit()
+        publish_event('channel_status', {'channel_id': self.channel_id, 'status': status, 'error': error})
+
+    def run(self):
+        with app.app_context():
+            try:
+                self.play()
+            except Exception as e:
+                print(f"Error en el canal {self.channel_id}: {str(e)}")
+                db.session.rollback()
+                self.set_status('error', str(e)[:500])
+
+    def play(self):
+        """Lanza ffmpeg y lo relanza desde el elemento en curso si se corta, con backoff"""
+        budget, retries, resume = app.config['BROADCAST_RETRY_BUDGET'], 0, None
+        while not self.stopping.is_set():
+            channel = db.session.get(Channel, self.channel_id)
+            if not channel:
+                return
+            # Cada ejecución numera sus tandas desde 0: no deben quedar tandas de la anterior
+            shutil.rmtree(self.folder, ignore_errors=True)
+            os.makedirs(self.folder, exist_ok=True)
+            self.reset()
+            playlist = self.write_index()
+            self.write_batch(self.build_batch(channel, first=resume))
+            if not self.entries:
+                print(f"Canal {self.channel_id}: no hay elementos ni relleno con duración conocida")
+                self.set_status('error', 'El canal no tiene contenido con duración conocida', is_active=False)
+                return
+            entries = self.build_batch(channel) if self.has_room() else []
+            if entries:
+                self.write_batch(entries)
+
+            cores = allocate_encoding_cores(f'channel-{self.channel_id}', channel.video_params)
+            command = ['ffmpeg', '-re', '-f', 'concat', '-safe', '0', '-i', playlist]
+            if cores:
+                command += ['-threads', str(len(cores))]
+            command.extend((channel.video_params or '-c:v copy -c:a aac -f flv').split())
+            command.append(channel.output_rtmp)
+            print(f"Canal {self.channel_id} - {channel.name}: {' '.join(command)}")
+            self.progress = BroadcastProgress(
+                f'channel-{self.channel_id}', app.config['FFMPEG_PROGRESS_SAMPLES'], app.config['FFMPEG_STDERR_LINES']
+            )
+            if self.stopping.is_set():
+                break
+            self.set_status('streaming')
+            started = time.monotonic()
+            try:
+                returncode = run_ffmpeg(command, self.progress, on_sample=self.on_sample, cores=cores)
+            finally:
+                cpu_allocator.release(f'channel-{self.channel_id}')
+            if self.stopping.is_set():
+                break
+
+            resume = self.resume_entry()
+            if returncode == 0 and not self.has_room():
+                print(f"Canal {self.channel_id}: se emitieron las {len(self.batches)} tandas de la lista; se relanza ffmpeg")
+                continue
+            if time.monotonic() - started >= app.config['BROADCAST_RETRY_RESET']:
+                retries = 0
+            if retries >= budget:
+                print(f"Canal {self.channel_id}: se agotaron los {budget} reintentos")
+                print(self.progress.stderr_tail())
+                self.set_status('error', f'ffmpeg salió con código {returncode}', is_active=False)
+                return
+            delay = min(app.config['BROADCAST_RETRY_BACKOFF'] * 2 ** retries, app.config['BROADCAST_RETRY_BACKOFF_MAX'])
+            retries += 1
+            BROADCAST_RETRIES.inc()
+            print(f"Canal {self.channel_id}: ffmpeg salió con código {returncode}; reintento {retries}/{budget} en {delay:.1f}s")
+            self.set_status('reconnecting', f'ffmpeg salió con código {returncode}')
+            self.stopping.wait(delay)
+        self.set_status('stopped')
 
-    def on_modified(self, event):
-        if event.is_directory:
-            return
-        if event.src_path.endswith('.flv'):
-            with self.lock:
-                stream_name = os.path.basename(event.src_path)
-                if stream_name in self.active_streams:
-                    size = os.path.getsize(event.src_path)
-                    self.active_streams[stream_name]['size'] = size
-                    socketio.emit('stream_update', {
-                        'stream': stream_name,
-                        'size': size
-                    })
+class ChannelManager:
+    """Arranca y detiene en el runner líder los reproductores de los canales activos"""
+    def __init__(self):
+        self.players = {}
+        self.lock = threading.Lock()
 
-    def on_deleted(self, event):
-        if event.is_directory:
-            return
-        if event.src_path.endswith('.flv'):
-            with self.lock:
-                stream_name = os.path.basename(event.src_path)
-                if stream_name in self.active_streams:
-                    del self.active_streams[stream_name]
-                    socketio.emit('stream_ended', {'stream': stream_name})
+    def sync(self, replan=False):
+        now = datetime.now()
+        with app.app_context():
+            wanted = set(db.session.execute(
+                db.select(Channel.id).where(
+                    Channel.is_active == True,
+                    db.or_(Channel.starts_at.is_(None), Channel.starts_at <= now)
+                )
+            ).scalars())
+        with self.lock:
+            for channel_id, player in list(self.players.items()):
+                if channel_id not in wanted or not player.is_alive():
+                    player.stop()
+                    del self.players[channel_id]
+                elif replan:
+                    player.replan_requested = True
+            for channel_id in wanted - set(self.players):
+                print(f"Iniciando canal {channel_id}")
+                self.players[channel_id] = ChannelPlayer(channel_id)
+                self.players[channel_id].start()
 
-    def get_active_streams(self):
+    def stop_all(self):
         with self.lock:
-            return dict(self.active_streams)
+            for player in self.players.values():
+                player.stop()
+            self.players.clear()
 
-# Inicializar el monitor
-stream_monitor = StreamMonitor()
-observer = Observer()
-observer.schedule(stream_monitor, os.path.join(app.config['UPLOAD_FOLDER'], 'receiving'), recursive=False)
-observer.start()
+channel_manager = ChannelManager()
+
+def send_runner_command(command, wait_reply=False, timeout=1.0):
+    """
+    Envía un comando al runner líder por el socket de datagramas.
+
+    Si este mismo proceso es el líder se atiende directamente. Los comandos
+    sin respuesta son avisos: si se pierden, la relectura periódica del
+    almacén de trabajos los cubre. Devuelve la respuesta o None.
+    """
+    if broadcast_runner.is_leader:
+        return broadcast_runner.handle_command(command)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        if wait_reply:
+            client.bind('')  # dirección abstracta automática para recibir la respuesta
+            client.settimeout(timeout)
+        client.sendto(json.dumps(command).encode('utf-8'), app.config['RUNNER_COMMAND_SOCKET'])
+        if wait_reply:
+            return json.loads(client.recv(65536))
+    except (OSError, ValueError):
+        return None
+    finally:
+        client.close()
+    return None
+
+def get_active_recordings():
+    """Grabaciones entrantes: las vigila el runner; un proceso web se las pide por el socket de comandos"""
+    if app.config['RTMP_ROLE'] == 'web':
+        return send_runner_command({'cmd': 'recordings'}, wait_reply=True) or {}
+    return stream_monitor.get_active_streams()
 
 # Rutas para el monitoreo
 @app.route('/active_streams')
 def active_streams():
-    streams = stream_monitor.get_active_streams()
+    streams = get_active_recordings()
     return jsonify(streams)
 
 @socketio.on('connect')
 def handle_connect():
     # Enviar lista actual de streams al cliente que se conecta
-    emit('active_streams', stream_monitor.get_active_streams())
+    emit('active_streams', get_active_recordings())
 
 @socketio.on('disconnect')
 def handle_disconnect():
@@ -335,59 +4806,137 @@ def handle_disconnect():
 
 @app.route('/')
 def index():
-    sort_by = request.args.get('sort', 'scheduled_time')  # Por defecto ordena por hora programada
+    sort_by = request.args.get('sort', 'next_run_at')  # Por defecto ordena por próxima ejecución
     order = request.args.get('order', 'asc')  # asc o desc
+    if sort_by not in STREAM_SORT_COLUMNS:
+        sort_by = 'next_run_at'
     
-    query = Stream.query
-    
-    if sort_by == 'scheduled_time':
-        if order == 'desc':
-            query = query.order_by(Stream.scheduled_time.desc())
-        else:
-            query = query.order_by(Stream.scheduled_time.asc())
-    elif sort_by == 'name':
-        if order == 'desc':
-            query = query.order_by(Stream.name.desc())
-        else:
-            query = query.order_by(Stream.name.asc())
-    elif sort_by == 'status':
-        if order == 'desc':
-            query = query.order_by(Stream.status.desc())
-        else:
-            query = query.order_by(Stream.status.asc())
-    
-    streams = query.all()
-    active = stream_monitor.get_active_streams()
-
-    # Obtener lista de archivos en uploads
-    uploads = []
-    total_size = 0
-    try:
-        for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.isfile(filepath):
-                size = os.path.getsize(filepath)
-                modified = os.path.getmtime(filepath)
-                uploads.append({
-                    'name': filename,
-                    'size': size,
-                    'size_formatted': format_size(size),
-                    'modified': datetime.fromtimestamp(modified).strftime('%Y-%m-%d %H:%M:%S'),
-                    'type': os.path.splitext(filename)[1][1:].upper() or 'FILE'
-                })
-                total_size += size
-    except Exception as e:
-        print(f"Error al listar archivos: {str(e)}")
-        uploads = []
-        total_size = 0
+    # Los streams se cargan por páginas desde /api/streams
+    active = get_active_recordings()
+
+    # Lista de archivos en uploads desde el catálogo en memoria
+    uploads, total_size = file_catalog.listing()
 
     return render_template('index.html', 
-                         streams=streams, 
                          active_streams=active,
                          current_sort=sort_by, 
                          current_order=order,
                          uploads=uploads,
-                         total_size=format_size(total_size))
+                         total_size=total_size)
+
+def serialize_stream(stream):
+    """Representación JSON de un stream usada por la API"""
+    return {
+        'id': stream.id,
+        'name': stream.name,
+        'input_path': stream.input_path,
+        'output_rtmp': stream.output_rtmp,
+        'scheduled_time': stream.scheduled_time.isoformat(),
+        'next_run_at': stream.next_run_at.isoformat() if stream.next_run_at else None,
+        'is_active': stream.is_active,
+        'status': stream.status,
+        'video_params': stream.video_params or '-c:v copy -c:a aac -f flv',
+        'repeat_type': stream.repeat_type,
+        'recurrence_rule': stream.recurrence_rule,
+        'priority': stream.priority or 0,
+        'encoding_profile_id': stream.encoding_profile_id
+    }
+
+STREAM_SORT_COLUMNS = {
+    'next_run_at': Stream.next_run_at,
+    'scheduled_time': Stream.scheduled_time,
+    'name': Stream.name,
+    'status': Stream.status
+}
+
+def encode_stream_cursor(sort_by, stream):
+    """Cursor opaco con el valor de orden y el id de la última fila de la página"""
+    value = getattr(stream, sort_by)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([value, stream.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_stream_cursor(sort_by, cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if value is not None and sort_by in ('next_run_at', 'scheduled_time'):
+        value = datetime.fromisoformat(value)
+    return value, int(last_id)
+
+@app.route('/api/streams')
+def api_streams():
+    """
+    Listado de streams con paginación por cursor (keyset).
+
+    Parámetros: sort (next_run_at, scheduled_time, name, status), order (asc, desc),
+    status, active (true/false), limit (máx. 200) y cursor (devuelto como next_cursor).
+    Los valores nulos de la columna de orden se devuelven al final, ordenados por id.
+    """
+    sort_by = request.args.get('sort', 'next_run_at')
+    order = request.args.get('order', 'asc')
+    if sort_by not in STREAM_SORT_COLUMNS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'Orden inválido'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        cursor = request.args.get('cursor')
+        last_value, last_id = decode_stream_cursor(sort_by, cursor) if cursor else (None, None)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Cursor o límite inválido'}), 400
+
+    column = STREAM_SORT_COLUMNS[sort_by]
+    descending = order == 'desc'
+    filters = []
+    if request.args.get('status'):
+        filters.append(Stream.status == request.args['status'])
+    if request.args.get('active') in ('true', 'false'):
+        filters.append(Stream.is_active == (request.args['active'] == 'true'))
+
+    streams = []
+    # Primera fase: filas con valor en la columna de orden, comparando (valor, id) con el cursor
+    if last_id is None or last_value is not None:
+        query = Stream.query.filter(column.isnot(None), *filters)
+        if last_id is not None:
+            key = db.tuple_(column, Stream.id)
+            query = query.filter(key < (last_value, last_id) if descending else key > (last_value, last_id))
+        ordering = (column.desc(), Stream.id.desc()) if descending else (column.asc(), Stream.id.asc())
+        streams = query.order_by(*ordering).limit(limit + 1).all()
+    # Segunda fase: filas sin valor, ordenadas por id
+    if len(streams) <= limit:
+        query = Stream.query.filter(column.is_(None), *filters)
+        if last_id is not None and last_value is None:
+            query = query.filter(Stream.id < last_id if descending else Stream.id > last_id)
+        query = query.order_by(Stream.id.desc() if descending else Stream.id.asc())
+        streams += query.limit(limit + 1 - len(streams)).all()
+
+    has_more = len(streams) > limit
+    streams = streams[:limit]
+    return jsonify({
+        'streams': [serialize_stream(stream) for stream in streams],
+        'next_cursor': encode_stream_cursor(sort_by, streams[-1]) if has_more else None
+    })
+
+def resolve_video_params(form, current_profile_id=None):
+    """
+    Parámetros de video de un stream: los de su perfil de codificación o el texto libre validado.
+
+    Devuelve (video_params, encoding_profile_id). Si el formulario no elige
+    perfil y trae los mismos parámetros del perfil actual, el stream lo conserva.
+    """
+    submitted = (form.get('video_params') or '').strip()
+    profile_id = form.get('encoding_profile_id', current_profile_id)
+    if profile_id:
+        try:
+            profile = db.session.get(EncodingProfile, int(profile_id))
+        except (TypeError, ValueError):
+            profile = None
+        if not profile:
+            raise ValueError('Perfil de codificación no encontrado')
+        if 'encoding_profile_id' in form or not submitted or submitted == profile.video_params:
+            return profile.video_params, profile.id
+    video_params = submitted or '-c:v copy -c:a aac -f flv'
+    validate_video_params(video_params)
+    return video_params, None
 
 @app.route('/add_stream', methods=['POST'])
 def add_stream():
@@ -399,13 +4948,20 @@ def add_stream():
         input_path = request.form.get('input_path')
         output_rtmp = request.form.get('output_rtmp')
         scheduled_time_str = request.form.get('scheduled_time')
-        video_params = request.form.get('video_params')
-        if not video_params or video_params.strip() == '':
-            video_params = '-c:v copy -c:a aac -f flv'
+        try:
+            video_params, encoding_profile_id = resolve_video_params(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         repeat_type = request.form.get('repeat_type', 'once')
+        try:
+            priority = int(request.form.get('priority') or 0)
+        except ValueError:
+            return jsonify({'error': 'Prioridad inválida'}), 400
         
-        if repeat_type not in ['once', 'daily', 'weekly', 'monthly']:
-            return jsonify({'error': 'Tipo de repetición inválido'}), 400
+        try:
+            recurrence_rule = parse_recurrence_rule(repeat_type, request.form.get('recurrence_rule'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         if not all([name, output_rtmp, scheduled_time_str]):
             return jsonify({'error': 'Faltan campos requeridos'}), 400
@@ -419,30 +4975,46 @@ def add_stream():
         if 'video' in request.files:
             file = request.files['video']
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                unique_filename = f"{uuid.uuid4()}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                file.save(file_path)
-                input_path = unique_filename  # Guardar solo el nombre del archivo
+                input_path = save_uploaded_file(file)  # Guardar solo el nombre del archivo
         
         if not input_path:
             return jsonify({'error': 'Se requiere un archivo de video o una ruta de entrada'}), 400
         
         # Convertir la ruta de entrada a absoluta si es necesario
         absolute_input_path = get_absolute_path(input_path)
-        if not os.path.exists(absolute_input_path):
+        if not os.path.exists(absolute_input_path) and not storage_tiers.is_cold(input_path):
             return jsonify({'error': 'El archivo de entrada no existe'}), 400
         
+        # Analizar el archivo en segundo plano (solo si no hay un análisis válido)
+        media_probes.request(input_path)
+        
         stream = Stream(
             name=name,
             input_path=input_path,  # Guardamos la ruta relativa en la base de datos
             output_rtmp=output_rtmp,
             scheduled_time=scheduled_time,
             video_params=video_params,
-            repeat_type=repeat_type
+            encoding_profile_id=encoding_profile_id,
+            repeat_type=repeat_type,
+            recurrence_rule=recurrence_rule,
+            priority=priority
         )
+        stream.next_run_at = initial_next_run(stream)
+        if not stream.next_run_at:
+            db.session.rollback()  # descarta también el archivo recién subido
+            return jsonify({'error': 'La hora programada ya pasó'}), 400
+        
+        # Validar solapes en el destino y el egreso agregado
+        problems, rejected = validate_schedule(stream)
+        if rejected:
+            db.session.rollback()
+            return jsonify({
+                'error': 'La programación entra en conflicto con otras transmisiones',
+                'conflicts': problems
+            }), 409
         
         db.session.add(stream)
+        media_store.retain(input_path)
         db.session.commit()
         
         # Programar el stream
@@ -450,17 +5022,8 @@ def add_stream():
         
         return jsonify({
             'message': 'Stream agregado exitosamente',
-            'stream': {
-                'id': stream.id,
-                'name': stream.name,
-                'input_path': stream.input_path,
-                'output_rtmp': stream.output_rtmp,
-                'scheduled_time': stream.scheduled_time.isoformat(),
-                'is_active': stream.is_active,
-                'status': stream.status,
-                'video_params': stream.video_params,
-                'repeat_type': stream.repeat_type
-            }
+            'stream': serialize_stream(stream),
+            'warnings': problems
         })
         
     except Exception as e:
@@ -478,9 +5041,13 @@ def delete_stream(stream_id):
         job_id = f'stream_{stream_id}'
         if scheduler.get_job(job_id):
             scheduler.remove_job(job_id)
+        send_runner_command({'cmd': 'cancel', 'stream_id': stream_id})
         
+        orphan = media_store.release(stream.input_path)
         db.session.delete(stream)
         db.session.commit()
+        if orphan:
+            media_store.collect(orphan)
         backup_database()  # Hacer backup después de eliminar un stream
         return jsonify({'status': 'success', 'message': 'Stream deleted successfully'})
     except Exception as e:
@@ -493,17 +5060,7 @@ def edit_stream(stream_id):
         return jsonify({'error': 'Stream no encontrado'}), 404
     
     if request.method == 'GET':
-        return jsonify({
-            'id': stream.id,
-            'name': stream.name,
-            'input_path': stream.input_path,
-            'output_rtmp': stream.output_rtmp,
-            'scheduled_time': stream.scheduled_time.isoformat(),
-            'is_active': stream.is_active,
-            'status': stream.status,
-            'video_params': stream.video_params or '-c:v copy -c:a aac -f flv',
-            'repeat_type': stream.repeat_type
-        })
+        return jsonify(dict(serialize_stream(stream), media=media_probes.get(stream.input_path)))
     
     # Método PUT
     try:
@@ -515,56 +5072,84 @@ def edit_stream(stream_id):
         input_path = request.form.get('input_path', stream.input_path)
         output_rtmp = request.form.get('output_rtmp', stream.output_rtmp)
         scheduled_time_str = request.form.get('scheduled_time')
-        video_params = request.form.get('video_params')
-        if not video_params or video_params.strip() == '':
-            video_params = '-c:v copy -c:a aac -f flv'
+        try:
+            video_params, encoding_profile_id = resolve_video_params(request.form, stream.encoding_profile_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         repeat_type = request.form.get('repeat_type', stream.repeat_type)
+        try:
+            priority = int(request.form.get('priority', stream.priority or 0) or 0)
+        except ValueError:
+            return jsonify({'error': 'Prioridad inválida'}), 400
+        try:
+            recurrence_rule = parse_recurrence_rule(
+                repeat_type, request.form.get('recurrence_rule', stream.recurrence_rule)
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Manejar la subida de nuevo video si existe
+        replaced = None
         if 'video' in request.files:
             file = request.files['video']
             if file and allowed_file(file.filename):
-                # Eliminar el archivo anterior si existe y está en la carpeta uploads
-                if os.path.exists(stream.input_path) and stream.input_path.startswith(UPLOAD_FOLDER):
-                    try:
-                        os.remove(stream.input_path)
-                    except OSError:
-                        pass  # Ignorar errores al eliminar
+                # El archivo anterior se borra después de guardar, si ningún otro stream o canal lo usa
+                replaced = stream.input_path
                 
                 # Guardar el nuevo archivo
-                filename = secure_filename(file.filename)
-                unique_filename = f"{uuid.uuid4()}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                file.save(file_path)
-                input_path = unique_filename  # Guardar solo el nombre del archivo
+                input_path = save_uploaded_file(file)  # Guardar solo el nombre del archivo
+                media_probes.request(input_path)
+        
+        # Mover la referencia al contenido si cambió el archivo
+        orphan = None
+        if input_path != stream.input_path:
+            media_store.retain(input_path)
+            orphan = media_store.release(stream.input_path)
         
         # Actualizar los campos del stream
         stream.name = name
         stream.input_path = input_path
         stream.output_rtmp = output_rtmp
         stream.video_params = video_params
+        stream.encoding_profile_id = encoding_profile_id
         stream.repeat_type = repeat_type
+        stream.recurrence_rule = recurrence_rule
+        stream.priority = priority
         
         if scheduled_time_str:
             try:
-                new_scheduled_time = datetime.strptime(scheduled_time_str, '%Y-%m-%dT%H:%M')
-                stream.scheduled_time = new_scheduled_time
-                
-                # Verificar si la fecha es pasada
-                current_time = datetime.now()
-                if new_scheduled_time < current_time:
-                    stream.status = 'expired'
-                    stream.is_active = False
-                elif stream.status == 'expired' and new_scheduled_time > current_time:
-                    stream.status = 'pending'
-                    stream.is_active = True
+                stream.scheduled_time = datetime.strptime(scheduled_time_str, '%Y-%m-%dT%H:%M')
             except ValueError:
+                db.session.rollback()
                 return jsonify({'error': 'Formato de fecha inválido'}), 400
         
+        # Recalcular la próxima ejecución; si ya no hay ocurrencias futuras el stream expira
+        if stream.status != 'streaming':
+            stream.next_run_at = initial_next_run(stream)
+            if not stream.next_run_at:
+                stream.status = 'expired'
+                stream.is_active = False
+            elif stream.status == 'expired':
+                stream.status = 'pending'
+                stream.is_active = True
+        
+        # Validar solapes en el destino y el egreso agregado (sin contar las reservas actuales del stream)
+        problems, rejected = validate_schedule(stream, exclude_id=stream.id)
+        if rejected:
+            db.session.rollback()
+            return jsonify({
+                'error': 'La programación entra en conflicto con otras transmisiones',
+                'conflicts': problems
+            }), 409
+        
         db.session.commit()
+        if orphan:
+            media_store.collect(orphan)
+        if replaced and replaced != stream.input_path:
+            media_store.remove_unused(replaced)
         
         # Reprogramar el stream si está activo
-        if stream.is_active:
+        if stream.is_active and stream.next_run_at:
             try:
                 schedule_stream(stream)
             except Exception as e:
@@ -573,17 +5158,8 @@ def edit_stream(stream_id):
         
         return jsonify({
             'message': 'Stream actualizado exitosamente',
-            'stream': {
-                'id': stream.id,
-                'name': stream.name,
-                'input_path': stream.input_path,
-                'output_rtmp': stream.output_rtmp,
-                'scheduled_time': stream.scheduled_time.isoformat(),
-                'is_active': stream.is_active,
-                'status': stream.status,
-                'video_params': stream.video_params,
-                'repeat_type': stream.repeat_type
-            }
+            'stream': dict(serialize_stream(stream), media=media_probes.get(stream.input_path)),
+            'warnings': problems
         })
         
     except Exception as e:
@@ -598,9 +5174,10 @@ def toggle_stream(stream_id):
             return jsonify({'error': 'Stream no encontrado'}), 404
         
         stream.is_active = not stream.is_active
+        stream.next_run_at = initial_next_run(stream) if stream.is_active else None
         
         # Si se activa, programar el stream
-        if stream.is_active:
+        if stream.is_active and stream.next_run_at:
             try:
                 schedule_stream(stream)
             except Exception as e:
@@ -612,6 +5189,7 @@ def toggle_stream(stream_id):
                 job_id = f'stream_{stream_id}'
                 if scheduler.get_job(job_id):
                     scheduler.remove_job(job_id)
+                send_runner_command({'cmd': 'cancel', 'stream_id': stream_id})
             except Exception as e:
                 print(f"Error al remover trabajo programado: {str(e)}")
         
@@ -627,22 +5205,25 @@ def toggle_stream(stream_id):
 
 @app.route('/backup', methods=['POST'])
 def create_backup():
-    try:
-        if backup_database():
-            return jsonify({
-                'status': 'success',
-                'message': 'Database backup created successfully'
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'message': 'Failed to create backup'
-            }), 500
-    except Exception as e:
-        return jsonify({
-            'status': 'error',
-            'message': str(e)
-        }), 500
+    """Encola un backup de la base; se hace en segundo plano (el resultado en GET /backups)"""
+    backup_database()
+    return jsonify({
+        'status': 'queued',
+        'message': 'Database backup queued'
+    }), 202
+
+@app.route('/backups')
+def list_backups():
+    """Backups disponibles y resultado del último"""
+    return jsonify({
+        'running': database_backups.running,
+        'last': database_backups.last,
+        'backups': [{
+            'name': name,
+            'taken_at': database_backups.taken_at(name).isoformat(),
+            'size': os.path.getsize(os.path.join(database_backups.folder, name))
+        } for name in database_backups.list()]
+    })
 
 @app.route('/check_stream/<int:stream_id>', methods=['GET'])
 def check_stream(stream_id):
@@ -661,6 +5242,7 @@ def check_stream(stream_id):
                 'id': stream.id,
                 'name': stream.name,
                 'scheduled_time': stream.scheduled_time.isoformat(),
+                'next_run_at': stream.next_run_at.isoformat() if stream.next_run_at else None,
                 'current_time': current_time.isoformat(),
                 'time_difference': str(time_diff),
                 'status': stream.status,
@@ -677,47 +5259,459 @@ def check_stream(stream_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/broadcast_queue')
+def broadcast_queue():
+    """Estado del ejecutor de transmisiones y tiempos de espera en cola por stream (consultado al runner)"""
+    reply = send_runner_command({'cmd': 'queue'}, wait_reply=True)
+    if reply is None:
+        return jsonify({'error': 'El runner de transmisiones no responde'}), 503
+    return jsonify(reply)
+
+@app.route('/media_blobs')
+def media_blobs():
+    """Contenidos guardados en el almacén por sha256, con sus nombres y el espacio ahorrado"""
+    names = {}
+    for alias in MediaAlias.query.order_by(MediaAlias.created_at):
+        names.setdefault(alias.sha256, []).append(alias.name)
+    blobs = [{
+        'sha256': blob.sha256,
+        'size': blob.size,
+        'ref_count': blob.ref_count or 0,
+        'names': names.get(blob.sha256, []),
+        'created_at': blob.created_at.isoformat() if blob.created_at else None
+    } for blob in MediaBlob.query.order_by(MediaBlob.created_at.desc())]
+    stored = sum(blob['size'] for blob in blobs)
+    logical = sum(blob['size'] * max(len(blob['names']), 1) for blob in blobs)
+    return jsonify({
+        'blobs': blobs,
+        'stored_bytes': stored,
+        'logical_bytes': logical,
+        'saved_bytes': logical - stored
+    })
+
+@app.route('/storage')
+def storage():
+    """Uso del disco caliente frente a la cuota y archivos movidos al almacenamiento frío"""
+    return jsonify(storage_tiers.summary())
+
+@app.route('/storage/recall', methods=['POST'])
+def recall_storage():
+    """Pide al runner líder que traiga un archivo del almacenamiento frío"""
+    name = (request.get_json(silent=True) or {}).get('name') or request.form.get('name')
+    if not storage_tiers.is_cold(name):
+        return jsonify({'error': 'El archivo no está en el almacenamiento frío'}), 404
+    send_runner_command({'cmd': 'recall', 'name': name})
+    return jsonify({'message': 'Archivo en camino al disco caliente', 'name': name}), 202
+
+@app.route('/recordings')
+def recordings():
+    """Trabajos de post-grabación, los más recientes primero (filtro opcional por status)"""
+    query = RecordingJob.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    limit = min(request.args.get('limit', 100, type=int), 500)
+    return jsonify([job.to_dict() for job in query.order_by(RecordingJob.id.desc()).limit(limit)])
+
+@app.route('/recordings/<int:job_id>/retry', methods=['POST'])
+def retry_recording(job_id):
+    """Vuelve a encolar una grabación cuya post-grabación falló"""
+    job = db.session.get(RecordingJob, job_id)
+    if not job:
+        return jsonify({'error': 'Grabación no encontrada'}), 404
+    if job.status != 'error':
+        return jsonify({'error': 'Solo se reintentan las grabaciones con error'}), 409
+    if not os.path.exists(post_record.receiving_path(job.source)):
+        return jsonify({'error': 'La grabación ya no existe en receiving'}), 410
+    send_runner_command({'cmd': 'postrecord', 'source': job.source})
+    return jsonify({'message': 'Grabación encolada', 'recording': job.to_dict()}), 202
+
+@app.route('/runners')
+def runners():
+    """Runners del pool con heartbeat reciente y los streams que tienen reclamados"""
+    limit = datetime.now() - timedelta(seconds=app.config['STREAM_LEASE_TTL'])
+    lease = db.session.get(RunnerLease, BroadcastRunner.LEASE_NAME)
+    leader = lease.holder if lease and lease.expires_at > datetime.now() else None
+    nodes = RunnerNode.query.filter(RunnerNode.heartbeat_at >= limit).order_by(RunnerNode.node_id).all()
+    owned = {}
+    for stream_id, owner in db.session.execute(
+        db.select(Stream.id, Stream.owner).where(Stream.owner.is_not(None))
+    ).all():
+        owned.setdefault(owner, []).append(stream_id)
+    return jsonify([{
+        'node_id': node.node_id,
+        'hostname': node.hostname,
+        'pid': node.pid,
+        'slots': node.slots,
+        'running': node.running,
+        'load': node.load,
+        'heartbeat_at': node.heartbeat_at.isoformat(),
+        'leader': node.node_id == leader,
+        'streams': owned.get(node.node_id, [])
+    } for node in nodes])
+
+def broadcast_stats_payload(stream_id):
+    """Última muestra de progreso de ffmpeg de una transmisión (None si no hay)"""
+    progress = get_broadcast_progress(stream_id)
+    if not progress:
+        return None
+    return {
+        'stream_id': stream_id,
+        'started_at': progress.started_at.isoformat(),
+        'running': progress.returncode is None,
+        'preroll': progress.process is None and not progress.cancelled.is_set(),
+        'returncode': progress.returncode,
+        'sample': progress.latest(),
+        'stderr_tail': progress.stderr_tail() if progress.returncode else None
+    }
+
+@app.route('/streams/<int:stream_id>/stats')
+def stream_stats(stream_id):
+    """Última muestra de progreso de ffmpeg para una transmisión saliente"""
+    stats = send_runner_command({'cmd': 'stats', 'stream_id': stream_id}, wait_reply=True)
+    if not stats:
+        return jsonify({'error': 'No hay estadísticas para este stream'}), 404
+    
+    return jsonify(stats)
+
+@app.route('/streams/<int:stream_id>/runs')
+def stream_runs(stream_id):
+    """Últimas salidas al aire de un stream con su desvío respecto de la hora programada y sus tramos"""
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    runs = BroadcastRun.query.filter_by(stream_id=stream_id).order_by(BroadcastRun.id.desc()).limit(limit).all()
+    skews = sorted(abs(run.skew_ms) for run in runs if run.skew_ms is not None)
+    segments = {}
+    if runs:
+        for segment in BroadcastSegment.query.filter(
+            BroadcastSegment.run_id.in_([run.id for run in runs])
+        ).order_by(BroadcastSegment.run_id, BroadcastSegment.attempt):
+            segments.setdefault(segment.run_id, []).append(segment.to_dict())
+    return jsonify({
+        'stream_id': stream_id,
+        'runs': [dict(run.to_dict(), segments=segments.get(run.id, [])) for run in runs],
+        'skew_ms': {
+            'count': len(skews),
+            'max': skews[-1] if skews else None,
+            'p50': skews[len(skews) // 2] if skews else None,
+            'p95': skews[min(len(skews) - 1, int(len(skews) * 0.95))] if skews else None
+        }
+    })
+
+def parse_channel_time(value):
+    """Fecha y hora de un canal o de una inserción (ISO 8601, p. ej. 2024-05-01T20:00)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Formato de fecha inválido: {value}')
+
+def check_channel_file(input_path):
+    """Verifica que el archivo exista en uploads y pide su análisis (la duración arma la lista)"""
+    # Los archivos de canales no se mueven al almacenamiento frío: si ya estaba ahí se trae
+    storage_tiers.recall(input_path)
+    if not input_path or not os.path.exists(get_absolute_path(input_path)):
+        raise ValueError(f'El archivo de entrada no existe: {input_path}')
+    media_probes.request(input_path)
+
+def build_channel_items(channel_id, items, first_position=0):
+    """Crea los elementos de un canal a partir de una lista de rutas o de {input_path, start_at}"""
+    created = []
+    for position, data in enumerate(items, start=first_position):
+        if not isinstance(data, dict):
+            data = {'input_path': data}
+        input_path = (data.get('input_path') or '').strip()
+        check_channel_file(input_path)
+        media_store.retain(input_path)
+        created.append(ChannelItem(
+            channel_id=channel_id,
+            position=position,
+            input_path=input_path,
+            start_at=parse_channel_time(data.get('start_at'))
+        ))
+    return created
+
+def release_channel_files(paths):
+    """Resta las referencias de un canal a sus archivos; devuelve los contenidos que quedaron sin referencias"""
+    return {orphan for orphan in map(media_store.release, paths) if orphan}
+
+def apply_channel_fields(channel, data):
+    """Copia al canal los campos presentes en el JSON recibido; devuelve los contenidos que dejó sin referencias"""
+    orphans = set()
+    for field in ('name', 'output_rtmp'):
+        if field in data:
+            setattr(channel, field, (data[field] or '').strip())
+    if 'video_params' in data:
+        channel.video_params = (data['video_params'] or '').strip() or '-c:v copy -c:a aac -f flv'
+        validate_video_params(channel.video_params)
+    if 'filler_path' in data:
+        filler_path = (data['filler_path'] or '').strip() or None
+        if filler_path:
+            check_channel_file(filler_path)
+        if filler_path != channel.filler_path:
+            media_store.retain(filler_path)
+            orphans = release_channel_files([channel.filler_path])
+            channel.filler_path = filler_path
+    if 'starts_at' in data:
+        channel.starts_at = parse_channel_time(data['starts_at'])
+    if 'is_active' in data:
+        channel.is_active = bool(data['is_active'])
+    if not channel.name or not channel.output_rtmp:
+        raise ValueError('Faltan campos requeridos')
+    return orphans
+
+def channel_payload(channel):
+    items = ChannelItem.query.filter_by(channel_id=channel.id).order_by(ChannelItem.position, ChannelItem.id).all()
+    return channel.to_dict(items)
+
+@app.route('/channels', methods=['GET', 'POST'])
+def channels():
+    """Lista los canales o crea uno con su lista de elementos"""
+    if request.method == 'GET':
+        return jsonify([channel_payload(channel) for channel in Channel.query.order_by(Channel.id).all()])
+    try:
+        data = request.get_json(silent=True) or {}
+        channel = Channel()
+        apply_channel_fields(channel, data)
+        db.session.add(channel)
+        db.session.flush()
+        db.session.add_all(build_channel_items(channel.id, data.get('items') or []))
+        db.session.commit()
+        send_runner_command({'cmd': 'channels'})
+        return jsonify({'message': 'Canal creado exitosamente', 'channel': channel_payload(channel)}), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/channels/<int:channel_id>', methods=['GET', 'PUT', 'DELETE'])
+def channel_detail(channel_id):
+    """Consulta, modifica (reemplazando los elementos si se envían) o elimina un canal"""
+    channel = db.session.get(Channel, channel_id)
+    if not channel:
+        return jsonify({'error': 'Canal no encontrado'}), 404
+    if request.method == 'GET':
+        return jsonify(channel_payload(channel))
+    try:
+        items = ChannelItem.query.filter_by(channel_id=channel_id)
+        if request.method == 'DELETE':
+            orphans = release_channel_files([item.input_path for item in items] + [channel.filler_path])
+            items.delete()
+            db.session.delete(channel)
+            db.session.commit()
+            for orphan in orphans:
+                media_store.collect(orphan)
+            send_runner_command({'cmd': 'channels'})
+            return jsonify({'message': 'Canal eliminado exitosamente'})
+        data = request.get_json(silent=True) or {}
+        orphans = apply_channel_fields(channel, data)
+        if 'items' in data:
+            # Primero se suman las referencias nuevas: un archivo que sigue en la lista no queda sin referencias
+            created = build_channel_items(channel_id, data['items'] or [])
+            orphans |= release_channel_files([item.input_path for item in items])
+            items.delete()
+            db.session.add_all(created)
+        db.session.commit()
+        for orphan in orphans:
+            media_store.collect(orphan)
+        send_runner_command({'cmd': 'channels'})
+        return jsonify({'message': 'Canal actualizado exitosamente', 'channel': channel_payload(channel)})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/channels/<int:channel_id>/items', methods=['POST'])
+def add_channel_item(channel_id):
+    """Agrega un elemento al final de la rotación, o una inserción a una hora si trae start_at"""
+    channel = db.session.get(Channel, channel_id)
+    if not channel:
+        return jsonify({'error': 'Canal no encontrado'}), 404
+    try:
+        last_position = db.session.execute(
+            db.select(db.func.max(ChannelItem.position)).where(ChannelItem.channel_id == channel_id)
+        ).scalar()
+        item, = build_channel_items(channel_id, [request.get_json(silent=True) or {}], (last_position or 0) + 1)
+        db.session.add(item)
+        db.session.commit()
+        send_runner_command({'cmd': 'channels'})
+        return jsonify(item.to_dict()), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/channels/<int:channel_id>/items/<int:item_id>', methods=['DELETE'])
+def delete_channel_item(channel_id, item_id):
+    item = ChannelItem.query.filter_by(channel_id=channel_id, id=item_id).first()
+    if not item:
+        return jsonify({'error': 'Elemento no encontrado'}), 404
+    orphans = release_channel_files([item.input_path])
+    db.session.delete(item)
+    db.session.commit()
+    for orphan in orphans:
+        media_store.collect(orphan)
+    send_runner_command({'cmd': 'channels'})
+    return jsonify({'message': 'Elemento eliminado exitosamente'})
+
+@app.route('/channels/<int:channel_id>/<action>', methods=['POST'])
+def toggle_channel(channel_id, action):
+    """Inicia (start) o detiene (stop) un canal; si tiene starts_at arranca a esa hora"""
+    if action not in ('start', 'stop'):
+        return jsonify({'error': 'Acción inválida'}), 404
+    channel = db.session.get(Channel, channel_id)
+    if not channel:
+        return jsonify({'error': 'Canal no encontrado'}), 404
+    channel.is_active = action == 'start'
+    if channel.is_active:
+        channel.error = None
+    db.session.commit()
+    send_runner_command({'cmd': 'channels'})
+    return jsonify({
+        'message': f"Canal {'iniciado' if channel.is_active else 'detenido'} exitosamente",
+        'channel': channel.to_dict()
+    })
+
+def apply_encoding_profile_fields(profile, data):
+    """Copia al perfil los campos presentes en el JSON recibido y valida los parámetros"""
+    for field in ('name', 'description', 'video_params'):
+        if field in data:
+            setattr(profile, field, (data[field] or '').strip() or None)
+    if not profile.name:
+        raise ValueError('Falta el nombre del perfil')
+    validate_video_params(profile.video_params)
+    duplicate = EncodingProfile.query.filter(EncodingProfile.name == profile.name, EncodingProfile.id != profile.id).first()
+    if duplicate:
+        raise ValueError(f'Ya existe un perfil llamado {profile.name}')
+
+@app.route('/encoding_profiles', methods=['GET', 'POST'])
+def encoding_profiles():
+    """Lista los perfiles de codificación o crea uno"""
+    if request.method == 'GET':
+        return jsonify([profile.to_dict() for profile in EncodingProfile.query.order_by(EncodingProfile.name).all()])
+    try:
+        profile = EncodingProfile()
+        apply_encoding_profile_fields(profile, request.get_json(silent=True) or {})
+        db.session.add(profile)
+        db.session.commit()
+        return jsonify({'message': 'Perfil creado exitosamente', 'profile': profile.to_dict()}), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/encoding_profiles/<int:profile_id>', methods=['GET', 'PUT', 'DELETE'])
+def encoding_profile_detail(profile_id):
+    """
+    Consulta, modifica o elimina un perfil.
+
+    Al cambiar los parámetros se copian a los streams que usan el perfil y la
+    calibración anterior deja de valer; al eliminarlo los streams conservan
+    los parámetros como texto libre.
+    """
+    profile = db.session.get(EncodingProfile, profile_id)
+    if not profile:
+        return jsonify({'error': 'Perfil no encontrado'}), 404
+    if request.method == 'GET':
+        return jsonify(dict(profile.to_dict(), streams=Stream.query.filter_by(encoding_profile_id=profile_id).count()))
+    try:
+        if request.method == 'DELETE':
+            Stream.query.filter_by(encoding_profile_id=profile_id).update({'encoding_profile_id': None})
+            db.session.delete(profile)
+            db.session.commit()
+            return jsonify({'message': 'Perfil eliminado exitosamente'})
+        previous_params = profile.video_params
+        apply_encoding_profile_fields(profile, request.get_json(silent=True) or {})
+        if profile.video_params != previous_params:
+            profile.cpu_cost = profile.speed = profile.calibrated_at = profile.calibration_error = None
+            profile.calibration_status = 'pending'
+            Stream.query.filter_by(encoding_profile_id=profile_id).update({'video_params': profile.video_params})
+        db.session.commit()
+        return jsonify({'message': 'Perfil actualizado exitosamente', 'profile': profile.to_dict()})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/encoding_profiles/<int:profile_id>/calibrate', methods=['POST'])
+def calibrate_profile(profile_id):
+    """Pide al runner líder que mida el costo de CPU del perfil (con input_path, sobre ese archivo)"""
+    profile = db.session.get(EncodingProfile, profile_id)
+    if not profile:
+        return jsonify({'error': 'Perfil no encontrado'}), 404
+    input_path = (request.get_json(silent=True) or {}).get('input_path')
+    if input_path and not os.path.exists(get_absolute_path(input_path)):
+        return jsonify({'error': 'El archivo de entrada no existe'}), 400
+    profile.calibration_status = 'calibrating'
+    db.session.commit()
+    send_runner_command({'cmd': 'calibrate', 'profile_id': profile_id, 'input_path': input_path})
+    return jsonify({'message': 'Calibración iniciada', 'profile': profile.to_dict()}), 202
+
 @app.route('/list_files')
 def list_files():
-    upload_dir = os.path.join(app.root_path, 'uploads')
-    files = []
-    total_size = 0
-    
+    """Archivos de uploads desde el catálogo en memoria, con soporte de ETag / If-None-Match"""
     try:
-        for filename in os.listdir(upload_dir):
-            filepath = os.path.join(upload_dir, filename)
-            if os.path.isfile(filepath):
-                size = os.path.getsize(filepath)
-                modified = os.path.getmtime(filepath)
-                files.append({
-                    'name': filename,
-                    'size': size,
-                    'size_formatted': format_size(size),
-                    'modified': datetime.fromtimestamp(modified).strftime('%Y-%m-%d %H:%M:%S'),
-                    'type': os.path.splitext(filename)[1][1:].upper() or 'FILE'
-                })
-                total_size += size
-        
-        return jsonify({
-            'files': sorted(files, key=lambda x: x['modified'], reverse=True),
-            'total_size': format_size(total_size)
-        })
+        etag = file_catalog.etag()
+        version = file_catalog.version
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            files, total_size = file_catalog.listing()
+            response = jsonify({
+                'files': files,
+                'total_size': total_size,
+                'version': version
+            })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def send_upload(relative_path):
+    """
+    Envía un archivo de uploads con soporte de Range.
+
+    Detrás de nginx (X_ACCEL_REDIRECT) solo se devuelve la cabecera
+    X-Accel-Redirect y nginx sirve el archivo con sendfile; si no, Werkzeug
+    responde con conditional=True (Range, ETag, 304) y wsgi.file_wrapper.
+    """
+    if app.config['X_ACCEL_REDIRECT']:
+        response = Response(mimetype=mimetypes.guess_type(relative_path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_PREFIX'] + quote(relative_path)
+        return response
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], relative_path, conditional=True)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
 @app.route('/play/<filename>')
 def play_video(filename):
-    upload_dir = os.path.join(app.root_path, 'uploads')
-    video_path = os.path.join(upload_dir, filename)
-    if os.path.exists(video_path) and filename.lower().endswith(('.mp4', '.mov', '.avi')):
-        return send_from_directory(upload_dir, filename)
-    return 'Archivo no encontrado', 404
+    """
+    Reproduce un archivo de uploads.
+
+    Con ?preview=1 se entrega la versión liviana si ya existe; si no, se
+    encola su generación y mientras tanto se entrega el original.
+    """
+    video_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if not video_path or not os.path.isfile(video_path) or not filename.lower().endswith(('.mp4', '.mov', '.avi')):
+        return 'Archivo no encontrado', 404
+    if request.args.get('preview'):
+        if preview_renditions.is_ready(filename):
+            return send_upload(os.path.relpath(preview_renditions.path_for(filename), app.config['UPLOAD_FOLDER']))
+        preview_renditions.request(filename)
+    return send_upload(filename)
 
 @app.route('/health')
 def health_check():
     try:
         # Verificar la conexión a la base de datos
-        db.session.execute('SELECT 1')
+        db.session.execute(db.text('SELECT 1'))
         
         # Verificar directorios necesarios
         upload_dir = os.path.join(app.config['UPLOAD_FOLDER'])
@@ -727,9 +5721,8 @@ def health_check():
                 'message': 'Upload directory not found'
             }), 500
             
-        # Verificar que nginx está corriendo
-        nginx_status = os.system('pidof nginx > /dev/null')
-        if nginx_status != 0:
+        # Verificar que nginx está corriendo a partir de su archivo pid
+        if not is_nginx_running():
             return jsonify({
                 'status': 'error',
                 'message': 'Nginx not running'
@@ -738,7 +5731,7 @@ def health_check():
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'uptime': os.popen('uptime').read().strip()
+            'uptime': str(timedelta(seconds=int(time.time() - process_start_time)))
         })
     except Exception as e:
         return jsonify({
@@ -746,6 +5739,20 @@ def health_check():
             'message': str(e)
         }), 500
 
+def is_nginx_running():
+    """Comprueba el proceso maestro de nginx mediante su archivo pid, sin lanzar subprocesos"""
+    try:
+        with open(app.config['NGINX_PID_FILE']) as pid_file:
+            os.kill(int(pid_file.read().strip()), 0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/upload_video', methods=['POST'])
 def upload_video():
     try:
@@ -762,11 +5769,9 @@ def upload_video():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Tipo de archivo no permitido'}), 400
         
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        
-        file.save(file_path)
+        unique_filename = save_uploaded_file(file)
+        db.session.commit()
+        media_probes.request(unique_filename)
         
         return jsonify({
             'message': 'Video subido exitosamente',
@@ -774,8 +5779,230 @@ def upload_video():
         })
         
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/uploads/init', methods=['POST'])
+def init_chunked_upload():
+    """Inicia una subida por partes reanudable y reserva el espacio en disco"""
+    try:
+        if not ensure_upload_folder():
+            return jsonify({'error': 'No se pudo crear la carpeta de uploads'}), 500
+        
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('filename') or '')
+        if not filename:
+            return jsonify({'error': 'No se seleccionó ningún archivo'}), 400
+        if not allowed_file(filename):
+            return jsonify({'error': 'Tipo de archivo no permitido'}), 400
+        try:
+            total_size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Tamaño inválido'}), 400
+        if total_size <= 0 or total_size > app.config['UPLOAD_MAX_SIZE']:
+            return jsonify({'error': 'Tamaño de archivo no permitido'}), 400
+        expected_sha256 = (data.get('sha256') or '').lower() or None
+        
+        cleanup_upload_sessions()
+        
+        upload_session = UploadSession(
+            id=uuid.uuid4().hex,
+            filename=f"{uuid.uuid4()}_{filename}",
+            total_size=total_size,
+            received=0,
+            expected_sha256=expected_sha256
+        )
+        partial_path = get_partial_path(upload_session.id)
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+        
+        # Reservar el espacio completo de una vez: falla pronto si no cabe y evita fragmentación
+        fd = os.open(partial_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, total_size)
+            else:
+                os.ftruncate(fd, total_size)
+        except OSError as e:
+            os.close(fd)
+            os.remove(partial_path)
+            return jsonify({'error': f'No hay espacio para el archivo: {str(e)}'}), 507
+        os.close(fd)
+        
+        db.session.add(upload_session)
+        db.session.commit()
+        return jsonify(upload_session.to_dict()), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def chunked_upload_status(upload_id):
+    """Estado de una subida por partes; Upload-Offset indica desde dónde reanudar"""
+    upload_session = db.session.get(UploadSession, upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Subida no encontrada'}), 404
+    response = jsonify(upload_session.to_dict())
+    response.headers['Upload-Offset'] = str(upload_session.received)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """
+    Recibe una parte en la posición Upload-Offset.
+
+    Antes de escribir, la petición reserva la subida con un UPDATE
+    condicionado al offset (entre procesos web no sirve un lock en memoria):
+    una segunda parte en paralelo, o una con el offset viejo, recibe 409. El
+    cuerpo se lee en bloques de UPLOAD_READ_SIZE y se escribe directo al
+    archivo parcial, actualizando el sha256 a medida que llega; si la conexión
+    se corta, lo ya escrito cuenta y el cliente reanuda desde el nuevo offset.
+    """
+    upload_session = db.session.get(UploadSession, upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Subida no encontrada'}), 404
+    if upload_session.status != 'uploading':
+        return jsonify({'error': 'La subida ya fue finalizada'}), 409
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset inválido'}), 400
+    if offset != upload_session.received:
+        response = jsonify({'error': 'El offset no coincide con lo recibido', 'offset': upload_session.received})
+        response.headers['Upload-Offset'] = str(upload_session.received)
+        return response, 409
+    length = request.content_length
+    if length is None or offset + length > upload_session.total_size:
+        return jsonify({'error': 'La parte excede el tamaño declarado'}), 400
+    
+    writer = uuid.uuid4().hex
+    ttl = timedelta(seconds=app.config['UPLOAD_WRITER_TTL'])
+    now = datetime.now()
+    claimed = db.session.execute(
+        db.update(UploadSession)
+        .where(
+            UploadSession.id == upload_id,
+            UploadSession.status == 'uploading',
+            UploadSession.received == offset,
+            db.or_(UploadSession.writer.is_(None), UploadSession.writer_expires_at < now)
+        )
+        .values(writer=writer, writer_expires_at=now + ttl)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        current = db.session.scalar(db.select(UploadSession.received).where(UploadSession.id == upload_id))
+        if current is None:
+            return jsonify({'error': 'Subida no encontrada'}), 404
+        response = jsonify({'error': 'Ya hay una parte en curso para esta subida', 'offset': current})
+        response.headers['Upload-Offset'] = str(current)
+        return response, 409
+    
+    received = offset
+    try:
+        hasher = upload_hashers.get(upload_session)
+        stream = request.stream
+        read_size = app.config['UPLOAD_READ_SIZE']
+        renew_at = time.monotonic() + ttl.total_seconds() / 2
+        with open(get_partial_path(upload_id), 'r+b') as partial:
+            partial.seek(offset)
+            try:
+                while True:
+                    block = stream.read(read_size)
+                    if not block:
+                        break
+                    partial.write(block)
+                    upload_hashers.update(upload_id, hasher, block)
+                    received += len(block)
+                    UPLOAD_BYTES.inc(len(block))
+                    if time.monotonic() >= renew_at:
+                        # Un cliente lento conserva la reserva mientras siga enviando datos
+                        renew_at = time.monotonic() + ttl.total_seconds() / 2
+                        db.session.execute(
+                            db.update(UploadSession).where(UploadSession.id == upload_id, UploadSession.writer == writer)
+                            .values(writer_expires_at=datetime.now() + ttl)
+                        )
+                        db.session.commit()
+            except ClientDisconnected:
+                print(f"Subida {upload_id} interrumpida en {received} bytes")
+        
+        # Solo cuenta si la reserva sigue siendo de esta petición (no venció ni se canceló la subida)
+        updated = db.session.execute(
+            db.update(UploadSession).where(UploadSession.id == upload_id, UploadSession.writer == writer)
+            .values(received=received, writer=None, writer_expires_at=None, updated_at=datetime.now())
+        ).rowcount
+        db.session.commit()
+        if not updated:
+            upload_hashers.reset(upload_id)
+            return jsonify({'error': 'La reserva de la parte venció o la subida se canceló'}), 409
+        db.session.refresh(upload_session)
+        response = jsonify(upload_session.to_dict())
+        response.headers['Upload-Offset'] = str(upload_session.received)
+        return response
+    except Exception as e:
+        db.session.rollback()
+        upload_hashers.reset(upload_id)
+        try:
+            db.session.execute(
+                db.update(UploadSession).where(UploadSession.id == upload_id, UploadSession.writer == writer)
+                .values(writer=None, writer_expires_at=None)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    """Verifica tamaño y sha256 y guarda el archivo completo en la carpeta de uploads (deduplicado por sha256)"""
+    try:
+        upload_session = db.session.get(UploadSession, upload_id)
+        if not upload_session:
+            return jsonify({'error': 'Subida no encontrada'}), 404
+        if upload_session.status == 'completed':
+            return jsonify(dict(upload_session.to_dict(), message='Video subido exitosamente'))
+        if upload_session.received != upload_session.total_size:
+            return jsonify({
+                'error': 'La subida está incompleta',
+                'offset': upload_session.received
+            }), 409
+        
+        # Si otro proceso escribió alguna parte, get() recalcula el sha256 desde el archivo parcial
+        digest = upload_hashers.get(upload_session).hexdigest()
+        if upload_session.expected_sha256 and digest != upload_session.expected_sha256:
+            return jsonify({'error': 'El sha256 no coincide con el declarado', 'sha256': digest}), 422
+        
+        upload_session.sha256 = digest
+        upload_session.status = 'completed'
+        upload_session.updated_at = datetime.now()
+        # La subida queda completa en el mismo commit que registra el blob y el nombre
+        media_store.ingest(get_partial_path(upload_id), digest, upload_session.filename)
+        db.session.commit()
+        upload_hashers.discard(upload_id)
+        media_probes.request(upload_session.filename)
+        
+        return jsonify(dict(upload_session.to_dict(), message='Video subido exitosamente'))
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """Cancela una subida por partes y libera el espacio reservado"""
+    upload_session = db.session.get(UploadSession, upload_id)
+    if not upload_session:
+        return jsonify({'error': 'Subida no encontrada'}), 404
+    if upload_session.status == 'uploading':
+        try:
+            os.remove(get_partial_path(upload_id))
+        except OSError:
+            pass
+    upload_hashers.discard(upload_id)
+    db.session.delete(upload_session)
+    db.session.commit()
+    return jsonify({'status': 'success', 'message': 'Subida cancelada'})
+
 def format_size(size):
     for unit in ['B', 'KB', 'MB', 'GB']:
         if size < 1024:
@@ -787,26 +6014,45 @@ def format_size(size):
 import atexit
 @atexit.register
 def cleanup():
-    observer.stop()
-    observer.join()
+    if observer.is_alive():
+        observer.stop()
+        observer.join()
+    # Liberar el lease para que un runner en espera tome el relevo sin esperar a que venza
+    if broadcast_runner.is_leader:
+        try:
+            broadcast_runner.release_lease()
+        except Exception as e:
+            print(f"Error al liberar el lease del runner: {str(e)}")
 
-if __name__ == '__main__':
+def startup():
+    """Preparación común al servidor de desarrollo, a wsgi.py y a runner.py"""
     with app.app_context():
         db.create_all()
         ensure_upload_folder()
-        
-        # Programar streams existentes que estén activos y aún no hayan comenzado
-        current_time = datetime.now()
-        active_streams = Stream.query.filter(
-            Stream.is_active == True,
-            Stream.scheduled_time > current_time,
-            Stream.status == 'pending'
-        ).all()
-        
-        for stream in active_streams:
-            schedule_stream(stream)
-        
-        # Crear backup inicial
-        backup_database()
     
-    socketio.run(app, debug=True, host='0.0.0.0', port=8000, allow_unsafe_werkzeug=True)
+    # El scheduler arranca en pausa en todos los procesos: los procesos web solo agregan y quitan
+    # trabajos del almacén compartido y únicamente el runner líder lo reanuda y los ejecuta.
+    scheduler.start(paused=True)
+    
+    # Solo los runners vigilan las carpetas: los procesos web recorren uploads al listar si la carpeta
+    # cambió y piden las grabaciones entrantes al runner
+    if app.config['RTMP_ROLE'] in ('all', 'runner'):
+        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'receiving'), exist_ok=True)
+        observer.start()
+        file_catalog.watched = True
+        threading.Thread(target=file_catalog.scan, name='file-catalog-scan', daemon=True).start()
+    
+    # En modo pool cada runner reclama streams vencidos según su capacidad libre
+    if app.config['RUNNER_POOL'] and app.config['RTMP_ROLE'] in ('all', 'runner'):
+        threading.Thread(target=runner_pool.run, name='runner-pool', daemon=True).start()
+    
+    # En modo 'all' el runner corre en un hilo del mismo proceso; al tomar el lease reconcilia
+    # los streams con los trabajos guardados y crea el backup inicial
+    if app.config['RTMP_ROLE'] == 'all':
+        threading.Thread(target=broadcast_runner.run, name='broadcast-runner', daemon=True).start()
+
+if __name__ == '__main__':
+    startup()
+    
+    # Sin recargador: el proceso padre también iniciaría un scheduler sobre el mismo almacén de trabajos
+    socketio.run(app, debug=True, host='0.0.0.0', port=8000, allow_unsafe_werkzeug=True, use_reloader=False)
@@ -0,0 +1,19 @@
+"""
+Demonio runner de transmisiones.
+
+Es dueño del scheduler y de los procesos ffmpeg; los procesos web (RTMP_ROLE=web)
+solo escriben en la base y le avisan por RUNNER_COMMAND_SOCKET. Se pueden
+levantar varios runners: el que tiene el lease de runner_lease es el líder y
+los demás esperan en espera activa para tomar el relevo si deja de renovarlo.
+
+    RTMP_ROLE=runner SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6379/0 python runner.py
+"""
+import os
+
+os.environ.setdefault('RTMP_ROLE', 'runner')
+
+from app import broadcast_runner, startup  # noqa: E402
+
+if __name__ == '__main__':
+    startup()
+    broadcast_runner.run()
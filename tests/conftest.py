@@ -0,0 +1,144 @@
+"""
+Fixtures de la suite.
+
+app.py arma su configuración al importarse, así que las variables de entorno
+se fijan antes: base SQLite, carpetas de uploads, backups y listas de
+canales, y socket de comandos en un directorio temporal. Cada prueba recrea
+las tablas y vacía uploads; el proceso se comporta como runner líder, así
+los comandos (cancel, wakeup, ...) se atienden en el mismo proceso.
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import time
+from datetime import datetime
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix='rtmp-tests-')
+# Archivo y no ':memory:': en memoria todos los hilos (análisis, runner) comparten una sola conexión
+# y el commit o rollback de uno alcanza a la transacción de otro
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'streams.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(WORKDIR, 'uploads')
+os.environ['BACKUP_FOLDER'] = os.path.join(WORKDIR, 'backups')
+os.environ['RUNNER_COMMAND_SOCKET'] = os.path.join(WORKDIR, 'runner.sock')
+os.environ['CHANNEL_FOLDER'] = os.path.join(WORKDIR, 'channels')
+os.environ.setdefault('RTMP_ROLE', 'all')
+os.makedirs(os.path.join(os.environ['UPLOAD_FOLDER'], 'receiving'), exist_ok=True)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as rtmp_app  # noqa: E402
+
+# Sin startup(): no hay watchdog (sus eventos de la limpieza entre pruebas llegarían con las tablas
+# ya recreadas), el catálogo se mantiene con las llamadas explícitas de la aplicación y el
+# scheduler arranca en pausa como en cualquier proceso
+rtmp_app.file_catalog.watched = True
+rtmp_app.scheduler.start(paused=True)
+
+PROBE_DURATION = 60.0
+
+
+def fake_probe(path, **kwargs):
+    """ffprobe de mentira: los archivos con 'bad' en el nombre no se pueden analizar"""
+    if 'bad' in os.path.basename(path):
+        raise rtmp_app.ffmpeg.Error('ffprobe', b'', b'Invalid data found when processing input')
+    return {
+        'format': {'duration': str(PROBE_DURATION), 'format_name': 'mov,mp4', 'bit_rate': '2500000'},
+        'streams': [
+            {'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 720, 'avg_frame_rate': '30/1'},
+            {'codec_type': 'audio', 'codec_name': 'aac'}
+        ]
+    }
+
+
+def wait_idle(module, timeout=5):
+    """Espera a que terminen los análisis, vistas previas y backups en segundo plano"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not (module.media_probes.pending or module.preview_renditions.pending
+                or module.database_backups.running or module.database_backups.pending.is_set()):
+            return
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def rtmp(monkeypatch):
+    """Módulo app con tablas nuevas, uploads vacío y este proceso como líder"""
+    upload_folder = rtmp_app.app.config['UPLOAD_FOLDER']
+    for name in os.listdir(upload_folder):
+        path = os.path.join(upload_folder, name)
+        if name == 'receiving':
+            continue
+        shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+    with rtmp_app.app.app_context():
+        rtmp_app.db.drop_all()
+        rtmp_app.db.create_all()
+    rtmp_app.file_catalog.scan()
+    rtmp_app.schedule_index.invalidate()
+    monkeypatch.setattr(rtmp_app.broadcast_runner, 'is_leader', True)
+    monkeypatch.setattr(rtmp_app, 'publish_event', lambda name, data: None)
+    monkeypatch.setattr(rtmp_app.ffmpeg, 'probe', fake_probe)
+    yield rtmp_app
+    wait_idle(rtmp_app)
+    with rtmp_app.app.app_context():
+        rtmp_app.db.session.remove()
+
+
+@pytest.fixture
+def client(rtmp):
+    return rtmp.app.test_client()
+
+
+def upload(client, name, data):
+    """Sube un archivo por /upload_video y devuelve el nombre guardado"""
+    response = client.post(
+        '/upload_video', data={'video': (io.BytesIO(data), name)}, content_type='multipart/form-data'
+    )
+    assert response.status_code == 200, response.json
+    return response.json['filename']
+
+
+@pytest.fixture
+def app_context(rtmp):
+    with rtmp.app.app_context():
+        yield
+
+
+def media_file(rtmp, name, data=b'x' * 1024, duration=600.0, bit_rate=2500000):
+    """Crea un archivo en uploads con su análisis de ffprobe ya guardado"""
+    path = os.path.join(rtmp.app.config['UPLOAD_FOLDER'], name)
+    with open(path, 'wb') as output:
+        output.write(data)
+    stat = os.stat(path)
+    rtmp.db.session.add(rtmp.MediaProbe(
+        path=name, size=stat.st_size, mtime=stat.st_mtime, duration=duration, bit_rate=bit_rate
+    ))
+    rtmp.db.session.commit()
+    return name
+
+
+def script(name, source):
+    """Escribe en el directorio temporal un ejecutable Python (p. ej. un ffmpeg de mentira)"""
+    path = os.path.join(WORKDIR, name)
+    with open(path, 'w') as output:
+        output.write(f'#!{sys.executable}\n' + textwrap.dedent(source))
+    os.chmod(path, 0o755)
+    return path
+
+
+def make_stream(rtmp, **fields):
+    """Crea un stream activo directamente en la base; next_run_at por defecto es scheduled_time"""
+    values = dict(
+        name='stream', input_path='video.mp4', output_rtmp='rtmp://example/live',
+        scheduled_time=datetime(2030, 1, 1, 10, 0), repeat_type='once', is_active=True, status='pending'
+    )
+    values.update(fields)
+    values.setdefault('next_run_at', values['scheduled_time'])
+    stream = rtmp.Stream(**values)
+    rtmp.db.session.add(stream)
+    rtmp.db.session.commit()
+    return stream
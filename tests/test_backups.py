@@ -0,0 +1,56 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import make_stream, wait_idle
+
+
+@pytest.fixture
+def backups(rtmp):
+    wait_idle(rtmp)
+    shutil.rmtree(rtmp.database_backups.folder, ignore_errors=True)
+    return rtmp.database_backups
+
+
+def stream_names(rtmp):
+    rtmp.db.session.expire_all()
+    return sorted(stream.name for stream in rtmp.Stream.query.all())
+
+
+def test_backup_then_restore(rtmp, app_context, backups):
+    make_stream(rtmp, name='before')
+    result = backups.backup()
+    assert result['status'] == 'success'
+    assert backups.list() == [result['file']]
+    assert not any(name.endswith('.partial') for name in os.listdir(backups.folder))
+
+    make_stream(rtmp, name='after')
+    assert stream_names(rtmp) == ['after', 'before']
+
+    runner = rtmp.app.test_cli_runner()
+    listing = runner.invoke(args=['restore-backup', '--list'])
+    assert result['file'] in listing.output
+    restored = runner.invoke(args=['restore-backup', '--at', backups.taken_at(result['file']).isoformat()])
+    assert restored.exit_code == 0, restored.output
+    assert f"Base restaurada desde {result['file']}" in restored.output
+    assert stream_names(rtmp) == ['before']
+
+    # La base reemplazada queda respaldada aparte y no cuenta como backup
+    assert any(name.startswith('streams_pre_restore_') for name in os.listdir(backups.folder))
+    assert backups.list() == [result['file']]
+
+
+def test_restore_rejects_unknown_backup(rtmp, backups):
+    result = rtmp.app.test_cli_runner().invoke(args=['restore-backup', 'streams_backup_20000101_000000.db'])
+    assert result.exit_code != 0
+    assert 'No existe el backup' in result.output
+
+
+def test_backup_endpoint_queues(rtmp, client, backups):
+    response = client.post('/backup')
+    assert response.status_code == 202 and response.json['status'] == 'queued'
+    wait_idle(rtmp)
+    listing = client.get('/backups').json
+    assert listing['last']['status'] == 'success'
+    assert [backup['name'] for backup in listing['backups']] == [listing['last']['file']]
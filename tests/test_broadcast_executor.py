@@ -0,0 +1,88 @@
+import threading
+import time
+from datetime import datetime
+
+from conftest import make_stream
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_executor_respects_limit_and_priority(rtmp, monkeypatch):
+    started, release = [], threading.Event()
+
+    def fake_stream_video(stream_id):
+        started.append(stream_id)
+        release.wait(5)
+
+    monkeypatch.setattr(rtmp, 'stream_video', fake_stream_video)
+    executor = rtmp.BroadcastExecutor({'copy': 1, 'transcode': 1})
+    due = datetime(2030, 1, 1, 10, 0)
+    assert executor.submit(1, 'copy', priority=0, scheduled_time=due)
+    assert wait_until(lambda: started == [1])
+    executor.submit(2, 'copy', priority=0, scheduled_time=due)
+    executor.submit(3, 'copy', priority=5, scheduled_time=due)
+    assert not executor.submit(3, 'copy'), 'un stream en cola no se encola dos veces'
+
+    profiles, waits = executor.snapshot()
+    assert list(profiles['copy']['running']) == [1]
+    assert profiles['copy']['queued'] == [3, 2]
+    assert waits[2]['started_at'] is None
+
+    release.set()
+    assert wait_until(lambda: started == [1, 3, 2])
+    assert wait_until(lambda: not executor.snapshot()[0]['copy']['running'])
+
+
+def test_cancel_removes_queued_stream(rtmp, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(rtmp, 'stream_video', lambda stream_id: release.wait(5))
+    executor = rtmp.BroadcastExecutor({'copy': 1, 'transcode': 1})
+    executor.submit(1, 'copy')
+    executor.submit(2, 'copy')
+    assert executor.cancel(2)
+    assert executor.snapshot()[0]['copy']['queued'] == []
+    release.set()
+
+
+def test_solo_broadcast_waits_for_a_slot(rtmp, app_context, monkeypatch):
+    started, release = [], threading.Event()
+
+    def fake_stream_video(stream_id, **options):
+        started.append((stream_id, options))
+        release.wait(5)
+
+    monkeypatch.setattr(rtmp, 'stream_video', fake_stream_video)
+    monkeypatch.setattr(rtmp, 'broadcast_executor', rtmp.BroadcastExecutor({'copy': 1, 'transcode': 1}))
+    leader = make_stream(rtmp, name='leader')
+    member = make_stream(rtmp, name='member')
+    rtmp.broadcast_executor.submit(leader.id, 'copy')
+    assert wait_until(lambda: len(started) == 1)
+
+    rtmp.start_solo_broadcast(member.id, 12.5)
+    assert rtmp.broadcast_executor.snapshot()[0]['copy']['queued'] == [member.id]
+    assert len(started) == 1, 'el destino separado respeta el límite del perfil'
+
+    release.set()
+    assert wait_until(lambda: len(started) == 2)
+    assert started[1] == (member.id, {'solo': True, 'resume_offset': 12.5})
+
+
+def test_queue_waits_keep_only_recent_finished_broadcasts(rtmp, monkeypatch):
+    finished = []
+    monkeypatch.setattr(rtmp, 'stream_video', lambda stream_id: finished.append(stream_id))
+    executor = rtmp.BroadcastExecutor({'copy': 1, 'transcode': 1}, history=3)
+    for stream_id in range(1, 11):
+        executor.submit(stream_id, 'copy')
+    assert wait_until(lambda: len(finished) == 10 and not executor.snapshot()[0]['copy']['running'])
+
+    _, waits = executor.snapshot()
+    assert sorted(waits) == [8, 9, 10]
+    assert all(stats['finished_at'] for stats in waits.values())
+    assert executor.queue_waits == {}
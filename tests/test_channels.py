@@ -0,0 +1,87 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from conftest import media_file
+
+
+def test_batch_cuts_rotation_for_timed_insert(rtmp, app_context, monkeypatch):
+    monkeypatch.setitem(rtmp.app.config, 'CHANNEL_PLAYLIST_WINDOW', 200)
+    for name, duration in (('a.mp4', 100), ('b.mp4', 50), ('news.mp4', 30), ('slate.mp4', 10)):
+        media_file(rtmp, name, duration=duration)
+    anchor = time.time()
+    channel = rtmp.Channel(name='24/7', output_rtmp='rtmp://example/live', filler_path='slate.mp4')
+    rtmp.db.session.add(channel)
+    rtmp.db.session.flush()
+    rtmp.db.session.add_all(rtmp.build_channel_items(channel.id, [
+        'a.mp4', 'b.mp4', {'input_path': 'news.mp4', 'start_at': datetime.fromtimestamp(anchor + 120).isoformat()}
+    ]))
+    rtmp.db.session.commit()
+
+    player = rtmp.ChannelPlayer(channel.id)
+    player.anchor = anchor
+    os.makedirs(player.folder, exist_ok=True)
+    entries = player.build_batch(channel)
+    assert [(entry['path'], entry['t'], entry['duration'], entry['outpoint']) for entry in entries] == [
+        ('a.mp4', 0.0, 100, None),
+        ('b.mp4', 100.0, 20, 20),  # se corta para que el noticiero salga a su hora
+        ('news.mp4', 120.0, 30, None),
+        ('a.mp4', 150.0, 100, None)
+    ]
+
+    with open(player.write_batch(entries)) as playlist:
+        lines = playlist.read().splitlines()
+    assert lines[0] == 'ffconcat version 1.0'
+    assert 'outpoint 20.000' in lines
+    assert not any(line.endswith(".ffconcat'") for line in lines)
+
+    # La tanda siguiente retoma la rotación donde quedó y ya no repite la inserción
+    assert [entry['path'] for entry in player.build_batch(channel)][:2] == ['b.mp4', 'a.mp4']
+
+
+def playlist_depth(path):
+    """Niveles de listas ffconcat que ffmpeg abre a la vez, contando desde path"""
+    with open(path) as playlist:
+        nested = [line[6:-1] for line in playlist.read().splitlines() if line.startswith("file '") and line.endswith(".ffconcat'")]
+    return 1 + max((playlist_depth(child) for child in nested if os.path.exists(child)), default=0)
+
+
+def test_playlist_nesting_stays_flat_over_many_batches(rtmp, app_context, monkeypatch):
+    monkeypatch.setitem(rtmp.app.config, 'CHANNEL_PLAYLIST_WINDOW', 20)
+    monkeypatch.setitem(rtmp.app.config, 'CHANNEL_PLAYLIST_BATCHES', 30)
+    media_file(rtmp, 'a.mp4', duration=10)
+    channel = rtmp.Channel(name='24/7', output_rtmp='rtmp://example/live')
+    rtmp.db.session.add(channel)
+    rtmp.db.session.flush()
+    rtmp.db.session.add_all(rtmp.build_channel_items(channel.id, ['a.mp4']))
+    rtmp.db.session.commit()
+
+    player = rtmp.ChannelPlayer(channel.id)
+    os.makedirs(player.folder, exist_ok=True)
+    player.reset()
+    index = player.write_index()
+    player.write_batch(player.build_batch(channel))
+    position = 0.0
+    while player.has_room():
+        position += 5
+        player.on_sample({'out_time_seconds': position})
+    # ffmpeg sigue reproduciendo hasta el final de la última tanda sin que se escriban más
+    for _ in range(10):
+        position += 5
+        player.on_sample({'out_time_seconds': position})
+
+    assert len(player.batches) == 30
+    assert player.batches[-1][0] == 29
+    assert playlist_depth(index) == 2
+    assert not os.path.exists(os.path.join(player.folder, '30.ffconcat'))
+
+
+def test_empty_rotation_is_covered_with_filler(rtmp, app_context, monkeypatch):
+    monkeypatch.setitem(rtmp.app.config, 'CHANNEL_PLAYLIST_WINDOW', 25)
+    media_file(rtmp, 'slate.mp4', duration=10)
+    channel = rtmp.Channel(name='slate', output_rtmp='rtmp://example/live', filler_path='slate.mp4')
+    rtmp.db.session.add(channel)
+    rtmp.db.session.commit()
+
+    entries = rtmp.ChannelPlayer(channel.id).build_batch(channel)
+    assert [(entry['path'], entry['item_id']) for entry in entries] == [('slate.mp4', None)] * 3
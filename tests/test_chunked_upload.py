@@ -0,0 +1,88 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+DATA = bytes(range(256)) * 64
+
+
+def init(client, **fields):
+    response = client.post('/uploads/init', json=dict({'filename': 'big.mp4', 'size': len(DATA)}, **fields))
+    assert response.status_code == 201, response.json
+    return response.json['upload_id']
+
+
+def put(client, upload_id, offset, chunk):
+    return client.put(f'/uploads/{upload_id}', data=chunk, headers={'Upload-Offset': str(offset)})
+
+
+def test_resumable_upload_is_finalized(rtmp, client):
+    upload_id = init(client, sha256=hashlib.sha256(DATA).hexdigest())
+    assert put(client, upload_id, 0, DATA[:5000]).headers['Upload-Offset'] == '5000'
+
+    conflict = put(client, upload_id, 4000, DATA[4000:])
+    assert conflict.status_code == 409 and conflict.json['offset'] == 5000
+    assert client.post(f'/uploads/{upload_id}/finalize').status_code == 409
+    # Un reinicio pierde el sha256 en memoria: se recalcula con lo ya escrito al reanudar
+    rtmp.upload_hashers.reset(upload_id)
+    assert client.head(f'/uploads/{upload_id}').headers['Upload-Offset'] == '5000'
+    assert put(client, upload_id, 5000, DATA[5000:]).status_code == 200
+
+    response = client.post(f'/uploads/{upload_id}/finalize')
+    assert response.status_code == 200, response.json
+    assert response.json['sha256'] == hashlib.sha256(DATA).hexdigest()
+    with open(os.path.join(rtmp.app.config['UPLOAD_FOLDER'], response.json['filename']), 'rb') as stored:
+        assert stored.read() == DATA
+    assert client.post(f'/uploads/{upload_id}/finalize').status_code == 200, 'finalizar dos veces no falla'
+
+
+def test_sha256_mismatch_is_rejected(rtmp, client):
+    upload_id = init(client, sha256='0' * 64)
+    assert put(client, upload_id, 0, DATA).status_code == 200
+    response = client.post(f'/uploads/{upload_id}/finalize')
+    assert response.status_code == 422
+    assert response.json['sha256'] == hashlib.sha256(DATA).hexdigest()
+    assert client.get(f'/uploads/{upload_id}').json['status'] == 'uploading'
+    assert client.get('/media_blobs').json['blobs'] == []
+
+
+def test_chunk_past_declared_size_is_rejected(rtmp, client):
+    upload_id = init(client)
+    assert put(client, upload_id, 0, DATA + b'extra').status_code == 400
+
+
+def test_parts_written_by_another_process_are_hashed(rtmp, client, app_context):
+    upload_id = init(client, sha256=hashlib.sha256(DATA).hexdigest())
+    assert put(client, upload_id, 0, DATA[:4000]).status_code == 200
+    # Otro proceso web recibe la parte siguiente: este proceso no la ve pasar por su sha256
+    with open(rtmp.get_partial_path(upload_id), 'r+b') as partial:
+        partial.seek(4000)
+        partial.write(DATA[4000:9000])
+    rtmp.db.session.execute(
+        rtmp.db.update(rtmp.UploadSession).where(rtmp.UploadSession.id == upload_id).values(received=9000)
+    )
+    rtmp.db.session.commit()
+
+    assert put(client, upload_id, 9000, DATA[9000:]).status_code == 200
+    response = client.post(f'/uploads/{upload_id}/finalize')
+    assert response.status_code == 200, response.json
+    assert response.json['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_part_in_progress_elsewhere_is_rejected(rtmp, client, app_context):
+    upload_id = init(client)
+
+    def reserve(seconds):
+        rtmp.db.session.execute(
+            rtmp.db.update(rtmp.UploadSession).where(rtmp.UploadSession.id == upload_id)
+            .values(writer='other', writer_expires_at=datetime.now() + timedelta(seconds=seconds))
+        )
+        rtmp.db.session.commit()
+
+    reserve(60)
+    response = put(client, upload_id, 0, DATA[:4000])
+    assert response.status_code == 409 and response.json['offset'] == 0
+    # Una reserva vencida (el proceso que escribía murió) no bloquea la subida
+    reserve(-1)
+    assert put(client, upload_id, 0, DATA[:4000]).headers['Upload-Offset'] == '4000'
+    rtmp.db.session.expire_all()
+    assert rtmp.db.session.get(rtmp.UploadSession, upload_id).writer is None
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import make_stream
+
+X264 = '-c:v libx264 -preset veryfast -b:v 2500k -c:a aac -f flv'
+
+
+def test_cores_are_spread_across_transcodes(rtmp):
+    allocator = rtmp.CpuAllocator(range(4))
+    assert allocator.acquire('a', 2) == [0, 1]
+    assert allocator.acquire('b', 2) == [2, 3]
+    assert allocator.acquire('c', 1) == [0]
+    allocator.release('a')
+    assert allocator.acquire('d', 3) == [0, 1, 2]
+    assert allocator.acquire('e', 10) == [0, 1, 2, 3], 'nunca más núcleos de los que hay'
+
+
+def test_calibrated_cost_sets_the_core_count(rtmp, app_context, monkeypatch):
+    monkeypatch.setattr(rtmp, 'cpu_allocator', rtmp.CpuAllocator(range(8)))
+    rtmp.db.session.add(rtmp.EncodingProfile(name='720p', video_params=X264, cpu_cost=2.4, calibrated_at=datetime.now()))
+    rtmp.db.session.commit()
+    assert rtmp.allocate_encoding_cores('run-1', X264) == [0, 1, 2]
+    assert rtmp.allocate_encoding_cores('run-2', '-c:v libx264 -c:a aac -f flv') == [3], 'sin perfil: ENCODING_DEFAULT_COST'
+    assert rtmp.allocate_encoding_cores('run-3', None) == [], 'copiar no ocupa núcleos'
+
+
+@pytest.mark.parametrize('params, reason', [
+    ('-c:v libx264 -preset veryslow -f flv', 'tiempo real'),
+    ('-c:v libx264 -threads 8 -f flv', 'la asigna el runner'),
+    ('-c:v libx264', 'formato de salida'),
+])
+def test_profile_params_are_validated(rtmp, client, params, reason):
+    response = client.post('/encoding_profiles', json={'name': 'malo', 'video_params': params})
+    assert response.status_code == 400
+    assert reason in response.json['error']
+
+
+def test_editing_a_profile_updates_its_streams(rtmp, client, app_context):
+    profile = client.post('/encoding_profiles', json={'name': '720p', 'video_params': X264}).json['profile']
+    assert client.post('/encoding_profiles', json={'name': '720p', 'video_params': X264}).status_code == 400
+    stream = make_stream(rtmp, video_params=X264, encoding_profile_id=profile['id'])
+
+    faster = X264.replace('veryfast', 'ultrafast')
+    response = client.put(f"/encoding_profiles/{profile['id']}", json={'video_params': faster})
+    assert response.status_code == 200
+    assert response.json['profile']['calibration_status'] == 'pending'
+    rtmp.db.session.expire_all()
+    assert stream.video_params == faster
@@ -0,0 +1,18 @@
+def test_telemetry_is_coalesced_per_stream(rtmp, monkeypatch):
+    emitted = []
+    monkeypatch.setattr(rtmp, 'publish_event', lambda name, data: emitted.append((name, data)))
+    coalescer = rtmp.EventCoalescer('broadcast_stats', interval=3600)
+    monkeypatch.setattr(rtmp, 'broadcast_telemetry', coalescer)
+
+    for frame in (10, 20, 30):
+        rtmp.publish_broadcast_telemetry(1, {'frame': frame, 'speed': 1.0})
+    rtmp.publish_broadcast_telemetry(2, {'frame': 5}, status='reconnecting')
+    coalescer.flush()
+    coalescer.flush()
+
+    assert len(emitted) == 1, 'un solo mensaje por intervalo y nada si no hubo cambios'
+    name, batch = emitted[0]
+    assert name == 'broadcast_stats'
+    assert [(item['stream_id'], item['frame'], item['status']) for item in batch] == [
+        (1, 30, 'streaming'), (2, 5, 'reconnecting')
+    ]
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from conftest import make_stream, media_file, script
+
+
+def test_run_ffmpeg_reads_progress_and_keeps_a_bounded_stderr(rtmp):
+    path = script('chatty-ffmpeg', """
+        import sys
+        for index in range(2000):
+            print(f'línea {index}', file=sys.stderr)
+        print('Output #0, flv', file=sys.stderr, flush=True)
+        for second in range(3):
+            print(f'frame={second * 30}', f'out_time_us={second * 1000000}', 'speed=1.01x', 'progress=continue',
+                  sep='\\n', flush=True)
+        print('progress=end', flush=True)
+        sys.exit(3)
+    """)
+    progress = rtmp.BroadcastProgress(1, max_samples=2, max_lines=5)
+    samples = []
+
+    assert rtmp.run_ffmpeg([path, '-i', 'video.mp4'], progress, on_sample=samples.append) == 3
+    assert [sample['out_time_seconds'] for sample in samples] == [0.0, 1.0, 2.0, None]
+    assert samples[1]['frame'] == 30 and samples[1]['speed'] == 1.01
+    assert len(progress.samples) == 2 and progress.latest()['progress'] == 'end'
+    assert list(progress.stderr_lines) == ['línea 1996', 'línea 1997', 'línea 1998', 'línea 1999', 'Output #0, flv']
+    assert progress.on_air_at is not None and progress.returncode == 3
+
+
+def test_dropped_broadcast_resumes_from_confirmed_offset(rtmp, app_context, monkeypatch):
+    marker = script('dropped-once.marker', '')
+    path = script('dropping-ffmpeg', f"""
+        import os, sys
+        print('Output #0, flv', file=sys.stderr, flush=True)
+        print('out_time_us=5250000', 'progress=continue', sep='\\n', flush=True)
+        if os.path.exists({marker!r}):
+            os.remove({marker!r})
+            sys.exit(1)  # el destino cortó la conexión
+    """)
+    offsets = []
+
+    def build_broadcast_command(streams, input_path, offset=0, threads=None):
+        offsets.append(offset)
+        return [path]
+
+    monkeypatch.setattr(rtmp, 'build_broadcast_command', build_broadcast_command)
+    monkeypatch.setitem(rtmp.app.config, 'BROADCAST_RETRY_BACKOFF', 0.01)
+    media_file(rtmp, 'video.mp4')
+    stream = make_stream(rtmp, next_run_at=datetime.now() - timedelta(seconds=1))
+
+    rtmp.stream_video(stream.id)
+
+    assert offsets == [0.0, 0.0, 5.25]
+    segments = rtmp.BroadcastSegment.query.order_by(rtmp.BroadcastSegment.attempt).all()
+    assert [(segment.offset, segment.out_time, segment.returncode) for segment in segments] == [
+        (0.0, 5.25, 1), (5.25, 5.25, 0)
+    ]
+    rtmp.db.session.expire_all()
+    assert (stream.status, stream.play_count) == ('completed', 1)
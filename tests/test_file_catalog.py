@@ -0,0 +1,51 @@
+import os
+
+from conftest import upload
+
+
+def test_listing_uses_etag_and_follows_changes(rtmp, client):
+    name = upload(client, 'a.mp4', b'A' * 2048)
+    response = client.get('/list_files')
+    assert [entry['name'] for entry in response.json['files']] == [name]
+    etag = response.headers['ETag']
+    assert client.get('/list_files', headers={'If-None-Match': etag}).status_code == 304
+
+    path = os.path.join(rtmp.app.config['UPLOAD_FOLDER'], name)
+    os.remove(path)
+    rtmp.file_catalog.refresh(path)
+    response = client.get('/list_files', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['files'] == []
+    assert response.headers['ETag'] != etag
+
+
+def test_hidden_and_foreign_paths_are_ignored(rtmp, client):
+    folder = rtmp.app.config['UPLOAD_FOLDER']
+    version = rtmp.file_catalog.version
+    paths = [os.path.join(folder, '.partial-upload'), os.path.join(folder, 'receiving', 'live.flv')]
+    for path in paths:
+        with open(path, 'wb') as output:
+            output.write(b'x')
+        rtmp.file_catalog.refresh(path)
+    assert rtmp.file_catalog.version == version
+    assert client.get('/list_files').json['files'] == []
+    os.remove(paths[1])
+
+
+def test_web_process_rescans_only_when_the_folder_changes(rtmp, client, monkeypatch):
+    assert not rtmp.observer.is_alive(), 'importar la aplicación no arranca watchdog'
+    monkeypatch.setattr(rtmp.file_catalog, 'watched', False)
+    monkeypatch.setitem(rtmp.app.config, 'RTMP_ROLE', 'web')
+    etag = client.get('/list_files').headers['ETag']
+    assert client.get('/list_files', headers={'If-None-Match': etag}).status_code == 304
+
+    # Otro proceso escribe en uploads: este proceso no recibe ningún evento
+    with open(os.path.join(rtmp.app.config['UPLOAD_FOLDER'], 'other.mp4'), 'wb') as output:
+        output.write(b'x' * 100)
+    response = client.get('/list_files', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [entry['name'] for entry in response.json['files']] == ['other.mp4']
+
+    monkeypatch.setattr(rtmp.broadcast_runner, 'is_leader', False)
+    monkeypatch.setattr(rtmp, 'send_runner_command', lambda command, **kwargs: {'live.flv': {'size': 1}})
+    assert client.get('/active_streams').json == {'live.flv': {'size': 1}}
@@ -0,0 +1,37 @@
+import os
+
+from conftest import PROBE_DURATION, fake_probe
+
+
+def write_file(rtmp, name, data=b'x' * 1024):
+    with open(os.path.join(rtmp.app.config['UPLOAD_FOLDER'], name), 'wb') as output:
+        output.write(data)
+    return name
+
+
+def saved_probe(rtmp, name):
+    rtmp.db.session.expire_all()
+    return rtmp.MediaProbe.query.filter_by(path=name).first()
+
+
+def test_missing_ffprobe_is_not_cached(rtmp, app_context, monkeypatch):
+    def missing_ffprobe(path, **kwargs):
+        raise FileNotFoundError(2, 'No such file or directory', 'ffprobe')
+
+    monkeypatch.setattr(rtmp.ffmpeg, 'probe', missing_ffprobe)
+    name = write_file(rtmp, 'video.mp4')
+    assert rtmp.media_probes.wait(name, 5) is None
+    assert saved_probe(rtmp, name) is None
+    assert rtmp.media_probes.request(name) is None, 'no se reintenta antes de PROBE_RETRY_SECONDS'
+
+    monkeypatch.setattr(rtmp.ffmpeg, 'probe', fake_probe)
+    monkeypatch.setattr(rtmp.media_probes, 'retry_after', 0)
+    assert rtmp.media_probes.wait(name, 5)['duration'] == PROBE_DURATION
+    assert saved_probe(rtmp, name).error is None
+
+
+def test_unreadable_file_is_cached(rtmp, app_context):
+    name = write_file(rtmp, 'bad.mp4')
+    probe = rtmp.media_probes.wait(name, 5)
+    assert probe['error'] == 'Invalid data found when processing input'
+    assert saved_probe(rtmp, name).error == probe['error']
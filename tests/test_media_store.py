@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from conftest import upload
+
+
+def test_duplicate_upload_shares_blob(rtmp, client):
+    first = upload(client, 'a.mp4', b'A' * 4096)
+    second = upload(client, 'b.mp4', b'A' * 4096)
+    folder = rtmp.app.config['UPLOAD_FOLDER']
+    assert os.stat(os.path.join(folder, first)).st_ino == os.stat(os.path.join(folder, second)).st_ino
+
+    blobs = client.get('/media_blobs').json
+    assert len(blobs['blobs']) == 1
+    assert sorted(blobs['blobs'][0]['names']) == sorted([first, second])
+    assert blobs['saved_bytes'] == 4096
+
+
+def test_preview_is_served_for_every_alias(rtmp, client):
+    first = upload(client, 'a.mp4', b'A' * 4096)
+    second = upload(client, 'b.mp4', b'A' * 4096)
+    preview = rtmp.preview_renditions.path_for(first)
+    assert preview == rtmp.preview_renditions.path_for(second)
+    os.makedirs(os.path.dirname(preview), exist_ok=True)
+    with open(preview, 'wb') as output:
+        output.write(b'preview')
+
+    for name in (first, second):
+        assert rtmp.preview_renditions.is_ready(name)
+        response = client.get(f'/play/{name}?preview=1')
+        assert response.status_code == 200
+        assert response.data == b'preview'
+        response.close()
+
+
+def test_last_stream_release_collects_content(rtmp, client):
+    name = upload(client, 'a.mp4', b'A' * 4096)
+    ids = []
+    for output in ('rtmp://x/1', 'rtmp://x/2'):
+        response = client.post('/add_stream', data={
+            'name': output, 'input_path': name, 'output_rtmp': output, 'scheduled_time': '2030-01-01T10:00'
+        })
+        assert response.status_code == 200, response.json
+        ids.append(response.json['stream']['id'])
+    assert client.get('/media_blobs').json['blobs'][0]['ref_count'] == 2
+
+    client.delete(f'/delete_stream/{ids[0]}')
+    assert os.path.exists(os.path.join(rtmp.app.config['UPLOAD_FOLDER'], name))
+    client.delete(f'/delete_stream/{ids[1]}')
+    assert not os.path.exists(os.path.join(rtmp.app.config['UPLOAD_FOLDER'], name))
+    assert client.get('/media_blobs').json['blobs'] == []
+
+
+@pytest.mark.parametrize('error', [PermissionError('sin enlaces duros'), FileNotFoundError('blob recolectado')])
+def test_ingest_falls_back_to_a_plain_copy(rtmp, client, monkeypatch, error):
+    link = os.link
+
+    def failing_link(source, destination):
+        # Con FileNotFoundError el primer enlace (al blob) funciona y falla siempre el del nombre
+        if isinstance(error, PermissionError) or not destination.startswith(rtmp.app.config['UPLOAD_FOLDER'] + '/.blobs'):
+            raise error
+        return link(source, destination)
+
+    monkeypatch.setattr(rtmp.os, 'link', failing_link)
+    name = upload(client, 'a.mp4', b'A' * 4096)
+    with open(os.path.join(rtmp.app.config['UPLOAD_FOLDER'], name), 'rb') as stored:
+        assert stored.read() == b'A' * 4096
+    with rtmp.app.app_context():
+        assert rtmp.db.session.get(rtmp.MediaAlias, name) is None
+    assert client.get('/media_blobs').json['blobs'] == []
+
+
+def stored_files(rtmp):
+    folder = rtmp.app.config['UPLOAD_FOLDER']
+    return sorted(
+        os.path.relpath(os.path.join(root, name), folder)
+        for root, _, names in os.walk(folder) if '.partial' not in root for name in names
+    )
+
+
+@pytest.mark.parametrize('rejection', ['past', 'conflict'])
+def test_rejected_add_stream_leaves_no_upload_behind(rtmp, client, monkeypatch, rejection):
+    kept = upload(client, 'kept.mp4', b'K' * 4096)
+    before = stored_files(rtmp)
+    if rejection == 'conflict':
+        monkeypatch.setattr(rtmp, 'validate_schedule', lambda stream, exclude_id=None: ([{'type': 'overlap'}], True))
+    for data in (b'N' * 4096, b'K' * 4096):  # contenido nuevo y contenido ya guardado
+        response = client.post('/add_stream', data={
+            'name': 'x', 'output_rtmp': 'rtmp://x/1', 'video': (io.BytesIO(data), 'new.mp4'),
+            'scheduled_time': '2000-01-01T10:00' if rejection == 'past' else '2030-01-01T10:00'
+        }, content_type='multipart/form-data')
+        assert response.status_code == (400 if rejection == 'past' else 409)
+
+    assert stored_files(rtmp) == before
+    blobs = client.get('/media_blobs').json['blobs']
+    assert [blob['names'] for blob in blobs] == [[kept]]
+
+
+def test_ingest_without_commit_is_discarded_when_the_session_closes(rtmp):
+    folder = rtmp.app.config['UPLOAD_FOLDER']
+    temporary = os.path.join(folder, '.partial', 'pending')
+    os.makedirs(os.path.dirname(temporary), exist_ok=True)
+    with open(temporary, 'wb') as output:
+        output.write(b'P' * 4096)
+    with rtmp.app.app_context():
+        rtmp.media_store.ingest(temporary, hashlib.sha256(b'P' * 4096).hexdigest(), 'pending.mp4')
+        assert os.path.exists(os.path.join(folder, 'pending.mp4'))
+
+    assert not os.path.exists(os.path.join(folder, 'pending.mp4'))
+    assert not os.path.exists(rtmp.media_store.blob_path(hashlib.sha256(b'P' * 4096).hexdigest()))
+    with rtmp.app.app_context():
+        assert rtmp.db.session.get(rtmp.MediaAlias, 'pending.mp4') is None
+
+
+def test_channels_hold_references_to_their_files(rtmp, client):
+    item, filler = upload(client, 'item.mp4', b'I' * 4096), upload(client, 'slate.mp4', b'S' * 4096)
+    response = client.post('/add_stream', data={
+        'name': 'x', 'input_path': item, 'output_rtmp': 'rtmp://x/1', 'scheduled_time': '2030-01-01T10:00'
+    })
+    stream_id = response.json['stream']['id']
+    response = client.post('/channels', json={
+        'name': '24/7', 'output_rtmp': 'rtmp://x/live', 'filler_path': filler, 'items': [item, item]
+    })
+    assert response.status_code == 201, response.json
+    channel_id = response.json['channel']['id']
+
+    def ref_counts():
+        return {blob['names'][0]: blob['ref_count'] for blob in client.get('/media_blobs').json['blobs']}
+
+    assert ref_counts() == {item: 3, filler: 1}
+    client.delete(f'/delete_stream/{stream_id}')
+    assert ref_counts() == {item: 2, filler: 1}
+
+    # Un contador desfasado se corrige contando también los elementos y el relleno de los canales
+    with rtmp.app.app_context():
+        rtmp.db.session.execute(rtmp.db.update(rtmp.MediaBlob).values(ref_count=0))
+        rtmp.db.session.commit()
+        for name in (item, filler):
+            rtmp.media_store.collect(rtmp.media_store.content_key(name))
+    assert ref_counts() == {item: 2, filler: 1}
+
+    client.delete(f'/channels/{channel_id}')
+    assert ref_counts() == {}
+    assert not os.path.exists(os.path.join(rtmp.app.config['UPLOAD_FOLDER'], item))
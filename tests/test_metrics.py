@@ -0,0 +1,24 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+
+def query_count(rtmp):
+    return sum(state['count'] for state in rtmp.DB_QUERY_DURATION.values.values())
+
+
+def test_failed_queries_do_not_leak_timings(rtmp, app_context):
+    with rtmp.db.engine.connect() as connection:
+        before = query_count(rtmp)
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('SELECT * FROM tabla_inexistente')
+            connection.rollback()
+        connection.exec_driver_sql('SELECT 1')
+        assert not connection.info.get('query_start_time')
+    assert query_count(rtmp) == before + 1
+
+
+def test_label_values_are_escaped(rtmp):
+    metric = rtmp.Metric('rtmp_test_total', 'counter', 'Prueba')
+    metric.inc(stream='Noche "en vivo"\nC:\\videos')
+    assert metric.render()[-1] == 'rtmp_test_total{stream="Noche \\"en vivo\\"\\nC:\\\\videos"} 1'
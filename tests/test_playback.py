@@ -0,0 +1,28 @@
+from conftest import upload
+
+DATA = bytes(range(256)) * 16
+
+
+def test_range_requests_are_served(rtmp, client):
+    name = upload(client, 'clip.mp4', DATA)
+    response = client.get(f'/play/{name}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(DATA)}'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.data == DATA[100:200]
+    response.close()
+
+
+def test_nginx_serves_the_file_with_x_accel(rtmp, client, monkeypatch):
+    name = upload(client, 'clip con espacios.mp4', DATA)
+    monkeypatch.setitem(rtmp.app.config, 'X_ACCEL_REDIRECT', True)
+    response = client.get(f'/play/{name}')
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == '/upload/' + name.replace(' ', '%20')
+    assert response.mimetype == 'video/mp4'
+    assert response.data == b''
+
+
+def test_only_videos_inside_uploads_are_played(rtmp, client):
+    assert client.get('/play/..%2Fstreams.db').status_code == 404
+    assert client.get('/play/missing.mp4').status_code == 404
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from conftest import WORKDIR, script
+from test_broadcast_executor import wait_until
+
+
+@pytest.fixture
+def fake_ffmpeg(rtmp, monkeypatch):
+    """ffmpeg de mentira en el PATH: copia la entrada al MP4 o falla si la entrada dice 'corrupt'"""
+    folder = os.path.join(WORKDIR, 'bin')
+    os.makedirs(folder, exist_ok=True)
+    os.replace(script('ffmpeg', """
+        import shutil, sys
+        source, target = sys.argv[sys.argv.index('-i') + 1], sys.argv[-1]
+        if b'corrupt' in open(source, 'rb').read():
+            print('Invalid data found when processing input', file=sys.stderr)
+            sys.exit(1)
+        shutil.copyfile(source, target)
+    """), os.path.join(folder, 'ffmpeg'))
+    monkeypatch.setenv('PATH', folder + os.pathsep + os.environ['PATH'])
+    monkeypatch.setattr(rtmp, 'schedule_stream', lambda stream: None)
+    yield
+    receiving = os.path.join(rtmp.app.config['UPLOAD_FOLDER'], 'receiving')
+    for name in os.listdir(receiving):
+        os.remove(os.path.join(receiving, name))
+
+
+def recording(rtmp, name, data=b'flv' * 100):
+    with open(rtmp.post_record.receiving_path(name), 'wb') as output:
+        output.write(data)
+
+
+def finished_job(rtmp, source):
+    assert wait_until(lambda: source not in rtmp.post_record.pending)
+    rtmp.db.session.expire_all()
+    return rtmp.RecordingJob.query.filter_by(source=source).one()
+
+
+def test_recording_becomes_mp4(rtmp, app_context, fake_ffmpeg):
+    recording(rtmp, 'show.flv')
+    open(os.path.join(rtmp.app.config['UPLOAD_FOLDER'], 'show.mp4'), 'wb').close()
+
+    rtmp.post_record.submit('show.flv')
+    job = finished_job(rtmp, 'show.flv')
+
+    assert (job.status, job.output, job.size, job.duration) == ('completed', 'show-1.mp4', 300, 60.0)
+    assert os.path.exists(rtmp.get_absolute_path('show-1.mp4'))
+    assert not os.path.exists(rtmp.post_record.receiving_path('show.flv'))
+    assert not [name for name in os.listdir(rtmp.app.config['UPLOAD_FOLDER']) if name.endswith('.tmp.mp4')]
+
+    # Una grabación ya procesada no se repite salvo que se pida
+    recording(rtmp, 'show.flv')
+    rtmp.post_record.submit('show.flv')
+    assert 'show.flv' not in rtmp.post_record.pending
+    assert finished_job(rtmp, 'show.flv').output == 'show-1.mp4'
+
+
+def test_failed_remux_keeps_source(rtmp, app_context, fake_ffmpeg):
+    recording(rtmp, 'broken.flv', b'corrupt')
+
+    rtmp.post_record.submit('broken.flv')
+    job = finished_job(rtmp, 'broken.flv')
+
+    assert job.status == 'error'
+    assert 'Invalid data' in job.error
+    assert os.path.exists(rtmp.post_record.receiving_path('broken.flv'))
+    assert not os.path.exists(rtmp.get_absolute_path('broken.mp4'))
+
+    recording(rtmp, 'broken.flv')
+    rtmp.post_record.submit('broken.flv', retry=True)
+    assert finished_job(rtmp, 'broken.flv').status == 'completed'
+
+
+def test_recover_and_schedule_rerun(rtmp, app_context, fake_ffmpeg, monkeypatch):
+    monkeypatch.setitem(rtmp.app.config, 'RECORD_AUTO_SCHEDULE', True)
+    monkeypatch.setitem(rtmp.app.config, 'RECORD_RERUN_RTMP', 'rtmp://rerun/live')
+    recording(rtmp, 'old.flv')
+    recording(rtmp, 'growing.flv')
+    os.utime(rtmp.post_record.receiving_path('old.flv'), (0, 0))
+
+    rtmp.post_record.recover()
+    job = finished_job(rtmp, 'old.flv')
+
+    assert job.status == 'completed'
+    assert rtmp.RecordingJob.query.filter_by(source='growing.flv').first() is None, 'sigue creciendo'
+    stream = rtmp.db.session.get(rtmp.Stream, job.stream_id)
+    assert (stream.input_path, stream.output_rtmp) == ('old.mp4', 'rtmp://rerun/live')
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from conftest import make_stream, media_file, script
+
+
+def test_launch_lead_is_seeded_smoothed_and_bounded(rtmp, app_context, monkeypatch):
+    due = datetime(2030, 1, 1, 10, 0)
+    for launch_ms in (400, 600):
+        rtmp.db.session.add(rtmp.BroadcastRun(stream_id=1, node='n', profile='copy', due_at=due, launch_ms=launch_ms))
+    rtmp.db.session.commit()
+    leads = rtmp.LaunchLeadEstimator(initial=1.0, alpha=0.5)
+
+    assert leads.get('copy') == 0.5, 'se siembra con las últimas ejecuciones'
+    assert leads.get('transcode') == 1.0
+    leads.update('copy', 1.5)
+    assert leads.get('copy') == 1.0
+    leads.update('transcode', 40)
+    monkeypatch.setitem(rtmp.app.config, 'PREROLL_SECONDS', 15)
+    assert leads.get('transcode') == 15, 'nunca antes que el pre-roll'
+
+
+def test_preroll_launches_ahead_of_due_time(rtmp, app_context, monkeypatch):
+    path = script('quick-ffmpeg', """
+        import sys
+        print('Output #0, flv', file=sys.stderr, flush=True)
+        print('out_time_us=1000000', 'progress=end', sep='\\n', flush=True)
+    """)
+    checked = []
+    monkeypatch.setattr(rtmp, 'build_broadcast_command', lambda streams, input_path, offset=0, threads=None: [path])
+    monkeypatch.setattr(rtmp, 'check_rtmp_endpoint', lambda url, timeout: checked.append(url) or (12, None))
+    monkeypatch.setattr(rtmp.launch_leads, 'get', lambda profile: 0.3)
+    media_file(rtmp, 'video.mp4')
+    stream = make_stream(rtmp, next_run_at=datetime.now() + timedelta(seconds=1))
+
+    rtmp.stream_video(stream.id)
+
+    run = rtmp.BroadcastRun.query.filter_by(stream_id=stream.id).one()
+    assert checked == [stream.output_rtmp] and run.rtmp_connect_ms == 12
+    assert run.preroll_at < run.launched_at < run.due_at
+    assert 100 <= run.lead_ms <= 320
+    assert run.status == 'completed' and run.skew_ms is not None
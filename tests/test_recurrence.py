@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def occurrences(rtmp, repeat_type, rule, start, count):
+    key = rtmp.recurrence_key(start, repeat_type, rule)
+    result, after = [], start
+    for _ in range(count):
+        after = rtmp.next_for_key(key, after)
+        result.append(after)
+    return result
+
+
+def test_cron_weekdays_use_crontab_numbering(rtmp):
+    runs = occurrences(rtmp, 'cron', '*/15 9-17 * * 1-5', datetime(2026, 2, 26), 200)
+    assert {run.weekday() for run in runs} == {0, 1, 2, 3, 4}
+    assert datetime(2026, 2, 28, 9, 0) not in runs
+    assert all(9 <= run.hour <= 17 and run.minute % 15 == 0 for run in runs)
+
+
+@pytest.mark.parametrize('field, weekdays', [
+    ('0', {6}), ('7', {6}), ('0-3', {6, 0, 1, 2}), ('sat,sun', {5, 6}), ('*/2', {6, 1, 3, 5}), ('fri/1', {4, 5, 6}),
+])
+def test_cron_weekday_field_variants(rtmp, field, weekdays):
+    runs = occurrences(rtmp, 'cron', f'0 20 * * {field}', datetime(2026, 3, 1), 30)
+    assert {run.weekday() for run in runs} == weekdays
+
+
+@pytest.mark.parametrize('rule', ['0 20 * * 8', '0 20 * * 5-1', '0 20 * *', '0 20 * * mon/0'])
+def test_invalid_cron_rules_are_rejected(rtmp, rule):
+    with pytest.raises(ValueError):
+        rtmp.parse_recurrence_rule('cron', rule)
+
+
+def test_weekdays_rule_and_fixed_periods(rtmp):
+    start = datetime(2026, 3, 2, 20, 0)  # lunes
+    assert [run.weekday() for run in occurrences(rtmp, 'weekdays', '0,4', start, 4)] == [4, 0, 4, 0]
+    hourly = occurrences(rtmp, 'hourly', '6', start, 3)
+    assert [run - start for run in hourly] == [timedelta(hours=6), timedelta(hours=12), timedelta(hours=18)]
+    monthly = occurrences(rtmp, 'monthly', None, datetime(2026, 1, 31, 8, 0), 3)
+    assert [run.day for run in monthly] == [28, 31, 30]
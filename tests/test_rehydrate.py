@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import make_stream
+
+
+@pytest.fixture
+def scheduler(rtmp, app_context):
+    """El almacén de trabajos no es parte de las tablas de la app: se vacía en cada prueba"""
+    rtmp.scheduler.remove_all_jobs()
+    yield rtmp.scheduler
+    rtmp.scheduler.remove_all_jobs()
+
+
+def job_time(scheduler, stream_id):
+    job = scheduler.get_job(f'stream_{stream_id}')
+    return job.next_run_time.replace(tzinfo=None) if job else None
+
+
+def test_rehydrate_reconciles_jobs(rtmp, scheduler, capsys):
+    now = datetime.now().replace(microsecond=0)
+    upcoming = make_stream(rtmp, name='upcoming', scheduled_time=now + timedelta(hours=1))
+    series = make_stream(
+        rtmp, name='series', repeat_type='daily',
+        scheduled_time=now.replace(hour=3, minute=0, second=0) - timedelta(days=5),
+        next_run_at=now - timedelta(days=2)
+    )
+    ended = make_stream(
+        rtmp, name='ended', repeat_type='cron', recurrence_rule='0 0 30 2 *',
+        scheduled_time=now - timedelta(days=10), next_run_at=now - timedelta(days=2)
+    )
+    missed = make_stream(rtmp, name='missed', scheduled_time=now - timedelta(days=1))
+    scheduler.add_job(rtmp.enqueue_broadcast, 'date', run_date=now + timedelta(days=1), id='stream_999', args=[999])
+
+    rtmp.rehydrate_schedule()
+
+    assert job_time(scheduler, upcoming.id) == rtmp.preroll_run_date(upcoming.scheduled_time)
+    rtmp.db.session.expire_all()
+    assert series.next_run_at > now
+    assert job_time(scheduler, series.id) == rtmp.preroll_run_date(series.next_run_at)
+    for stream in (ended, missed):
+        assert (stream.status, stream.is_active, stream.next_run_at) == ('expired', False, None)
+        assert scheduler.get_job(f'stream_{stream.id}') is None
+    assert scheduler.get_job('stream_999') is None
+    assert scheduler.get_job(f'stream_{upcoming.id}').misfire_grace_time == rtmp.get_misfire_grace('once')
+
+    capsys.readouterr()
+    rtmp.rehydrate_schedule()
+    assert '0 trabajos escritos' in capsys.readouterr().out
+
+
+def test_rehydrate_closes_broadcasts_of_a_crashed_runner(rtmp, scheduler):
+    now = datetime.now().replace(microsecond=0)
+    waiting = make_stream(rtmp, name='waiting', status='queued', scheduled_time=now + timedelta(minutes=5))
+    single = make_stream(rtmp, name='single', status='streaming', scheduled_time=now - timedelta(minutes=10))
+    series = make_stream(
+        rtmp, name='series', status='streaming', repeat_type='daily', scheduled_time=now - timedelta(minutes=10)
+    )
+    rtmp.db.session.add(rtmp.BroadcastRun(stream_id=single.id, due_at=single.scheduled_time, status='on_air'))
+    rtmp.db.session.commit()
+
+    rtmp.rehydrate_schedule()
+
+    rtmp.db.session.expire_all()
+    assert waiting.status == 'pending'
+    assert scheduler.get_job(f'stream_{waiting.id}').func_ref == 'app:enqueue_broadcast'
+    assert (single.status, scheduler.get_job(f'stream_{single.id}')) == ('error', None)
+    run = rtmp.BroadcastRun.query.filter_by(stream_id=single.id).one()
+    assert run.status == 'error' and run.ended_at is not None
+    assert series.status == 'pending'
+    assert series.next_run_at == series.scheduled_time + timedelta(days=1)
+    assert job_time(scheduler, series.id) == rtmp.preroll_run_date(series.next_run_at)
@@ -0,0 +1,104 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import make_stream, media_file, script
+from test_broadcast_executor import wait_until
+
+
+@pytest.fixture
+def fake_ffmpeg(rtmp, monkeypatch):
+    """ffmpeg de mentira: sale al aire e informa progreso hasta que lo terminan"""
+    path = script('fake-ffmpeg', """
+        import sys, time
+        print('Output #0, flv', file=sys.stderr, flush=True)
+        while True:
+            print('out_time_us=1000000', flush=True)
+            print('progress=continue', flush=True)
+            time.sleep(0.05)
+    """)
+    launches = []
+
+    def build_broadcast_command(streams, input_path, offset=0, threads=None):
+        launches.append([stream.id for stream in streams])
+        return [path]
+
+    monkeypatch.setattr(rtmp, 'build_broadcast_command', build_broadcast_command)
+    monkeypatch.setattr(rtmp, 'schedule_stream', lambda stream: None)
+    return launches
+
+
+def start_broadcast(rtmp, stream_id):
+    def run():
+        rtmp.stream_video(stream_id)
+        with rtmp.app.app_context():
+            rtmp.db.session.remove()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def on_air(rtmp, stream_id):
+    progress = rtmp.get_broadcast_progress(stream_id)
+    return progress is not None and progress.process is not None and progress.returncode is None and progress.latest()
+
+
+def run_status(rtmp, stream_id):
+    rtmp.db.session.expire_all()
+    return rtmp.db.session.execute(
+        rtmp.db.select(rtmp.BroadcastRun.status).where(rtmp.BroadcastRun.stream_id == stream_id)
+    ).scalar_one()
+
+
+def test_cancel_stops_live_broadcast(rtmp, app_context, fake_ffmpeg):
+    media_file(rtmp, 'video.mp4')
+    stream_id = make_stream(rtmp, next_run_at=datetime.now() - timedelta(seconds=1)).id
+    thread = start_broadcast(rtmp, stream_id)
+    assert wait_until(lambda: on_air(rtmp, stream_id))
+    process = rtmp.get_broadcast_progress(stream_id).process
+
+    assert rtmp.send_runner_command({'cmd': 'cancel', 'stream_id': stream_id}) == {'ok': True}
+    thread.join(5)
+    assert not thread.is_alive()
+    assert process.returncode is not None
+    assert fake_ffmpeg == [[stream_id], [stream_id]], 'una cancelación no se reintenta'
+    assert run_status(rtmp, stream_id) == 'cancelled'
+    assert rtmp.db.session.get(rtmp.Stream, stream_id).status == 'pending'
+
+
+def test_delete_during_broadcast(rtmp, client, app_context, fake_ffmpeg, capsys):
+    media_file(rtmp, 'video.mp4')
+    stream_id = make_stream(rtmp, next_run_at=datetime.now() - timedelta(seconds=1)).id
+    thread = start_broadcast(rtmp, stream_id)
+    assert wait_until(lambda: on_air(rtmp, stream_id))
+
+    assert client.delete(f'/delete_stream/{stream_id}').status_code == 200
+    thread.join(5)
+    assert not thread.is_alive()
+    assert 'Error crítico' not in capsys.readouterr().out
+    assert run_status(rtmp, stream_id) == 'cancelled'
+    assert rtmp.db.session.get(rtmp.Stream, stream_id) is None
+
+
+def test_cancel_tee_member_keeps_group_on_air(rtmp, app_context, fake_ffmpeg):
+    media_file(rtmp, 'video.mp4')
+    due = (datetime.now() - timedelta(seconds=1)).replace(microsecond=0)
+    leader_id = make_stream(rtmp, name='a', next_run_at=due).id
+    member_id = make_stream(rtmp, name='b', output_rtmp='rtmp://other/live', next_run_at=due).id
+    thread = start_broadcast(rtmp, leader_id)
+    assert wait_until(lambda: on_air(rtmp, leader_id))
+    assert rtmp.get_broadcast_progress(member_id) is rtmp.get_broadcast_progress(leader_id)
+    assert fake_ffmpeg[-1] == [leader_id, member_id]
+
+    rtmp.send_runner_command({'cmd': 'cancel', 'stream_id': member_id})
+    assert wait_until(lambda: fake_ffmpeg[-1] == [leader_id] and on_air(rtmp, leader_id))
+    assert wait_until(lambda: run_status(rtmp, member_id) == 'cancelled')
+    assert thread.is_alive()
+    assert run_status(rtmp, leader_id) == 'on_air'
+
+    rtmp.send_runner_command({'cmd': 'cancel', 'stream_id': leader_id})
+    thread.join(5)
+    assert not thread.is_alive()
+    assert run_status(rtmp, leader_id) == 'cancelled'
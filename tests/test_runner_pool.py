@@ -0,0 +1,37 @@
+import threading
+from datetime import datetime, timedelta
+
+from conftest import make_stream
+from test_broadcast_executor import wait_until
+
+
+def test_claim_fills_free_slots_by_priority(rtmp, app_context, monkeypatch):
+    started, release = [], threading.Event()
+
+    def fake_stream_video(stream_id, **options):
+        started.append(stream_id)
+        release.wait(5)
+
+    monkeypatch.setattr(rtmp, 'stream_video', fake_stream_video)
+    monkeypatch.setattr(rtmp, 'broadcast_executor', rtmp.BroadcastExecutor({'copy': 2, 'transcode': 0}))
+    monkeypatch.setattr(rtmp.RunnerPool, 'load', lambda self: 0.0)
+    low = make_stream(rtmp, name='low', status='queued', priority=0)
+    high = make_stream(rtmp, name='high', status='queued', priority=5)
+    middle = make_stream(rtmp, name='middle', status='queued', priority=1)
+    transcode = make_stream(rtmp, name='hd', status='queued', priority=9, video_params='-c:v libx264 -f flv')
+    # Un stream al aire cuyo runner dejó de renovar el lease se puede reclamar
+    orphan = make_stream(
+        rtmp, name='orphan', status='streaming', priority=3,
+        owner='dead:1', lease_expires_at=datetime.now() - timedelta(seconds=1)
+    )
+
+    pool = rtmp.RunnerPool('node-a')
+    try:
+        assert pool.claim() == 2
+        assert wait_until(lambda: sorted(started) == sorted([high.id, orphan.id]))
+        rtmp.db.session.expire_all()
+        assert {stream.id for stream in rtmp.Stream.query.filter_by(owner='node-a')} == {high.id, orphan.id}
+        assert (low.owner, middle.owner, transcode.owner) == (None, None, None), 'sin cupo de transcode no se reclama'
+        assert pool.claim() == 0
+    finally:
+        release.set()
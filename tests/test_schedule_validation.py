@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import make_stream, media_file
+from test_broadcast_executor import wait_until
+
+
+def test_overlap_on_same_destination_is_reported(rtmp, app_context):
+    media_file(rtmp, 'video.mp4', duration=3600)
+    make_stream(rtmp, name='first')
+    candidate = rtmp.Stream(
+        name='second', input_path='video.mp4', output_rtmp='rtmp://example/live/',
+        scheduled_time=datetime(2030, 1, 1, 10, 30), next_run_at=datetime(2030, 1, 1, 10, 30),
+        repeat_type='once', is_active=True
+    )
+    problems, rejected = rtmp.validate_schedule(candidate)
+    assert [problem['type'] for problem in problems] == ['overlap']
+    assert problems[0]['name'] == 'first'
+    assert not rejected
+
+    candidate.next_run_at = datetime(2030, 1, 1, 11, 0)
+    assert rtmp.validate_schedule(candidate) == ([], False)
+
+
+def test_unknown_duration_does_not_wait_for_ffprobe(rtmp, app_context, monkeypatch):
+    with open(f"{rtmp.app.config['UPLOAD_FOLDER']}/new.mp4", 'wb') as output:
+        output.write(b'x')
+    monkeypatch.setattr(rtmp.media_probes, 'wait', lambda *args: (_ for _ in ()).throw(AssertionError('wait')))
+    monkeypatch.setattr(rtmp.media_probes, 'request', lambda path: None)
+    monkeypatch.setitem(rtmp.app.config, 'SCHEDULE_CONFLICT_POLICY', 'reject')
+    candidate = rtmp.Stream(
+        name='new', input_path='new.mp4', output_rtmp='rtmp://example/live', repeat_type='once',
+        scheduled_time=datetime(2030, 1, 1), next_run_at=datetime(2030, 1, 1), is_active=True
+    )
+    problems, rejected = rtmp.validate_schedule(candidate)
+    assert [problem['type'] for problem in problems] == ['unknown_duration']
+    assert not rejected
+
+
+def pending(rtmp):
+    index = rtmp.schedule_index
+    return index.pending_full, index.pending_ids, index.pending_paths
+
+
+def test_index_survives_unrelated_commits(rtmp, app_context):
+    media_file(rtmp, 'video.mp4')
+    stream = make_stream(rtmp)
+    rtmp.schedule_index.ensure_built()
+
+    stream.status = 'streaming'
+    stream.last_played = datetime.now()
+    rtmp.db.session.commit()
+    rtmp.db.session.execute(
+        rtmp.db.update(rtmp.Stream).where(rtmp.Stream.id == stream.id)
+        .values(owner='node', lease_expires_at=datetime.now() + timedelta(seconds=30))
+    )
+    rtmp.db.session.commit()
+    assert pending(rtmp) == (False, set(), set())
+
+    stream.next_run_at = datetime(2030, 1, 2, 10, 0)
+    rtmp.db.session.commit()
+    assert pending(rtmp) == (False, {stream.id}, set())
+
+    rtmp.schedule_index.ensure_built()
+    rtmp.db.session.execute(rtmp.db.update(rtmp.Stream), [{'id': stream.id, 'next_run_at': datetime(2030, 1, 3)}])
+    rtmp.db.session.commit()
+    assert pending(rtmp) == (False, {stream.id}, set())
+
+
+def candidate(rtmp, output_rtmp='rtmp://example/live'):
+    return rtmp.Stream(
+        name='candidate', input_path='video.mp4', output_rtmp=output_rtmp, repeat_type='once',
+        scheduled_time=datetime(2030, 1, 1, 10, 30), next_run_at=datetime(2030, 1, 1, 10, 30), is_active=True
+    )
+
+
+def problem_types(rtmp, stream, exclude_id=None):
+    return [problem['type'] for problem in rtmp.validate_schedule(stream, exclude_id)[0]]
+
+
+def test_bookings_update_the_index_per_stream(rtmp, app_context, monkeypatch):
+    media_file(rtmp, 'video.mp4', duration=3600, bit_rate=2500000)
+    monkeypatch.setitem(rtmp.app.config, 'EGRESS_CAP_KBPS', 6000)
+    rtmp.schedule_index.ensure_built()
+    monkeypatch.setattr(rtmp.schedule_index, '_build', lambda: pytest.fail('reconstrucción completa'))
+
+    assert problem_types(rtmp, candidate(rtmp)) == []
+    first = make_stream(rtmp, name='first')
+    assert problem_types(rtmp, candidate(rtmp)) == ['overlap']
+    assert problem_types(rtmp, candidate(rtmp), exclude_id=first.id) == []
+    make_stream(rtmp, name='second', output_rtmp='rtmp://other/live')
+    assert problem_types(rtmp, candidate(rtmp, 'rtmp://third/live')) == ['egress']
+
+    first.is_active = False
+    rtmp.db.session.commit()
+    assert problem_types(rtmp, candidate(rtmp)) == []
+    rtmp.db.session.delete(first)
+    rtmp.db.session.commit()
+    assert problem_types(rtmp, candidate(rtmp, 'rtmp://third/live')) == []
+
+
+def test_large_change_layer_is_compacted_in_background(rtmp, app_context, monkeypatch):
+    media_file(rtmp, 'video.mp4', duration=3600)
+    rtmp.schedule_index.ensure_built()
+    monkeypatch.setattr(rtmp.schedule_index, 'COMPACT_INTERVALS', 2)
+    for hour in range(3):
+        make_stream(rtmp, name=f'stream {hour}', scheduled_time=datetime(2030, 1, 1, 10 + hour))
+        rtmp.schedule_index.ensure_built()
+
+    assert wait_until(lambda: not rtmp.schedule_index.compacting and not rtmp.schedule_index.overlay)
+    assert len(rtmp.schedule_index.stream_intervals) == 3
+    assert problem_types(rtmp, candidate(rtmp)) == ['overlap', 'overlap']
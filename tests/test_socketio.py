@@ -0,0 +1,20 @@
+import app as rtmp_app
+
+# El fixture rtmp reemplaza publish_event; aquí se prueba el original
+publish_event = rtmp_app.publish_event
+
+
+def test_only_the_leader_publishes(rtmp, monkeypatch):
+    socket_client = rtmp.socketio.test_client(rtmp.app)
+    try:
+        socket_client.get_received()
+        publish_event('streams_update', [{'stream': 'live.flv'}])
+        assert [(event['name'], event['args']) for event in socket_client.get_received()] == [
+            ('streams_update', [[{'stream': 'live.flv'}]])
+        ]
+
+        monkeypatch.setattr(rtmp.broadcast_runner, 'is_leader', False)
+        publish_event('streams_update', [{'stream': 'live.flv'}])
+        assert socket_client.get_received() == []
+    finally:
+        socket_client.disconnect()
@@ -0,0 +1,92 @@
+import os
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import WORKDIR, make_stream, upload
+from test_broadcast_executor import wait_until
+
+KB = 1024 / 1024 ** 3
+
+
+@pytest.fixture
+def cold(rtmp, monkeypatch):
+    """Almacenamiento frío en un directorio temporal, vacío en cada prueba"""
+    folder = os.path.join(WORKDIR, 'cold')
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    monkeypatch.setattr(rtmp.storage_tiers, 'cold_folder', folder)
+    monkeypatch.setitem(rtmp.app.config, 'COLD_STORAGE_FOLDER', folder)
+    return folder
+
+
+def age(rtmp, name, days):
+    when = (datetime.now() - timedelta(days=days)).timestamp()
+    path = rtmp.get_absolute_path(name)
+    os.utime(path, (when, when))
+    rtmp.file_catalog.refresh(path)
+
+
+def hot(rtmp, name):
+    return os.path.exists(rtmp.get_absolute_path(name))
+
+
+def test_evict_least_used_over_quota(rtmp, client, app_context, cold, monkeypatch):
+    first = upload(client, 'a.mp4', b'A' * 4096)
+    second = upload(client, 'b.mp4', b'A' * 4096)
+    single = upload(client, 'c.mp4', b'C' * 4096)
+    upcoming = upload(client, 'd.mp4', b'D' * 4096)
+    recent = upload(client, 'e.mp4', b'E' * 4096)
+    for name, days in ((first, 30), (second, 30), (single, 20), (upcoming, 40), (recent, 1)):
+        age(rtmp, name, days)
+    make_stream(rtmp, input_path=upcoming, next_run_at=datetime.now() + timedelta(hours=1))
+    # 16 KB en caliente (el blob compartido cuenta una vez) con cuota de 10 KB: baja hasta 9 KB
+    monkeypatch.setitem(rtmp.app.config, 'STORAGE_HOT_QUOTA_GB', 10 * KB)
+
+    rtmp.storage_tiers.evict()
+
+    assert not hot(rtmp, first) and not hot(rtmp, second) and not hot(rtmp, single)
+    assert hot(rtmp, upcoming), 'lo usa un stream próximo'
+    assert hot(rtmp, recent)
+    summary = client.get('/storage').json
+    assert summary['hot_bytes'] == 8192
+    assert summary['cold_bytes'] == 8192
+    assert sorted(row['name'] for row in summary['cold_files']) == sorted([first, second, single])
+
+
+def test_stale_files_are_evicted_and_prefetched(rtmp, client, app_context, cold, monkeypatch):
+    old = upload(client, 'old.mp4', b'O' * 4096)
+    fresh = upload(client, 'fresh.mp4', b'F' * 4096)
+    age(rtmp, old, 10)
+    monkeypatch.setitem(rtmp.app.config, 'STORAGE_COLD_AFTER_DAYS', 7)
+
+    rtmp.storage_tiers.evict()
+    assert not hot(rtmp, old) and hot(rtmp, fresh)
+    assert rtmp.storage_tiers.is_cold(old)
+
+    make_stream(rtmp, input_path=old, next_run_at=datetime.now() + timedelta(hours=2))
+    rtmp.storage_tiers.prefetch()
+    assert hot(rtmp, old)
+    assert not rtmp.storage_tiers.is_cold(old)
+    with open(rtmp.get_absolute_path(old), 'rb') as source:
+        assert source.read() == b'O' * 4096
+
+
+def test_recall_shared_blob_by_request(rtmp, client, app_context, cold, monkeypatch):
+    first = upload(client, 'a.mp4', b'A' * 4096)
+    second = upload(client, 'b.mp4', b'A' * 4096)
+    age(rtmp, first, 10)
+    age(rtmp, second, 10)
+    monkeypatch.setitem(rtmp.app.config, 'STORAGE_COLD_AFTER_DAYS', 7)
+    rtmp.storage_tiers.evict()
+    assert not hot(rtmp, first) and not hot(rtmp, second)
+
+    assert client.post('/storage/recall', json={'name': 'missing.mp4'}).status_code == 404
+    assert client.post('/storage/recall', json={'name': first}).status_code == 202
+
+    assert wait_until(lambda: hot(rtmp, first) and hot(rtmp, second))
+    assert os.stat(rtmp.get_absolute_path(first)).st_ino == os.stat(rtmp.get_absolute_path(second)).st_ino
+    rtmp.db.session.expire_all()
+    assert rtmp.ColdFile.query.count() == 0
+    assert not any(files for _, _, files in os.walk(cold))
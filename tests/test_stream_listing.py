@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from conftest import make_stream
+
+
+def walk(client, **params):
+    """Recorre todas las páginas de /api/streams y devuelve los ids en orden"""
+    ids, cursor = [], None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        response = client.get('/api/streams', query_string=query)
+        assert response.status_code == 200, response.json
+        ids += [stream['id'] for stream in response.json['streams']]
+        cursor = response.json['next_cursor']
+        if not cursor:
+            return ids
+
+
+def test_pages_follow_sort_order_with_nulls_last(rtmp, client, app_context):
+    base = datetime(2030, 1, 1, 10, 0)
+    # Horas repetidas para que el desempate por id cruce el borde de las páginas
+    times = [base + timedelta(hours=hours) for hours in (3, 1, 1, 2, 1, 5)]
+    ids = [make_stream(rtmp, name=f's{index}', next_run_at=when).id for index, when in enumerate(times)]
+    idle = [make_stream(rtmp, name=f'idle{index}', is_active=False, next_run_at=None).id for index in range(3)]
+    timed = [stream_id for _, stream_id in sorted(zip(times, ids))]
+
+    assert walk(client, limit=2) == timed + idle
+    assert walk(client, limit=2, order='desc') == timed[::-1] + idle[::-1]
+    assert walk(client, limit=4, active='false') == idle
+    assert walk(client, limit=3, sort='name') == sorted(ids + idle, key=lambda stream_id: (
+        rtmp.db.session.get(rtmp.Stream, stream_id).name, stream_id
+    ))
+
+
+def test_invalid_parameters_are_rejected(rtmp, client):
+    assert client.get('/api/streams?sort=owner').status_code == 400
+    assert client.get('/api/streams?cursor=nope').status_code == 400
+    assert client.get('/api/streams?limit=x').status_code == 400
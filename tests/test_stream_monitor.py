@@ -0,0 +1,45 @@
+import os
+
+
+def test_sampling_batches_updates_and_detects_stalls(rtmp, monkeypatch):
+    events, finished = [], []
+    monkeypatch.setattr(rtmp, 'publish_event', lambda name, data: events.append((name, data)))
+    monkeypatch.setattr(rtmp.post_record, 'submit', finished.append)
+    clock = [1000.0]
+    monkeypatch.setattr(rtmp.time, 'monotonic', lambda: clock[0])
+    monitor = rtmp.StreamMonitor(interval=3600, stall_after=10, finish_after=30)
+    monitor._started = True  # sin hilo de muestreo: la prueba llama a sample()
+    receiving = os.path.join(rtmp.app.config['UPLOAD_FOLDER'], 'receiving')
+    paths = [os.path.join(receiving, name) for name in ('a.flv', 'b.flv')]
+    try:
+        for path in paths:
+            with open(path, 'wb') as output:
+                output.write(b'x' * 1000)
+            assert monitor.track(path)
+        assert not monitor.track(paths[0]), 'una grabación activa no se registra dos veces'
+
+        clock[0] += 2
+        with open(paths[0], 'ab') as output:
+            output.write(b'x' * 25000)
+        events.clear()
+        monitor.sample()
+        assert len(events) == 1, 'un solo evento por muestreo con todas las grabaciones'
+        name, updates = events[0]
+        assert name == 'streams_update'
+        assert {update['stream']: update['bitrate_kbps'] for update in updates} == {'a.flv': 100.0, 'b.flv': 0.0}
+
+        clock[0] += 10
+        monitor.sample()
+        assert {update['stream']: update['stalled'] for update in events[-1][1]} == {'a.flv': True, 'b.flv': True}
+
+        clock[0] += 20  # b.flv no crece desde hace 32 s: terminó; a.flv vuelve a recibir datos
+        with open(paths[0], 'ab') as output:
+            output.write(b'x' * 1000)
+        monitor.sample()
+        assert finished == ['b.flv']
+        assert ('stream_ended', {'stream': 'b.flv'}) in events
+        assert list(monitor.get_active_streams()) == ['a.flv']
+        assert events[-1] == ('streams_update', [{'stream': 'a.flv', 'size': 27000, 'bitrate_kbps': 0.4, 'stalled': False}])
+    finally:
+        for path in paths:
+            os.remove(path)
@@ -0,0 +1,27 @@
+"""
+Punto de entrada WSGI para producción.
+
+Cada proceso atiende a muchos clientes de Socket.IO sobre un bucle de eventos
+(gevent por defecto, o eventlet con SOCKETIO_ASYNC_MODE=eventlet). Para usar
+varios procesos, cada uno escucha en su propio puerto detrás del upstream
+con ip_hash de nginx y todos comparten SOCKETIO_MESSAGE_QUEUE:
+
+    SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6379/0 \\
+        gunicorn -k gevent -w 1 -b 127.0.0.1:8000 wsgi:app
+
+Con RTMP_ROLE=web estos procesos no ejecutan transmisiones: el scheduler y
+ffmpeg quedan en el demonio runner.py.
+"""
+import os
+
+async_mode = os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent')
+if async_mode == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif async_mode == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+from app import app, socketio, startup  # noqa: E402
+
+startup()